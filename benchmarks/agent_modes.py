@@ -0,0 +1,81 @@
+"""Parsing failures and steps per task of the react and structured agent modes.
+
+Runs a fixed task suite with both agent modes against a running main.py and
+Ollama, and reports per mode the output parsing failure rate, agent steps,
+LLM calls and wall-clock time per task (see custom_ollama.AgentStatsCallback).
+Parsing failures depend on the model, so run it with the model you deploy.
+
+    python -m benchmarks.agent_modes --api-url http://localhost:8000
+"""
+
+import argparse
+import json
+import time
+
+import requests
+from langchain_community.utilities.requests import RequestsWrapper
+
+import custom_planner as planner
+from custom_ollama import AgentStatsCallback, CustomLLM, model_name, ollama_base_url
+from custom_spec import reduce_openapi_spec
+from custom_structured_agent import create_structured_openapi_agent
+
+TASKS = [
+    "Add a cube to the scene",
+    "Add a sphere and move it up by 2",
+    "Rotate the cube by 45 degrees around z",
+    "Add a torus and scale it by 2",
+    "What objects are in the scene?",
+    "Place the sphere at x=1, y=2, z=3 without rotation and with scale 1",
+]
+
+AGENT_MODES = {
+    "react": planner.create_openapi_agent,
+    "structured": create_structured_openapi_agent,
+}
+
+
+def run_mode(mode, spec, tasks, llm_kwargs):
+    llm = CustomLLM(model=model_name, **llm_kwargs)
+    agent = AGENT_MODES[mode](
+        reduce_openapi_spec(spec),
+        RequestsWrapper(headers={}),
+        llm,
+        verbose=False,
+        agent_executor_kwargs={"handle_parsing_errors": True, "max_iterations": 10},
+    )
+    llm.warm_up()
+    stats = AgentStatsCallback()
+    start = time.perf_counter()
+    for task in tasks:
+        try:
+            agent.invoke({"input": task}, {"callbacks": [stats]})
+        except Exception as e:
+            print(f"{mode}: {task!r} failed: {e}")
+    seconds = time.perf_counter() - start
+    return {
+        "agent_mode": mode,
+        **stats.summary(),
+        "seconds_per_task": round(seconds / max(len(tasks), 1), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--ollama-url", default=ollama_base_url)
+    parser.add_argument("--mode", action="append", choices=list(AGENT_MODES))
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    spec = requests.get(f"{args.api_url}/openapi.json", timeout=10).json()
+    spec["servers"] = [{"url": args.api_url}]
+    report = [
+        run_mode(mode, spec, TASKS, {"base_url": args.ollama_url})
+        for mode in args.mode or list(AGENT_MODES)
+    ]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
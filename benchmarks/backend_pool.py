@@ -0,0 +1,188 @@
+"""Throughput and errors of concurrent LLM calls over a custom_backends.BackendPool.
+
+Sends --requests LLM calls from --clients threads, each with a distinct
+prompt of --prompt-tokens tokens, to stub Ollama servers
+(benchmarks.stub_ollama), which evaluate one prompt at a time like an Ollama
+server without OLLAMA_NUM_PARALLEL. Scenarios:
+
+- direct: one server without a pool, a new connection per request, as before,
+- pool_N: a pool of N servers, for every N of --backends,
+- uneven: a pool of two servers, one --slow-speed times slower, to show
+  requests going to the shorter queue,
+- openai: a pool of an Ollama server and an OpenAI-compatible one,
+- failover_unavailable: a pool of two servers, one answering 503 from the
+  middle of the run on,
+- failover_stalled: the same with one server hanging for longer than the
+  request timeout, --timeout.
+
+The report gives requests per second, p50 and p95 latency, errors and how
+the requests were spread over the backends.
+
+    python -m benchmarks.backend_pool --clients 16 --requests 200
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.replay import get_commit
+from benchmarks.stub_ollama import StubOllama
+from custom_backends import Backend, BackendPool
+from custom_ollama import CustomLLM, model_name
+
+WORDS = ["cube", "sphere", "move", "rotate", "scale", "light", "camera", "scene"]
+
+
+def make_prompt(number: int, tokens: int) -> str:
+    # Distinct from the first word on, so no prompt cache helps. The stub
+    # counts words and the spaces between them as tokens.
+    words = [WORDS[(number + i) % len(WORDS)] for i in range(tokens // 2 - 1)]
+    return " ".join([str(number), *words])
+
+
+def run_scenario(
+    name: str,
+    stubs: List[StubOllama],
+    backends: Optional[List[Backend]],
+    clients: int,
+    requests: int,
+    prompt_tokens: int,
+    timeout: Optional[float],
+    fault: Optional[str] = None,
+) -> Dict[str, Any]:
+    pool = BackendPool(backends, retry_after=1.0) if backends else None
+    llm = CustomLLM(
+        model=model_name, base_url=stubs[0].url, backend_pool=pool, timeout=timeout
+    )
+    seconds: List[float] = []
+    errors: List[str] = []
+    done = threading.Lock()
+
+    def call(number: int) -> None:
+        if fault and number == requests // 2:
+            if fault == "unavailable":
+                stubs[0].unavailable = True
+            else:
+                stubs[0].stall_seconds = timeout * 2
+        start = time.perf_counter()
+        try:
+            llm.invoke(make_prompt(number, prompt_tokens))
+        except Exception as e:
+            with done:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        with done:
+            seconds.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    for stub in stubs:
+        stub.unavailable, stub.stall_seconds = False, 0.0
+    result = {
+        "scenario": name,
+        "requests_per_second": round(len(seconds) / elapsed, 2),
+        "p50_ms": round(statistics.median(seconds) * 1000, 1) if seconds else None,
+        "p95_ms": (
+            round(sorted(seconds)[int(len(seconds) * 0.95)] * 1000, 1)
+            if seconds
+            else None
+        ),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+    if pool is not None:
+        result["backends"] = [
+            {key: backend[key] for key in ("kind", "requests", "failures")}
+            for backend in pool.summary()
+        ]
+    return result
+
+
+def run(
+    backend_counts, clients, requests, prompt_tokens, slow_speed, timeout, stub_kwargs
+):
+    stubs = [
+        StubOllama(load_seconds=0, **stub_kwargs).start()
+        for _ in range(max(2, *backend_counts))
+    ]
+    slow = StubOllama(
+        load_seconds=0, model_speeds={model_name: slow_speed}, **stub_kwargs
+    ).start()
+    args = (clients, requests, prompt_tokens, timeout)
+    try:
+        results = [run_scenario("direct", stubs[:1], None, *args)]
+        for count in backend_counts:
+            backends = [Backend(stub.url) for stub in stubs[:count]]
+            results.append(run_scenario(f"pool_{count}", stubs, backends, *args))
+        results.append(
+            run_scenario(
+                "uneven",
+                [stubs[0], slow],
+                [Backend(stubs[0].url), Backend(slow.url)],
+                *args,
+            )
+        )
+        results.append(
+            run_scenario(
+                "openai",
+                stubs[:2],
+                [Backend(stubs[0].url), Backend(stubs[1].url, kind="openai")],
+                *args,
+            )
+        )
+        for fault in ("unavailable", "stalled"):
+            backends = [Backend(stub.url) for stub in stubs[:2]]
+            results.append(
+                run_scenario(f"failover_{fault}", stubs[:2], backends, *args, fault)
+            )
+    finally:
+        for stub in [*stubs, slow]:
+            stub.stop()
+    return {
+        "commit": get_commit(),
+        "clients": clients,
+        "requests": requests,
+        "prompt_tokens": prompt_tokens,
+        "stub": stub_kwargs,
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", type=int, action="append")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--prompt-tokens", type=int, default=400)
+    parser.add_argument("--slow-speed", type=float, default=3.0)
+    parser.add_argument(
+        "--timeout", type=float, default=5.0, help="Seconds to the response"
+    )
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.backends or [1, 2, 4],
+        args.clients,
+        args.requests,
+        args.prompt_tokens,
+        args.slow_speed,
+        args.timeout,
+        {
+            "token_seconds": args.token_seconds,
+            "prompt_token_seconds": args.prompt_token_seconds,
+        },
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
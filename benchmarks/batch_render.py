@@ -0,0 +1,150 @@
+"""Speedup of POST /render_batch's worker processes over rendering sequentially.
+
+Serves main.py in-process (benchmarks.blender_api, with benchmarks.fake_bpy
+if bpy is not installed, which the workers then use too), builds a batch of
+--views camera views around the scene times --frames frames and times:
+
+- sequential: every job of the batch rendered one after the other in
+  main.py's process, as repeated POST /render_scene calls would;
+- for every --workers count, POST /render_batch with a custom_batch_render
+  RenderPool of that many workers: the first batch (cold: workers start and
+  open the snapshot) and the p50 of the following ones, with the speedup of
+  the latter over sequential.
+
+Each worker renders with its share of the CPU threads, so with Blender the
+speedup comes from overlapping the parts of a render that do not use all
+threads (scene sync, compositing, writing the file). fake_bpy renders and
+encodes on one thread, so there it grows with the worker count up to the
+number of CPUs, which the report includes.
+
+    python -m benchmarks.batch_render --workers 1 --workers 2 --workers 4
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks import fake_bpy
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.replay import get_commit
+from custom_batch_render import RenderPool, render_job
+
+
+def get_views(count: int) -> List[Dict[str, Any]]:
+    """count views on a circle around the origin, looking at it."""
+    views = []
+    for index in range(count):
+        angle = 2 * math.pi * index / count
+        views.append(
+            {
+                "location": {
+                    "x": 10 * math.sin(angle),
+                    "y": -10 * math.cos(angle),
+                    "z": 4,
+                },
+                "rotation": {"x": 70, "y": 0, "z": math.degrees(angle)},
+            }
+        )
+    return views
+
+
+def render_sequentially(api: BlenderAPI, batch: Dict[str, Any]) -> float:
+    main = api.main
+    with tempfile.TemporaryDirectory() as directory:
+        jobs = main.get_batch_jobs(main.BatchRender(**batch), Path(directory))
+        start = time.perf_counter()
+        for _, job in jobs:
+            render_job(None, job)
+        return time.perf_counter() - start
+
+
+def render_batch(api: BlenderAPI, batch: Dict[str, Any]) -> float:
+    start = time.perf_counter()
+    response = requests.post(f"{api.url}/render_batch", json=batch, timeout=600)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run(
+    worker_counts: List[int],
+    views: int,
+    frames: int,
+    resolution_percentage: int,
+    repeats: int,
+) -> Dict[str, Any]:
+    batch = {"views": get_views(views), "frame_start": 1, "frame_end": frames}
+    results = []
+    with BlenderAPI() as api:
+        import bpy
+
+        api.reset()
+        api.populate(10)
+        bpy.context.scene.render.resolution_percentage = resolution_percentage
+        sequential = statistics.median(
+            render_sequentially(api, batch) for _ in range(repeats)
+        )
+        print(json.dumps({"sequential_s": round(sequential, 3)}), file=sys.stderr)
+        for workers in worker_counts:
+            pool = RenderPool(workers, initializer=fake_bpy.install)
+            api.main.render_pool = pool
+            try:
+                cold = render_batch(api, batch)
+                seconds = statistics.median(
+                    render_batch(api, batch) for _ in range(repeats)
+                )
+            finally:
+                pool.close()
+            result = {
+                "workers": workers,
+                "threads_per_worker": pool.threads,
+                "cold_s": round(cold, 3),
+                "p50_s": round(seconds, 3),
+                "speedup": round(sequential / seconds, 2),
+            }
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return {
+        "commit": get_commit(),
+        "fake_bpy": api.fake_bpy,
+        "cpu_count": os.cpu_count(),
+        "images": views * frames,
+        "resolution_percentage": resolution_percentage,
+        "repeats": repeats,
+        "sequential_s": round(sequential, 3),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers", type=int, action="append", help="Default: 1, 2 and 4"
+    )
+    parser.add_argument("--views", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--resolution-percentage", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.workers or [1, 2, 4],
+        args.views,
+        args.frames,
+        args.resolution_percentage,
+        args.repeats,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,139 @@
+"""main.py served in-process, with the real bpy or benchmarks.fake_bpy.
+
+Used by the benchmarks that need main.py's API but neither Blender nor a
+separately started server:
+
+    with BlenderAPI() as api:
+        requests.post(f"{api.url}/add_cube")
+"""
+
+import argparse
+import importlib
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import uvicorn
+
+from benchmarks import fake_bpy
+from custom_tracing import JSONLExporter
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BlenderAPI:
+    """Runs main.app with uvicorn in a thread, use as a context manager.
+
+    main.py is imported with the real bpy when it can be imported and with
+    benchmarks.fake_bpy otherwise; fake_bpy tells which one is used. main.py's
+    spans are kept in memory but not written to TRACE_DIR.
+    """
+
+    def __init__(self, port: Optional[int] = None):
+        self.fake_bpy = fake_bpy.install()
+        self.main = importlib.import_module("main")
+        self.main.tracer.exporters = [
+            exporter
+            for exporter in self.main.tracer.exporters
+            if not isinstance(exporter, JSONLExporter)
+        ]
+        self.port = port or get_free_port()
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                self.main.app, host="127.0.0.1", port=self.port, log_level="warning"
+            )
+        )
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        """The OpenAPI spec of main.py, with this server as its server url."""
+        return {**self.main.app.openapi(), "servers": [{"url": self.url}]}
+
+    def reset(self) -> None:
+        """Empty the scene, like main.py does on startup (fake bpy only)."""
+        if self.fake_bpy:
+            fake_bpy.reset()
+            fake_bpy.data.objects.remove(fake_bpy.data.objects["Cube"])
+            self.main.mark_scene_changed()
+
+    def populate(self, count: int, seed: int = 0) -> None:
+        """Add count cubes (Cube, Cube.001, ...) directly, not through the API.
+
+        The cubes are spread over a volume that grows with count; the first
+        one becomes the active object if there is none.
+        """
+        import bpy
+
+        rng = random.Random(seed)
+        extent = max(10.0, 2 * count ** (1 / 3))
+        mesh = None if self.fake_bpy else bpy.data.meshes.new("Cube")
+        for _ in range(count):
+            if self.fake_bpy:
+                obj = bpy.data.objects.new("Cube")
+            else:
+                obj = bpy.data.objects.new("Cube", mesh)
+                bpy.context.scene.collection.objects.link(obj)
+            obj.location = tuple(rng.uniform(-extent, extent) for _ in range(3))
+            if bpy.context.view_layer.objects.active is None:
+                bpy.context.view_layer.objects.active = obj
+        self.main.mark_scene_changed()
+
+    def start(self) -> "BlenderAPI":
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError(f"main.py did not start on port {self.port}")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "BlenderAPI":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve main.py with a scene of the given number of cubes."
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--objects", type=int, default=0)
+    parser.add_argument(
+        "--no-scene-cache",
+        action="store_true",
+        help="Build every /scene_graph response, as before main.scene_cache",
+    )
+    parser.add_argument(
+        "--resolution-percentage",
+        type=int,
+        help="Render at this percentage of the scene's resolution",
+    )
+    args = parser.parse_args()
+
+    api = BlenderAPI(args.port)
+    api.main.scene_cache.enabled = not args.no_scene_cache
+    api.reset()
+    api.populate(args.objects)
+    if args.resolution_percentage:
+        import bpy
+
+        bpy.context.scene.render.resolution_percentage = args.resolution_percentage
+    api.server.run()
@@ -0,0 +1,151 @@
+"""Time to compute world-space bounding boxes and dimensions, bulk vs. per object.
+
+For every scene size, populates main.py's scene (benchmarks.blender_api, with
+benchmarks.fake_bpy if bpy is not installed) with that many cubes at random
+rotations and scales, and times computing the bounds of every object:
+
+- loop: a Python loop reading matrix_world and bound_box of each object and
+  transforming its 8 corners, as main.py did before custom_bounds;
+- bulk: custom_bounds.BoundsCache from cold, reading bpy.data.objects with
+  foreach_get and transforming all corners with NumPy at once;
+- bulk_per_object_reads: the same with the objects read one by one, the
+  path of collections without foreach_get;
+- cached: the cache after main.mark_scene_changed names one object, the
+  cost of GET /scene_graph?fields=bounds after a mutation.
+
+compute_loop and compute_numpy time the arithmetic alone on matrices and
+corners read beforehand. fake_bpy computes matrix_world in Python on every
+read, which Blender reads from memory, so there the reads dominate loop and
+bulk alike. max_difference compares the loop's results with the bulk's.
+
+    python -m benchmarks.bounds --scene-size 1000 --scene-size 10000
+"""
+
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.replay import get_commit
+from custom_bounds import GEOMETRY_TYPES, BoundsCache, compute_bounds, read_objects
+
+
+def get_p50_ms(function: Callable[[], Any], repeats: int) -> float:
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return round(statistics.median(seconds) * 1000, 4)
+
+
+def get_bounds(matrix, corners, has_geometry: bool) -> List[List[float]]:
+    """Min, max and dimensions of one object, in plain Python."""
+    rows = [tuple(matrix[i]) for i in range(3)]
+    corners = [tuple(corner) for corner in corners] if has_geometry else [(0, 0, 0)]
+    points = [
+        [row[0] * x + row[1] * y + row[2] * z + row[3] for row in rows]
+        for x, y, z in corners
+    ]
+    scale = [math.sqrt(sum(rows[j][i] ** 2 for j in range(3))) for i in range(3)]
+    return [
+        [min(point[i] for point in points) for i in range(3)],
+        [max(point[i] for point in points) for i in range(3)],
+        [
+            (max(c[i] for c in corners) - min(c[i] for c in corners)) * scale[i]
+            for i in range(3)
+        ],
+    ]
+
+
+def loop(objects) -> List[List[List[float]]]:
+    return [
+        get_bounds(obj.matrix_world, obj.bound_box, obj.type in GEOMETRY_TYPES)
+        for obj in objects
+    ]
+
+
+def run_scene(api: BlenderAPI, objects: int, repeats: int, seed: int) -> Dict:
+    import bpy
+
+    api.reset()
+    api.populate(objects, seed)
+    rng = random.Random(seed)
+    for obj in bpy.data.objects:
+        obj.rotation_euler = tuple(rng.uniform(-math.pi, math.pi) for _ in range(3))
+        obj.scale = tuple(rng.uniform(0.5, 2.0) for _ in range(3))
+    items = list(bpy.data.objects)
+    has_geometry = np.array([obj.type in GEOMETRY_TYPES for obj in items])
+    matrices, corners = read_objects(items)
+    rows, local_corners = matrices.tolist(), corners.tolist()
+
+    bulk = BoundsCache().get(bpy.data.objects)
+    difference = float(np.abs(np.array(loop(items)) - np.array(bulk)).max())
+
+    cache = BoundsCache()
+    cache.get(bpy.data.objects)
+
+    def cached():
+        cache.invalidate([items[0].name])
+        cache.get(bpy.data.objects)
+
+    return {
+        "scene_objects": len(items),
+        "loop_ms": get_p50_ms(lambda: loop(bpy.data.objects), repeats),
+        "bulk_ms": get_p50_ms(lambda: BoundsCache().get(bpy.data.objects), repeats),
+        "bulk_per_object_reads_ms": get_p50_ms(
+            lambda: BoundsCache().get(items), repeats
+        ),
+        "cached_ms": get_p50_ms(cached, repeats),
+        "compute_loop_ms": get_p50_ms(
+            lambda: [
+                get_bounds(matrix, corner, geometry)
+                for matrix, corner, geometry in zip(rows, local_corners, has_geometry)
+            ],
+            repeats,
+        ),
+        "compute_numpy_ms": get_p50_ms(
+            lambda: compute_bounds(matrices, corners, has_geometry), repeats
+        ),
+        "max_difference": difference,
+    }
+
+
+def run(scene_sizes: List[int], repeats: int, seed: int) -> Dict[str, Any]:
+    api = BlenderAPI()
+    results = []
+    for objects in scene_sizes:
+        result = run_scene(api, objects, repeats, seed)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+    return {
+        "commit": get_commit(),
+        "fake_bpy": api.fake_bpy,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scene-size", type=int, action="append", help="Default: 100, 1000, 10000"
+    )
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.scene_size or [100, 1000, 10000], args.repeats, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
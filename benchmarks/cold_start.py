@@ -0,0 +1,83 @@
+"""Cold-start and first-request latency of the language server.
+
+Runs langserver's app in-process against benchmarks.stub_ollama (with the
+model missing, so it is pulled) and an OpenAPI spec file, and reports how
+long startup blocks, when /ready turns 200, and the latency of the first
+/api_interaction/invoke, with and without the model warm-up.
+
+    python -m benchmarks.cold_start --spec openapi.json
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import langserver
+from benchmarks.stub_ollama import StubOllama
+from custom_spec import save_cached_spec
+
+
+def run_variant(spec, warm_up, load_seconds, pull_seconds, ready_timeout):
+    with StubOllama(
+        models=[], load_seconds=load_seconds, pull_seconds=pull_seconds
+    ) as stub, tempfile.TemporaryDirectory() as directory:
+        cache_path = Path(directory) / "openapi_cache.json"
+        save_cached_spec(cache_path, spec)
+        langserver.ollama_base_url = stub.url
+        langserver.spec_cache_path = cache_path
+        langserver.warm_up_enabled = warm_up
+        langserver.agent_proxy.agent = None
+        langserver.startup_status.clear()
+        langserver.startup_status["model"] = "pending"
+
+        start = time.perf_counter()
+        with TestClient(langserver.app) as client:
+            startup_seconds = time.perf_counter() - start
+            while client.get("/ready").status_code != 200:
+                if time.perf_counter() - start > ready_timeout:
+                    raise TimeoutError(client.get("/ready").json())
+                time.sleep(0.05)
+            ready_seconds = time.perf_counter() - start
+
+            request_start = time.perf_counter()
+            response = client.post(
+                "/api_interaction/invoke",
+                json={"input": {"input": "Add a cube to the scene"}},
+            )
+            first_request_seconds = time.perf_counter() - request_start
+
+        return {
+            "warm_up": warm_up,
+            "startup_s": round(startup_seconds, 3),
+            "ready_s": round(ready_seconds, 3),
+            "first_request_s": round(first_request_seconds, 3),
+            "first_request_status": response.status_code,
+            "model_loads": stub.stats["loads"],
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spec", required=True, help="OpenAPI spec of main.py")
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--pull-seconds", type=float, default=5.0)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    spec = json.loads(Path(args.spec).read_text())
+    report = [
+        run_variant(
+            spec, warm_up, args.load_seconds, args.pull_seconds, args.ready_timeout
+        )
+        for warm_up in (False, True)
+    ]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,210 @@
+"""Planner prompt tokens and latency by API size, with and without retrieval.
+
+main.py's endpoints are padded with generated endpoints of the same style
+(POST /add_cone, POST /set_object_roughness, GET /object_roughness, ...) to
+--endpoint-count endpoints. For every size, the planner tool plans the
+queries of benchmarks.plan_execution with every endpoint in its prompt and
+with the top-k endpoints retrieved by custom_retrieval.EndpointIndex. The
+report gives the planner's prompt tokens, the tokens Ollama evaluated and
+the latency per query, the recall of the retrieval (whether the endpoints
+of the recorded plan were retrieved) and how often it fell back to the full
+list.
+
+Runs against benchmarks.stub_ollama answering with the recorded plans. As in
+the agent, an orchestrator prompt is evaluated before every planner call, so
+with one cache slot (--slots) the planner prompt is never cached.
+
+    python -m benchmarks.endpoint_retrieval --endpoint-count 11 --endpoint-count 200
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec
+
+import custom_planner as planner
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.plan_execution import PLANS, scripted_completion
+from benchmarks.replay import get_commit
+from benchmarks.stub_ollama import StubOllama
+from custom_ollama import CustomLLM, model_name
+from custom_planner_prompt import API_ORCHESTRATOR_PROMPT
+from custom_retrieval import MIN_ENDPOINTS, TOP_K, EndpointIndex, get_plan_endpoints
+from custom_response import estimate_tokens
+from custom_spec import reduce_openapi_spec
+
+PRIMITIVES = [
+    "cone", "plane", "monkey", "ico_sphere", "grid", "circle", "text", "empty",
+    "light", "camera", "curve", "metaball", "armature", "lattice", "speaker",
+]  # fmt: skip
+PROPERTIES = [
+    "material", "color", "roughness", "metallic", "emission", "visibility",
+    "parent", "origin", "smooth_shading", "subdivision", "bevel", "modifier",
+    "keyframe", "constraint", "collection", "texture", "uv_map", "vertex_group",
+    "shape_key", "dimensions", "wireframe", "mirror", "array", "solidify",
+]  # fmt: skip
+OBJECT_ARGS = "Args:\n    name (str): The name of the object."
+RESULT = (
+    "Returns:\n    OperationResult: The result of the operation, including a "
+    "message, the active object, and the scene graph."
+)
+
+
+def make_endpoints(count: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """count endpoints in the style of main.py's, without its own."""
+    endpoints = []
+    for primitive in PRIMITIVES:
+        words = primitive.replace("_", " ")
+        endpoints.append(
+            (
+                f"POST /add_{primitive}",
+                f"Adds a {words} to the Blender scene.\n\n{RESULT}",
+            )
+        )
+    templates = [
+        ("POST /set_object_{}", "Set the {} of an object"),
+        ("GET /object_{}", "Retrieves the {} of an object."),
+        ("POST /remove_object_{}", "Removes the {} from an object."),
+        ("POST /copy_object_{}", "Copies the {} of an object to the selected objects."),
+    ]
+    for path, summary in templates:
+        for prop in PROPERTIES:
+            words = prop.replace("_", " ")
+            description = f"{summary.format(words)}\n\n{OBJECT_ARGS}\n\n{RESULT}"
+            endpoints.append((path.format(prop), description))
+    copies = list(endpoints)
+    while len(endpoints) < count:
+        suffix = len(endpoints) // len(copies) + 1
+        endpoints += [(f"{name}_{suffix}", description) for name, description in copies]
+    return [(name, description, {}) for name, description in endpoints[:count]]
+
+
+def make_spec(base: ReducedOpenAPISpec, count: int) -> ReducedOpenAPISpec:
+    padding = make_endpoints(max(count - len(base.endpoints), 0))
+    return ReducedOpenAPISpec(
+        servers=base.servers,
+        description=base.description,
+        endpoints=list(base.endpoints) + padding,
+    )
+
+
+def plan_queries(spec, stub, retrieval: bool) -> List[Dict[str, Any]]:
+    llm = CustomLLM(model=model_name, base_url=stub.url)
+    tool = planner._create_api_planner_tool(
+        spec, llm, endpoint_top_k=TOP_K if retrieval else None
+    )
+    results = []
+    for query in PLANS:
+        # The orchestrator's call before the planner's, as in the agent.
+        llm.invoke(API_ORCHESTRATOR_PROMPT[:2000])
+        prompt_tokens = stub.stats["prompt_tokens"]
+        cached_tokens = stub.stats["cached_tokens"]
+        requests = stub.stats["requests"]
+        start = time.perf_counter()
+        tool.run(query)
+        results.append(
+            {
+                "query": query,
+                "seconds": round(time.perf_counter() - start, 3),
+                "planner_calls": stub.stats["requests"] - requests,
+                "prompt_tokens": stub.stats["prompt_tokens"] - prompt_tokens,
+                "evaluated_tokens": (stub.stats["prompt_tokens"] - prompt_tokens)
+                - (stub.stats["cached_tokens"] - cached_tokens),
+            }
+        )
+    return results
+
+
+def get_recall(spec: ReducedOpenAPISpec) -> Dict[str, Any]:
+    start = time.perf_counter()
+    index = EndpointIndex(spec.endpoints)
+    index_seconds = time.perf_counter() - start
+    hits, fallbacks, retrieved, seconds = 0, 0, 0, 0.0
+    for query, plan in PLANS.items():
+        start = time.perf_counter()
+        names = index.retrieve(query)
+        seconds += time.perf_counter() - start
+        if names is None:
+            fallbacks += 1
+            continue
+        retrieved += len(names)
+        hits += all(endpoint in names for endpoint in get_plan_endpoints(plan))
+    return {
+        "index_ms": round(index_seconds * 1000, 3),
+        "retrieve_ms": round(seconds * 1000 / len(PLANS), 3),
+        "recall": round(hits / len(PLANS), 3),
+        "fallbacks": fallbacks,
+        "endpoints_per_query": round(retrieved / max(len(PLANS) - fallbacks, 1), 2),
+    }
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        key: round(sum(result[key] for result in results) / len(results), 3)
+        for key in ("seconds", "planner_calls", "prompt_tokens", "evaluated_tokens")
+    }
+
+
+def run(counts, slots, prompt_token_seconds, token_seconds):
+    base = reduce_openapi_spec(BlenderAPI().spec)
+    results = []
+    with StubOllama(
+        completion=scripted_completion,
+        load_seconds=0,
+        slots=slots,
+        prompt_token_seconds=prompt_token_seconds,
+        token_seconds=token_seconds,
+    ) as stub:
+        for count in counts:
+            spec = make_spec(base, count)
+            full = plan_queries(spec, stub, retrieval=False)
+            retrieved = plan_queries(spec, stub, retrieval=True)
+            results.append(
+                {
+                    "endpoints": len(spec.endpoints),
+                    "retrieval": len(spec.endpoints) >= MIN_ENDPOINTS,
+                    "endpoint_list_tokens": estimate_tokens(
+                        planner._format_endpoints(spec)
+                    ),
+                    "full": summarize(full),
+                    "retrieved": summarize(retrieved),
+                    **get_recall(spec),
+                    "per_query": {"full": full, "retrieved": retrieved},
+                }
+            )
+    return {
+        "commit": get_commit(),
+        "top_k": TOP_K,
+        "min_endpoints": MIN_ENDPOINTS,
+        "slots": slots,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--endpoint-count",
+        type=int,
+        action="append",
+        help="Default: 11 (main.py), 25, 50, 100 and 200",
+    )
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.endpoint_count or [11, 25, 50, 100, 200],
+        args.slots,
+        args.prompt_token_seconds,
+        args.token_seconds,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
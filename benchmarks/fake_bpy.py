@@ -0,0 +1,335 @@
+"""An in-memory stand-in for the part of bpy that main.py uses.
+
+Lets the benchmarks run main.py on a machine without Blender: objects have a
+name, type and transform, a world matrix and, if they are meshes, the
+bounding box of Blender's default primitives (-1 to 1 on every axis); the
+mesh primitive operators add objects with Blender's naming (Cube, Cube.001,
+...) and make them active; rendering makes up a noisy gradient at the
+scene's resolution, written as a PNG or kept in the Viewer Node image like
+Blender's compositor does; save_mainfile does nothing, save_as_mainfile
+pickles the objects, camera, frame and render settings that open_mainfile
+loads, e.g. in another process. install() registers this module as bpy
+unless the real bpy can be imported.
+"""
+
+import importlib.util
+import math
+import pickle
+import sys
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class Vector:
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        self.x, self.y, self.z = x, y, z
+
+    def __iter__(self) -> Iterator[float]:
+        return iter((self.x, self.y, self.z))
+
+    def to_euler(self, order: str = "XYZ") -> "Vector":
+        return self
+
+
+class Object:
+    """A scene object; location, rotation_euler and scale accept tuples."""
+
+    def __init__(self, name: str, type: str = "MESH"):
+        self.name = name
+        self.type = type
+        self.rotation_mode = "XYZ"
+        self.location = Vector()
+        self.rotation_euler = Vector()
+        self.scale = Vector(1.0, 1.0, 1.0)
+
+    def __setattr__(self, name, value):
+        if name in ("location", "rotation_euler", "scale"):
+            value = Vector(*value)
+        super().__setattr__(name, value)
+
+    @property
+    def rotation_quaternion(self) -> Vector:
+        return self.rotation_euler
+
+    @property
+    def bound_box(self) -> List[Tuple[float, float, float]]:
+        """The 8 local corners; all -1 for objects without geometry, as in Blender."""
+        if self.type != "MESH":
+            return [(-1.0, -1.0, -1.0)] * 8
+        return [
+            (x, y, z) for x in (-1.0, 1.0) for y in (-1.0, 1.0) for z in (-1.0, 1.0)
+        ]
+
+    @property
+    def children_recursive(self) -> List["Object"]:
+        """None: objects here have no parents."""
+        return []
+
+    @property
+    def matrix_world(self) -> List[List[float]]:
+        """Rows of location @ rotation (XYZ Euler) @ scale."""
+        cx, cy, cz = (math.cos(angle) for angle in self.rotation_euler)
+        sx, sy, sz = (math.sin(angle) for angle in self.rotation_euler)
+        rotation = [
+            [cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz],
+            [cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz],
+            [-sy, sx * cy, cx * cy],
+        ]
+        return [
+            [value * scale for value, scale in zip(row, self.scale)] + [location]
+            for row, location in zip(rotation, self.location)
+        ] + [[0.0, 0.0, 0.0, 1.0]]
+
+    def update_tag(self) -> None:
+        pass
+
+
+class Objects:
+    """bpy.data.objects: iterable, indexable by name, in insertion order."""
+
+    def __init__(self):
+        self._objects: Dict[str, Object] = {}
+
+    def __iter__(self) -> Iterator[Object]:
+        return iter(list(self._objects.values()))
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._objects
+
+    def __getitem__(self, name: str) -> Object:
+        return self._objects[name]
+
+    def get(self, name: str, default: Optional[Object] = None) -> Optional[Object]:
+        return self._objects.get(name, default)
+
+    def foreach_get(self, attribute: str, buffer) -> None:
+        """Fill buffer with the flattened attribute of every object; matrices
+        column by column, as Blender stores them."""
+        values = []
+        for obj in self:
+            value = getattr(obj, attribute)
+            if attribute.startswith("matrix_"):
+                value = zip(*value)
+            values.extend(item for row in value for item in row)
+        buffer[:] = values
+
+    def new(self, name: str, type: str = "MESH") -> Object:
+        """Add an object, renamed to name.001, ... if the name is taken."""
+        unique_name, number = name, 0
+        while unique_name in self._objects:
+            number += 1
+            unique_name = f"{name}.{number:03d}"
+        obj = Object(unique_name, type)
+        self._objects[unique_name] = obj
+        return obj
+
+    def remove(self, obj: Object, do_unlink: bool = True) -> None:
+        self._objects.pop(obj.name, None)
+        if context.view_layer.objects.active is obj:
+            context.view_layer.objects.active = None
+
+    def clear(self) -> None:
+        self._objects.clear()
+
+
+def _primitive_add(name: str):
+    def add(location=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0), **kwargs) -> set:
+        obj = data.objects.new(name)
+        obj.location = location
+        obj.rotation_euler = rotation
+        context.view_layer.objects.active = obj
+        return {"FINISHED"}
+
+    return add
+
+
+class Pixels:
+    """Image.pixels: flat RGBA floats, bottom row first."""
+
+    def __init__(self, array):
+        self._array = array
+
+    def __len__(self) -> int:
+        return self._array.size
+
+    def foreach_get(self, buffer) -> None:
+        buffer[:] = self._array.ravel()
+
+
+class Image:
+    def __init__(self, name: str, array):
+        self.name = name
+        self.size = (array.shape[1], array.shape[0])
+        self.pixels = Pixels(array)
+
+
+class Nodes(list):
+    """NodeTree.nodes of a compositor."""
+
+    types = {
+        "CompositorNodeRLayers": "R_LAYERS",
+        "CompositorNodeComposite": "COMPOSITE",
+        "CompositorNodeViewer": "VIEWER",
+    }
+
+    def new(self, type: str) -> SimpleNamespace:
+        node = SimpleNamespace(
+            type=self.types[type], inputs={"Image": None}, outputs={"Image": None}
+        )
+        self.append(node)
+        return node
+
+
+def _node_tree() -> SimpleNamespace:
+    """The compositor tree Blender creates: Render Layers into Composite."""
+    nodes = Nodes()
+    nodes.new("CompositorNodeRLayers")
+    nodes.new("CompositorNodeComposite")
+    return SimpleNamespace(
+        nodes=nodes, links=SimpleNamespace(new=lambda output, input: None)
+    )
+
+
+def _render_pixels(width: int, height: int):
+    """Linear RGBA floats, bottom row first, of a made-up render: gradients
+    varying with the scene, plus sampling noise."""
+    import numpy as np
+
+    frame = context.scene.frame_current
+    rng = np.random.default_rng((len(data.objects), frame))
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    shade = (x + y) / (width + height)
+    pixels = np.empty((height, width, 4), dtype=np.float32)
+    pixels[..., 0] = (0.5 + 0.5 * np.sin(x / 37 + len(data.objects) + frame)) * shade
+    pixels[..., 1] = (0.5 + 0.5 * np.cos(y / 23)) * shade
+    pixels[..., 2] = shade
+    pixels[..., :3] += rng.normal(0, 0.02, (height, width, 3)).astype(np.float32)
+    pixels[..., 3] = 1.0
+    return pixels
+
+
+def _render(write_still: bool = False, **kwargs) -> set:
+    """Render at the scene's resolution into the Viewer Node image, if the
+    compositor has a viewer, and into render.filepath if write_still."""
+    from custom_render import encode_png, get_png_level, to_srgb8
+
+    settings = context.scene.render
+    scale = settings.resolution_percentage / 100
+    pixels = _render_pixels(
+        int(settings.resolution_x * scale), int(settings.resolution_y * scale)
+    )
+    tree = context.scene.node_tree
+    if context.scene.use_nodes and any(node.type == "VIEWER" for node in tree.nodes):
+        data.images["Viewer Node"] = Image("Viewer Node", pixels)
+    if write_still:
+        level = get_png_level(settings.image_settings.compression)
+        with open(settings.filepath, "wb") as f:
+            f.write(encode_png(to_srgb8(pixels), level))
+    return {"FINISHED"}
+
+
+def _save_as_mainfile(filepath: str, copy: bool = False, **kwargs) -> set:
+    scene = context.scene
+    state = {
+        "objects": data.objects,
+        "active": getattr(context.view_layer.objects.active, "name", None),
+        "camera": getattr(scene.camera, "name", None),
+        "frame": scene.frame_current,
+        "render": scene.render,
+    }
+    with open(filepath, "wb") as f:
+        pickle.dump(state, f)
+    return {"FINISHED"}
+
+
+def _open_mainfile(filepath: str, **kwargs) -> set:
+    with open(filepath, "rb") as f:
+        state = pickle.load(f)
+    data.objects = state["objects"]
+    data.images.clear()
+    context.view_layer.objects.active = data.objects.get(state["active"])
+    scene = context.scene
+    scene.camera = data.objects.get(state["camera"])
+    scene.frame_current = state["frame"]
+    scene.render = state["render"]
+    scene.use_nodes, scene.node_tree = False, _node_tree()
+    return {"FINISHED"}
+
+
+def _frame_set(frame: int, subframe: float = 0.0) -> None:
+    context.scene.frame_current = frame
+
+
+data = SimpleNamespace(objects=Objects(), images={})
+context = SimpleNamespace(
+    view_layer=SimpleNamespace(
+        objects=SimpleNamespace(active=None), update=lambda: None
+    ),
+    scene=SimpleNamespace(
+        render=SimpleNamespace(
+            filepath="",
+            resolution_x=1920,
+            resolution_y=1080,
+            resolution_percentage=100,
+            image_settings=SimpleNamespace(file_format="PNG", compression=15),
+        ),
+        use_nodes=False,
+        node_tree=_node_tree(),
+        camera=None,
+        frame_current=1,
+        frame_start=1,
+        frame_end=250,
+        frame_set=_frame_set,
+    ),
+)
+ops = SimpleNamespace(
+    mesh=SimpleNamespace(
+        primitive_cube_add=_primitive_add("Cube"),
+        primitive_uv_sphere_add=_primitive_add("Sphere"),
+        primitive_torus_add=_primitive_add("Torus"),
+        primitive_cylinder_add=_primitive_add("Cylinder"),
+        primitive_cone_add=_primitive_add("Cone"),
+        primitive_plane_add=_primitive_add("Plane"),
+    ),
+    render=SimpleNamespace(render=_render),
+    wm=SimpleNamespace(
+        save_mainfile=lambda filepath=None, **kwargs: {"FINISHED"},
+        save_as_mainfile=_save_as_mainfile,
+        open_mainfile=_open_mainfile,
+        quit_blender=lambda: None,
+    ),
+)
+types = SimpleNamespace(Object=Object)
+
+
+def reset() -> None:
+    """Restore Blender's startup scene: a cube, a light and a camera."""
+    data.objects.clear()
+    context.view_layer.objects.active = data.objects.new("Cube")
+    light = data.objects.new("Light", "LIGHT")
+    light.location = (4.08, 1.0, 5.9)
+    camera = data.objects.new("Camera", "CAMERA")
+    camera.location = (7.36, -6.93, 4.96)
+    camera.rotation_euler = (math.radians(63.6), 0.0, math.radians(46.7))
+    context.scene.camera = camera
+    context.scene.frame_current = 1
+
+
+def install() -> bool:
+    """Use this module as bpy if the real one is not available.
+
+    Returns:
+        bool: Whether the stand-in is used.
+    """
+    if "bpy" in sys.modules:
+        return sys.modules["bpy"] is sys.modules[__name__]
+    if importlib.util.find_spec("bpy") is not None:
+        return False
+    sys.modules["bpy"] = sys.modules[__name__]
+    return True
+
+
+reset()
@@ -0,0 +1,254 @@
+"""Throughput and latency of main.py's endpoints under load, by scene size.
+
+For every scene size, endpoint and concurrency, concurrency clients send
+--requests requests in total and the report gives the throughput and the
+p50/p95/p99/max latency. Meanwhile a probe requests /openapi.json, which
+does no Blender work, every 20 ms: when a handler blocks the event loop the
+probe waits for it, so a probe p95 above --blocking-ms flags the endpoint
+as blocking.
+
+Without --api-url, every scene size gets a fresh main.py process started by
+benchmarks.blender_api and populated directly with the number of cubes
+(with benchmarks.fake_bpy if bpy is not installed). With --api-url, the
+scene of the running main.py is grown with POST /add_cube, so scene sizes
+should be ascending and moderate.
+
+Every response carries the whole scene graph, so requests to scenes of 10k
+to 100k objects take seconds; lower --requests for those.
+
+    python -m benchmarks.load_test --scene-size 10 --scene-size 1000
+    python -m benchmarks.load_test --scene-size 100000 --requests 4
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from benchmarks.blender_api import get_free_port
+from benchmarks.replay import get_commit
+from custom_tracing import percentile
+
+VECTOR = {"x": 0.0, "y": 0.0, "z": 0.1}
+
+ENDPOINTS = {
+    "scene_graph": ("GET", "/scene_graph", None),
+    "add_cube": ("POST", "/add_cube", None),
+    "add_sphere": ("POST", "/add_sphere", None),
+    "add_torus": ("POST", "/add_torus", None),
+    "add_cylinder": ("POST", "/add_cylinder", None),
+    "move_object": ("POST", "/move_object?name=Cube", VECTOR),
+    "rotate_object": ("POST", "/rotate_object?name=Cube", VECTOR),
+    "scale_object": ("POST", "/scale_object?name=Cube", {"x": 1, "y": 1, "z": 1}),
+    "set_object_transformation": (
+        "POST",
+        "/set_object_transformation?name=Cube",
+        {"location": VECTOR},
+    ),
+    "render_scene": ("POST", "/render_scene", None),
+}
+"""Method, path and JSON body of every endpoint; transforms target Cube."""
+
+PROBE_PATH = "/openapi.json"
+PROBE_INTERVAL = 0.02
+
+
+def summarize_latencies(seconds: List[float]) -> Dict[str, float]:
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def count_objects(api_url: str) -> int:
+    return len(requests.get(f"{api_url}/scene_graph", timeout=600).json()["objects"])
+
+
+@contextmanager
+def serve_scene(objects: int, *args: str) -> Iterator[str]:
+    """Start main.py in a new process with a scene of objects cubes.
+
+    Args:
+        args: Further arguments of benchmarks.blender_api.
+    """
+    port = get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.blender_api"]
+        + ["--port", str(port), "--objects", str(objects), *args],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    api_url = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("main.py exited before it was ready")
+            try:
+                requests.get(api_url + PROBE_PATH, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        yield api_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def grow_scene(api_url: str, objects: int) -> None:
+    """Add cubes to a running main.py until the scene has objects objects."""
+    count = count_objects(api_url)
+    if count > objects:
+        print(f"The scene already has {count} objects, more than {objects}")
+    for _ in range(objects - count):
+        requests.post(f"{api_url}/add_cube", timeout=600)
+
+
+def probe(api_url: str, stop: threading.Event, latencies: List[float]) -> None:
+    with requests.Session() as session:
+        while not stop.is_set():
+            start = time.perf_counter()
+            session.get(api_url + PROBE_PATH, timeout=600)
+            latencies.append(time.perf_counter() - start)
+            stop.wait(PROBE_INTERVAL)
+
+
+def run_endpoint(
+    api_url: str, endpoint: str, concurrency: int, total: int, blocking_ms: float
+) -> Dict[str, Any]:
+    method, path, body = ENDPOINTS[endpoint]
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def client() -> None:
+        with requests.Session() as session:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                try:
+                    response = session.request(
+                        method, api_url + path, json=body, timeout=600
+                    )
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    errors.append(str(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    objects = count_objects(api_url)
+    stop = threading.Event()
+    probe_latencies: List[float] = []
+    probe_thread = threading.Thread(target=probe, args=(api_url, stop, probe_latencies))
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    probe_thread.start()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    seconds = time.perf_counter() - start
+    stop.set()
+    probe_thread.join()
+
+    probe_summary = summarize_latencies(probe_latencies)
+    return {
+        "endpoint": endpoint,
+        "scene_objects": objects,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / seconds, 2),
+        **summarize_latencies(latencies),
+        "probe_p95_ms": probe_summary["p95_ms"],
+        "probe_max_ms": probe_summary["max_ms"],
+        "blocks_event_loop": probe_summary["p95_ms"] > blocking_ms,
+    }
+
+
+def run_scene(
+    api_url: str,
+    endpoints: List[str],
+    concurrencies: List[int],
+    total: int,
+    blocking_ms: float,
+) -> List[Dict[str, Any]]:
+    results = []
+    for endpoint in endpoints:
+        for concurrency in concurrencies:
+            result = run_endpoint(api_url, endpoint, concurrency, total, blocking_ms)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def run(
+    api_url: Optional[str],
+    scene_sizes: List[int],
+    endpoints: List[str],
+    concurrencies: List[int],
+    total: int,
+    blocking_ms: float,
+) -> Dict[str, Any]:
+    results = []
+    for objects in scene_sizes:
+        if api_url is None:
+            with serve_scene(objects) as scene_url:
+                results += run_scene(
+                    scene_url, endpoints, concurrencies, total, blocking_ms
+                )
+        else:
+            grow_scene(api_url, objects)
+            results += run_scene(api_url, endpoints, concurrencies, total, blocking_ms)
+    return {
+        "commit": get_commit(),
+        "api_url": api_url or "benchmarks.blender_api",
+        "requests_per_run": total,
+        "blocking_ms": blocking_ms,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", help="Default: start main.py per scene size")
+    parser.add_argument(
+        "--scene-size", type=int, action="append", help="Default: 10, 100 and 1000"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, action="append", help="Default: 1 and 8"
+    )
+    parser.add_argument(
+        "--endpoint", action="append", choices=list(ENDPOINTS), help="Default: all"
+    )
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--blocking-ms", type=float, default=50.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.api_url,
+        args.scene_size or [10, 100, 1000],
+        args.endpoint or list(ENDPOINTS),
+        args.concurrency or [1, 8],
+        args.requests,
+        args.blocking_ms,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
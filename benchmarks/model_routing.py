@@ -0,0 +1,225 @@
+"""Latency and success rate of the benchmark queries per model routing configuration.
+
+Runs the queries of the recorded sessions (benchmarks/sessions) with the
+react agent, its chains routed by custom_routing.ModelRouter, for every
+configuration of CONFIGURATIONS:
+
+- single: every chain on custom_ollama.model_name with Ollama's default
+  options, as before routing,
+- budgets: custom_routing.ROUTES, the same model with per-chain num_predict
+  limits, stop sequences and temperature 0,
+- small_controller: ROUTES with the controller agent and the response
+  parser on --small-model,
+- tight: ROUTES with num_predict 24, to show the cost of budgets too small
+  for the chains' answers.
+
+Without --ollama-url the LLM is benchmarks.stub_ollama replaying the recorded
+completions (see benchmarks.replay), with --small-model taking
+--small-model-speed of the time per token of the default model, and main.py
+runs in-process. A query succeeds if it finishes without errors, unparsable
+LLM output or calls for which no completion was recorded, and with the same
+calls to main.py as with the single configuration, which always runs first.
+With --ollama-url the queries run on real models, so run it with the models
+you deploy.
+
+    python -m benchmarks.model_routing --config single --config budgets
+    python -m benchmarks.model_routing --ollama-url http://localhost:11434
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+
+import custom_planner as planner
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.replay import SESSIONS_PATH, ReplayedCompletions, get_commit
+from benchmarks.stub_ollama import StubOllama
+from custom_agent_tracing import TracedRequestsWrapper, TracingCallback
+from custom_ollama import AgentStatsCallback, model_name
+from custom_routing import CHAINS, ROUTES, ModelRoute, ModelRouter
+from custom_spec import reduce_openapi_spec
+from custom_tracing import Tracer, correlation_id
+
+SMALL_MODEL = "qwen2:1.5b-instruct"
+
+
+def get_configurations(small_model: str) -> Dict[str, Dict[str, ModelRoute]]:
+    return {
+        "single": {chain: ModelRoute() for chain in CHAINS},
+        "budgets": ROUTES,
+        "small_controller": {
+            **ROUTES,
+            "controller": ROUTES["controller"].copy(update={"model": small_model}),
+            "parser": ROUTES["parser"].copy(update={"model": small_model}),
+        },
+        "tight": {
+            chain: route.copy(update={"num_predict": 24})
+            for chain, route in ROUTES.items()
+        },
+    }
+
+
+def run_configuration(
+    routes: Dict[str, ModelRoute],
+    sessions: List[Dict[str, Any]],
+    ollama_url: str,
+    api: BlenderAPI,
+    completions: Optional[ReplayedCompletions],
+) -> List[Dict[str, Any]]:
+    api.reset()
+    tracer = Tracer("model_routing")
+    router = ModelRouter(routes, base_url=ollama_url)
+    agent = planner.create_openapi_agent(
+        reduce_openapi_spec(api.spec),
+        TracedRequestsWrapper(headers={}, tracer=tracer),
+        router.get_llm("orchestrator"),
+        verbose=False,
+        agent_executor_kwargs={"handle_parsing_errors": True, "max_iterations": 10},
+        router=router,
+    )
+    rows = []
+    for number, session in enumerate(sessions):
+        if completions is not None:
+            completions.start(session)
+        stats = AgentStatsCallback()
+        trace_id = f"query-{number}"
+        token = correlation_id.set(trace_id)
+        start = time.perf_counter()
+        error = None
+        try:
+            output = agent.invoke(
+                {"input": session["query"]},
+                {"callbacks": [TracingCallback(tracer), stats]},
+            )["output"]
+        except Exception as e:
+            output, error = "", str(e)
+        finally:
+            seconds = time.perf_counter() - start
+            correlation_id.reset(token)
+        spans = [span for span in tracer.spans if span["trace_id"] == trace_id]
+        unreplayed = completions.unreplayed if completions is not None else 0
+        rows.append(
+            {
+                "query": session["query"],
+                "seconds": round(seconds, 3),
+                "completed": error is None
+                and stats.parsing_failures == 0
+                and unreplayed == 0
+                and "Agent stopped" not in output
+                and all(span["status"] == "ok" for span in spans),
+                "http_calls": [
+                    f"{span['name']} {span['attributes'].get('url')}"
+                    for span in spans
+                    if span["stage"] == "http"
+                ],
+                "llm_seconds": {
+                    chain: round(
+                        sum(
+                            span["duration_ms"]
+                            for span in spans
+                            if span["stage"] == "llm"
+                            and span["attributes"].get("chain") == chain
+                        )
+                        / 1000,
+                        3,
+                    )
+                    for chain in CHAINS
+                },
+            }
+        )
+    return rows
+
+
+def summarize(routes, rows, reference_rows) -> Dict[str, Any]:
+    for row, reference in zip(rows, reference_rows):
+        row["success"] = (
+            row["completed"] and row["http_calls"] == reference["http_calls"]
+        )
+    seconds = [row["seconds"] for row in rows]
+    return {
+        "routes": ModelRouter(routes).describe(),
+        "success_rate": round(sum(row["success"] for row in rows) / len(rows), 3),
+        "mean_seconds": round(statistics.mean(seconds), 3),
+        "p95_seconds": round(sorted(seconds)[int(len(seconds) * 0.95)], 3),
+        "llm_seconds": {
+            chain: round(sum(row["llm_seconds"][chain] for row in rows), 3)
+            for chain in CHAINS
+        },
+        "per_query": rows,
+    }
+
+
+def run(names, sessions_path, ollama_url, small_model, small_model_speed, stub_kwargs):
+    configurations = get_configurations(small_model)
+    recording = json.loads(open(sessions_path).read())
+    sessions = recording["sessions"]
+    rows = {}
+    names = ["single", *(name for name in names if name != "single")]
+    with BlenderAPI() as api:
+        if ollama_url:
+            for name in names:
+                rows[name] = run_configuration(
+                    configurations[name], sessions, ollama_url, api, None
+                )
+        else:
+            completions = ReplayedCompletions(api.url)
+            with StubOllama(
+                completion=completions,
+                load_seconds=0,
+                models=[model_name, small_model],
+                model_speeds={small_model: small_model_speed},
+                **stub_kwargs,
+            ) as stub:
+                for name in names:
+                    rows[name] = run_configuration(
+                        configurations[name], sessions, stub.url, api, completions
+                    )
+    results = {
+        name: summarize(configurations[name], rows[name], rows["single"])
+        for name in names
+    }
+    return {
+        "commit": get_commit(),
+        "llm": ollama_url
+        or {"stub": stub_kwargs, "small_model_speed": small_model_speed},
+        "queries": len(sessions),
+        "configurations": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--config",
+        action="append",
+        choices=list(get_configurations(SMALL_MODEL)),
+        help="Default: all; single always runs as the reference",
+    )
+    parser.add_argument("--sessions", default=str(SESSIONS_PATH))
+    parser.add_argument("--ollama-url", help="Run on Ollama instead of the stub")
+    parser.add_argument("--small-model", default=SMALL_MODEL)
+    parser.add_argument("--small-model-speed", type=float, default=0.3)
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.config or list(get_configurations(args.small_model)),
+        args.sessions,
+        args.ollama_url,
+        args.small_model,
+        args.small_model_speed,
+        {
+            "token_seconds": args.token_seconds,
+            "prompt_token_seconds": args.prompt_token_seconds,
+        },
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
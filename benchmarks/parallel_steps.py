@@ -0,0 +1,104 @@
+"""Wall-clock time of a plan of independent steps, sequential vs. concurrent.
+
+Executes plans with PlanExecutor against a running main.py: half of the steps
+add objects, the other half move distinct existing objects, so the plan runs
+in two waves. Reports the median time per plan for each max_concurrency.
+
+    python -m benchmarks.parallel_steps --api-url http://localhost:8000 --steps 8
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import requests
+from langchain_community.utilities.requests import RequestsWrapper
+
+from custom_executor import PlanExecutor, schedule_steps
+from custom_response import get_response_schemas
+from custom_spec import reduce_openapi_spec
+
+OBJECT_TYPES = ["cube", "sphere", "torus", "cylinder"]
+
+
+def make_plan(steps, names):
+    lines = [
+        f"POST /add_{OBJECT_TYPES[i % len(OBJECT_TYPES)]} to add an object"
+        for i in range(steps // 2)
+    ]
+    lines += [
+        f'POST /move_object?name={name} {{"x": 0, "y": 0, "z": 0.1}} to move it'
+        for name in names[: steps - len(lines)]
+    ]
+    return "\n".join(f"{number}. {line}" for number, line in enumerate(lines, 1))
+
+
+def get_object_names(api_url, count):
+    """Names of mesh objects in the scene, adding cubes until there are enough."""
+    while True:
+        objects = requests.get(f"{api_url}/scene_graph", timeout=60).json()["objects"]
+        names = [obj["name"] for obj in objects if obj["type"] == "MESH"]
+        if len(names) >= count:
+            return names[:count]
+        requests.post(f"{api_url}/add_cube", timeout=60)
+
+
+def run(api_url, spec, steps, repeat, concurrencies):
+    api_spec = reduce_openapi_spec(spec)
+    response_schemas = get_response_schemas(api_spec.endpoints)
+    plan = make_plan(steps, get_object_names(api_url, steps - steps // 2))
+    executors = {
+        max_concurrency: PlanExecutor(
+            api_spec, RequestsWrapper(headers={}), response_schemas, max_concurrency
+        )
+        for max_concurrency in concurrencies
+    }
+    # Interleave the variants, every plan adds objects and the scene grows.
+    seconds = {max_concurrency: [] for max_concurrency in concurrencies}
+    for _ in range(repeat):
+        for max_concurrency, executor in executors.items():
+            start = time.perf_counter()
+            _, remaining = executor.execute(plan)
+            seconds[max_concurrency].append(time.perf_counter() - start)
+            if remaining is not None:
+                raise RuntimeError(f"Plan not executed completely:\n{remaining}")
+
+    waves = schedule_steps(executors[concurrencies[0]].parse(plan))
+    results = [
+        {
+            "max_concurrency": max_concurrency,
+            "steps": steps,
+            "waves": len(waves),
+            "median_s": round(statistics.median(seconds[max_concurrency]), 4),
+        }
+        for max_concurrency in concurrencies
+    ]
+    # Relative to the first concurrency, sequential execution by default.
+    baseline = results[0]["median_s"]
+    for result in results:
+        result["speedup"] = round(baseline / result["median_s"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--concurrency", type=int, action="append", help="Default: 1, 4 and 8"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    spec = requests.get(f"{args.api_url}/openapi.json", timeout=10).json()
+    spec["servers"] = [{"url": args.api_url}]
+    report = run(
+        args.api_url, spec, args.steps, args.repeat, args.concurrency or [1, 4, 8]
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
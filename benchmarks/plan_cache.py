@@ -0,0 +1,148 @@
+"""Planner calls, latency and wrong plans of a repeated workload, with the plan cache.
+
+Generates --queries queries from a few request templates (move, rotate,
+scale, delete an object, add a primitive and move it) with random object
+names, numbers and phrasings, and plans them with the planner tool of
+custom_planner with and without a custom_plan_cache.PlanCache. The planner
+is benchmarks.stub_ollama answering with the right plan for every query, or
+with --noise a plan missing its parameters, as an unreliable model would.
+
+The report gives the planner calls, cache hits, mean and p95 latency per
+query and the plans that differ from the right one: a wrong plan served from
+the cache is the cost of a template that should not have been trusted.
+
+    python -m benchmarks.plan_cache --queries 200 --noise 0.1
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+
+import custom_planner as planner
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.plan_execution import last_section
+from benchmarks.replay import get_commit
+from benchmarks.stub_ollama import StubOllama
+from custom_ollama import CustomLLM, model_name
+from custom_plan_cache import MIN_AGREEMENTS, MIN_CONFIDENCE, PlanCache
+from custom_spec import reduce_openapi_spec
+
+NAMES = ["Cube", "Sphere", "Torus", "Cylinder", "Cube.001", "Sphere.002", "Lamp"]
+PRIMITIVES = ["cube", "sphere", "torus", "cylinder"]
+PREFIXES = ["", "Please ", "Can you "]
+
+
+def make_query(rng: random.Random) -> Tuple[str, str]:
+    """A random query and its right plan."""
+    name = rng.choice(NAMES)
+    mention = rng.choice([name, name.lower()])
+    number = rng.choice([rng.randint(1, 10), round(rng.uniform(0.5, 5), 1)])
+    kind = rng.randrange(5)
+    if kind == 0:
+        query = f"move the {mention} up by {number}"
+        plan = f'1. POST /move_object?name={name} {{"x": 0, "y": 0, "z": {number}}}'
+    elif kind == 1:
+        query = f"rotate {mention} by {number} degrees around z"
+        plan = f'1. POST /rotate_object?name={name} {{"x": 0, "y": 0, "z": {number}}}'
+    elif kind == 2:
+        query = f"scale the {mention} by {number}"
+        body = f'{{"x": {number}, "y": {number}, "z": {number}}}'
+        plan = f"1. POST /scale_object?name={name} {body}"
+    elif kind == 3:
+        query = f"delete the {mention}"
+        plan = f"1. POST /delete_object?name={name}"
+    else:
+        primitive = rng.choice(PRIMITIVES)
+        query = f"add a {primitive} and move it up by {number}"
+        plan = (
+            f"1. POST /add_{primitive}\n"
+            f"2. POST /move_object?name={primitive.capitalize()} "
+            f'{{"x": 0, "y": 0, "z": {number}}}'
+        )
+    prefix = rng.choice(PREFIXES)
+    query = prefix + (query[0].upper() + query[1:] if not prefix else query)
+    return query, plan
+
+
+def plan_workload(spec, workload, noise, seed, cache, stub_kwargs) -> Dict[str, object]:
+    plans = dict(workload)
+    rng = random.Random(seed)
+
+    def completion(prompt: str) -> str:
+        plan = plans.get(last_section(prompt, "User query: ", "\n"), "")
+        if rng.random() < noise:
+            # A plan without its parameters.
+            return "\n".join(line.split("?")[0] for line in plan.splitlines())
+        return plan
+
+    with StubOllama(completion=completion, load_seconds=0, **stub_kwargs) as stub:
+        llm = CustomLLM(model=model_name, base_url=stub.url)
+        tool = planner._create_api_planner_tool(spec, llm, plan_cache=cache)
+        seconds, wrong = [], 0
+        for query, right_plan in workload:
+            start = time.perf_counter()
+            plan = tool.run(query)
+            seconds.append(time.perf_counter() - start)
+            wrong += plan.strip() != right_plan
+        calls = stub.stats["requests"]
+    result = {
+        "planner_calls": calls,
+        "mean_ms": round(statistics.mean(seconds) * 1000, 3),
+        "p95_ms": round(sorted(seconds)[int(len(seconds) * 0.95)] * 1000, 3),
+        "wrong_plans": wrong,
+    }
+    if cache is not None:
+        result.update(cache.summary(), hit_rate=round(1 - calls / len(workload), 3))
+    return result
+
+
+def run(queries, noise, seed, prompt_token_seconds, token_seconds):
+    spec = reduce_openapi_spec(BlenderAPI().spec)
+    rng = random.Random(seed)
+    workload: List[Tuple[str, str]] = [make_query(rng) for _ in range(queries)]
+    cache = PlanCache(path=None)
+    cache.set_spec_hash("benchmark")
+    stub_kwargs = {
+        "prompt_token_seconds": prompt_token_seconds,
+        "token_seconds": token_seconds,
+    }
+    return {
+        "commit": get_commit(),
+        "queries": queries,
+        "distinct_queries": len(set(query for query, _ in workload)),
+        "noise": noise,
+        "min_agreements": MIN_AGREEMENTS,
+        "min_confidence": MIN_CONFIDENCE,
+        "planner": plan_workload(spec, workload, noise, seed, None, stub_kwargs),
+        "plan_cache": plan_workload(spec, workload, noise, seed, cache, stub_kwargs),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--noise", type=float, default=0.0, help="Share of wrong planner answers"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.queries,
+        args.noise,
+        args.seed,
+        args.prompt_token_seconds,
+        args.token_seconds,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,166 @@
+"""LLM calls and wall-clock time per query, with and without direct plan execution.
+
+Runs the openapi agent on a fixed query suite against a running main.py and
+benchmarks.stub_ollama. The stub replays a scripted session: the planner
+answers with a recorded plan, the controller agent issues one request per
+plan step and the orchestrator plans, executes and finishes. With direct
+execution, plan steps that name all of their parameters skip the controller.
+
+    python -m benchmarks.plan_execution --api-url http://localhost:8000
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+
+import requests
+from langchain_community.utilities.requests import RequestsWrapper
+
+import custom_planner as planner
+from benchmarks.stub_ollama import StubOllama
+from custom_executor import find_json_object, split_plan
+from custom_ollama import CustomLLM, model_name
+from custom_spec import reduce_openapi_spec
+
+PLANS = {
+    "Add a cube to the scene": "1. POST /add_cube to add a cube",
+    "Add a sphere and move it up by 2": (
+        "1. POST /add_sphere to add a sphere\n"
+        '2. POST /move_object?name=Sphere {"x": 0, "y": 0, "z": 2} to move it up'
+    ),
+    "Rotate the cube by 45 degrees around z": (
+        '1. POST /rotate_object?name=Cube {"x": 0, "y": 0, "z": 45} to rotate it'
+    ),
+    "Add a torus and scale it by 2": (
+        "1. POST /add_torus to add a torus\n"
+        '2. POST /scale_object?name=Torus {"x": 2, "y": 2, "z": 2} to scale it'
+    ),
+    "What objects are in the scene?": "1. GET /scene_graph to list the objects",
+    "Move the new cylinder up by 1": (
+        "1. POST /add_cylinder to add a cylinder\n"
+        "2. POST /move_object to move the cylinder up by 1"
+    ),
+}
+"""Recorded planner output; the last plan leaves a step to the controller."""
+
+
+def last_section(prompt: str, start: str, end: str) -> str:
+    section = prompt[prompt.rindex(start) + len(start) :]
+    return section[: section.index(end)].strip() if end in section else section
+
+
+def controller_action(prompt: str) -> str:
+    """Issue the request of the first plan step without an observation yet."""
+    base_url = last_section(prompt, "Base url: ", "\n")
+    plan = last_section(prompt, "Plan: ", "\nThought:")
+    plan = plan.split("Execute the rest of the plan:")[-1]
+    calls = [re.search(r"\b(GET|POST) (/[^\s{]*)", step) for step in split_plan(plan)]
+    calls = [call for call in calls if call]
+    done = prompt.count("Observation:") - 1
+    if done >= len(calls):
+        return "I am finished executing the plan.\nFinal Answer: Done."
+
+    method, route = calls[done].groups()
+    data = find_json_object(calls[done].string) or {}
+    if route.endswith("_object"):
+        # An ambiguous step, resolve the object as a model would from the plan.
+        name = re.search(r"\b(cube|sphere|torus|cylinder)\b", plan, re.IGNORECASE)
+        route += f"?name={name.group(1).capitalize() if name else 'Cube'}"
+        data = data or {"x": 0, "y": 0, "z": 1}
+    tool_input = {"url": base_url + route, "output_instructions": "the object name"}
+    if method == "POST":
+        tool_input["data"] = data
+    tool = "requests_get" if method == "GET" else "requests_post"
+    return (
+        f"I should call {route}.\nAction: {tool}\n"
+        f"Action Input: {json.dumps(tool_input)}"
+    )
+
+
+def scripted_completion(prompt: str) -> str:
+    if prompt.startswith("You are a planner"):
+        return PLANS.get(last_section(prompt, "User query: ", "\n"), "")
+    if prompt.startswith("You are an agent that gets a sequence of API calls"):
+        return controller_action(prompt)
+    if prompt.startswith("Here is an API response"):
+        return "The request succeeded."
+    scratchpad = prompt[prompt.rindex("User query: ") :]
+    if "Action: api_planner" not in scratchpad:
+        query = last_section(prompt, "User query: ", "\n")
+        return f"Action: api_planner\nAction Input: {query}"
+    if "Action: api_controller" not in scratchpad:
+        plan = scratchpad[scratchpad.rindex("Observation:") + len("Observation:") :]
+        plan = plan[: plan.rfind("Thought:")].strip() if "Thought:" in plan else plan
+        return (
+            "I'm ready to execute the plan.\nAction: api_controller\n"
+            f"Action Input: {plan.strip()}"
+        )
+    return "I am finished executing the plan.\nFinal Answer: Done."
+
+
+def run_variant(spec, queries, direct_execution, stub_kwargs):
+    with StubOllama(completion=scripted_completion, **stub_kwargs) as stub:
+        llm = CustomLLM(model=model_name, base_url=stub.url)
+        agent = planner.create_openapi_agent(
+            reduce_openapi_spec(spec),
+            RequestsWrapper(headers={}),
+            llm,
+            verbose=False,
+            direct_execution=direct_execution,
+            agent_executor_kwargs={"handle_parsing_errors": True},
+        )
+        llm.warm_up()
+        stats_before = dict(stub.stats)
+        rows = []
+        for query in queries:
+            calls_before = stub.stats["requests"]
+            start = time.perf_counter()
+            agent.invoke({"input": query})
+            rows.append(
+                {
+                    "query": query,
+                    "llm_calls": stub.stats["requests"] - calls_before,
+                    "seconds": round(time.perf_counter() - start, 3),
+                }
+            )
+        return {
+            "direct_execution": direct_execution,
+            "queries": len(rows),
+            "llm_calls_per_query": round(
+                statistics.mean(row["llm_calls"] for row in rows), 2
+            ),
+            "seconds_per_query": round(
+                statistics.mean(row["seconds"] for row in rows), 3
+            ),
+            "prompt_tokens": stub.stats["prompt_tokens"]
+            - stats_before["prompt_tokens"],
+            "per_query": rows,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    spec = requests.get(f"{args.api_url}/openapi.json", timeout=10).json()
+    spec["servers"] = [{"url": args.api_url}]
+    stub_kwargs = {
+        "load_seconds": 0,
+        "token_seconds": args.token_seconds,
+        "prompt_token_seconds": args.prompt_token_seconds,
+    }
+    report = [
+        run_variant(spec, list(PLANS), direct, stub_kwargs)
+        for direct in (False, True)
+    ]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,147 @@
+"""Time-to-first-token of CustomLLM with and without prompt prefix reuse.
+
+Replays the prompt sequence of an agent run (orchestrator, planner,
+orchestrator, controller per query) against benchmarks.stub_ollama and
+reports time-to-first-token per variant:
+
+- evicted: keep_alive=0, the model is unloaded and every prompt fully evaluated,
+- keep_alive: the model stays loaded and the static prompt prefixes are served
+  from the stub's prompt cache,
+- context: keep_alive plus reuse_prefix_context.
+
+    python -m benchmarks.prefix_reuse --queries 5 --slots 3
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from langchain_core.prompts import PromptTemplate
+
+from benchmarks.stub_ollama import StubOllama
+from custom_ollama import CustomLLM, model_name
+from custom_planner import _get_static_prompt_prefix
+from custom_planner_prompt import (
+    API_CONTROLLER_PROMPT,
+    API_ORCHESTRATOR_PROMPT,
+    API_PLANNER_PROMPT,
+)
+
+ENDPOINTS = [
+    "POST /add_cube Adds a cube to the Blender scene.",
+    "POST /add_sphere Adds a UV sphere to the Blender scene.",
+    "POST /add_torus Adds a torus to the Blender scene.",
+    "POST /add_cylinder Adds a cylinder to the Blender scene.",
+    "POST /move_object Move object by x, y, z",
+    "POST /rotate_object Rotate object by x, y, z degrees",
+    "POST /scale_object Scale object by x, y, z",
+    "GET /scene_graph Retrieves the scene graph for the current image.",
+]
+QUERIES = [
+    "Add a cube to the scene",
+    "Add a sphere and move it up by 2",
+    "Rotate the cube by 45 degrees around z",
+    "Scale the torus by 2",
+    "What objects are in the scene?",
+]
+
+
+def build_prompts():
+    planner = PromptTemplate(
+        template=API_PLANNER_PROMPT,
+        input_variables=["query"],
+        partial_variables={"endpoints": "- " + "\n- ".join(ENDPOINTS)},
+    )
+    orchestrator = PromptTemplate(
+        template=API_ORCHESTRATOR_PROMPT,
+        input_variables=["input", "agent_scratchpad"],
+        partial_variables={
+            "tool_names": "api_planner, api_controller",
+            "tool_descriptions": "api_planner: plans\napi_controller: executes",
+            "history": "",
+        },
+    )
+    controller = PromptTemplate(
+        template=API_CONTROLLER_PROMPT,
+        input_variables=["input", "agent_scratchpad", "api_docs"],
+        partial_variables={
+            "api_url": "http://localhost:8000",
+            "tool_names": "requests_get, requests_post",
+            "tool_descriptions": "requests_get: GET\nrequests_post: POST",
+        },
+    )
+    return planner, orchestrator, controller
+
+
+def agent_prompt_sequence(queries):
+    planner, orchestrator, controller = build_prompts()
+    for query in queries:
+        plan = f"1. POST /add_cube to {query.lower()}"
+        yield orchestrator.format(input=query, agent_scratchpad="")
+        yield planner.format(query=query)
+        yield orchestrator.format(
+            input=query,
+            agent_scratchpad=f"Action: api_planner\nObservation: {plan}\nThought:",
+        )
+        yield controller.format(
+            input=plan, agent_scratchpad="", api_docs="== Docs for POST /add_cube =="
+        )
+
+
+def time_to_first_token(llm: CustomLLM, prompt: str) -> float:
+    start = time.perf_counter()
+    for _ in llm.stream(prompt):
+        return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+def run_variant(name, stub, queries, **llm_kwargs):
+    llm = CustomLLM(model=model_name, base_url=stub.url, **llm_kwargs)
+    planner, orchestrator, controller = build_prompts()
+    llm.add_prompt_prefix(_get_static_prompt_prefix(planner))
+    llm.add_prompt_prefix(_get_static_prompt_prefix(orchestrator))
+    llm.add_prompt_prefix(_get_static_prompt_prefix(controller, ["api_docs"]))
+
+    stats_before = dict(stub.stats)
+    ttfts = [time_to_first_token(llm, p) for p in agent_prompt_sequence(queries)]
+    return {
+        "variant": name,
+        "calls": len(ttfts),
+        "ttft_first_s": round(ttfts[0], 4),
+        "ttft_mean_s": round(statistics.mean(ttfts), 4),
+        "ttft_median_s": round(statistics.median(ttfts), 4),
+        "model_loads": stub.stats["loads"] - stats_before["loads"],
+        "cached_prompt_tokens": stub.stats["cached_tokens"]
+        - stats_before["cached_tokens"],
+    }
+
+
+def run(queries, slots, load_seconds):
+    variants = [
+        ("evicted", {"keep_alive": 0}),
+        ("keep_alive", {"keep_alive": "30m"}),
+        ("context", {"keep_alive": "30m", "reuse_prefix_context": True}),
+    ]
+    results = []
+    for name, llm_kwargs in variants:
+        with StubOllama(slots=slots, load_seconds=load_seconds) as stub:
+            results.append(run_variant(name, stub, queries, **llm_kwargs))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=len(QUERIES))
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    queries = (QUERIES * args.queries)[: args.queries]
+    report = run(queries, args.slots, args.load_seconds)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,127 @@
+"""Render-to-client latency of POST /render_image against /render_scene + /static.
+
+Starts main.py in its own process (benchmarks.blender_api, with
+benchmarks.fake_bpy if bpy is not installed) and times, from the client, how
+long it takes to hold the rendered image's bytes:
+
+- disk: POST /render_scene, which writes a PNG into rendered_images, then GET
+  of its rendered_image_url from /static, as the client did before
+  custom_render;
+- png: POST /render_image, the PNG encoded in memory and in the response;
+- png_stream: the same with stream=true, with the time to its first byte;
+- jpeg and webp: POST /render_image at --quality, skipped when the server
+  answers 501 because Pillow is not installed.
+
+fake_bpy renders a noisy gradient in NumPy and writes files with the same
+encoder, so with it the paths differ only by the file write, the file read
+and the second request; Blender's render time adds to all of them alike.
+
+    python -m benchmarks.render_latency --resolution-percentage 50
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from benchmarks.load_test import serve_scene, summarize_latencies
+from benchmarks.replay import get_commit
+
+
+def fetch_disk(session: requests.Session, api_url: str) -> Dict[str, Any]:
+    response = session.post(f"{api_url}/render_scene", timeout=600)
+    response.raise_for_status()
+    # main.py names the image on port 8000, whatever port it listens on.
+    path = urlparse(response.json()["rendered_image_url"]).path
+    image = session.get(api_url + path, timeout=600)
+    image.raise_for_status()
+    return {"bytes": len(image.content)}
+
+
+def fetch_memory(
+    session: requests.Session, api_url: str, params: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    start = time.perf_counter()
+    with session.post(
+        f"{api_url}/render_image", params=params, stream=True, timeout=600
+    ) as response:
+        if response.status_code == 501:
+            return None
+        response.raise_for_status()
+        size, first_byte = 0, None
+        for chunk in response.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+    return {"bytes": size, "first_byte": first_byte}
+
+
+def measure(function, repeats: int) -> Optional[Dict[str, Any]]:
+    """Latencies of repeats calls after a warm-up, or None if it was skipped."""
+    result = function()
+    if result is None:
+        return None
+    seconds, first_bytes = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+        first_bytes.append(result.get("first_byte"))
+    summary = {"bytes": result["bytes"], **summarize_latencies(seconds)}
+    if None not in first_bytes:
+        summary["first_byte_p50_ms"] = summarize_latencies(first_bytes)["p50_ms"]
+    return summary
+
+
+def run(
+    objects: int, repeats: int, quality: int, resolution_percentage: int
+) -> Dict[str, Any]:
+    paths = {
+        "png": {"format": "PNG"},
+        "png_stream": {"format": "PNG", "stream": "true"},
+        "jpeg": {"format": "JPEG", "quality": quality},
+        "webp": {"format": "WEBP", "quality": quality},
+    }
+    args = ["--resolution-percentage", str(resolution_percentage)]
+    results: Dict[str, Any] = {}
+    skipped: List[str] = []
+    with serve_scene(objects, *args) as api_url, requests.Session() as session:
+        results["disk"] = measure(lambda: fetch_disk(session, api_url), repeats)
+        print(json.dumps({"disk": results["disk"]}), file=sys.stderr)
+        for name, params in paths.items():
+            result = measure(lambda: fetch_memory(session, api_url, params), repeats)
+            if result is None:
+                skipped.append(name)
+                continue
+            results[name] = result
+            print(json.dumps({name: result}), file=sys.stderr)
+    return {
+        "commit": get_commit(),
+        "scene_objects": objects,
+        "resolution_percentage": resolution_percentage,
+        "repeats": repeats,
+        "quality": quality,
+        "results": results,
+        "skipped_without_pillow": skipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--resolution-percentage", type=int, default=100)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.objects, args.repeats, args.quality, args.resolution_percentage)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,269 @@
+"""Replay recorded agent sessions against a stub LLM and an in-process main.py.
+
+Runs the full agent pipeline without Ollama, Blender, a GPU or the network:
+benchmarks.stub_ollama answers every LLM call with the completion recorded
+for the same kind of prompt (orchestrator, planner, controller, parser or
+structured agent) and main.py runs in-process with the real bpy if it can be
+imported, benchmarks.fake_bpy otherwise. Reports per query the latency, LLM
+calls, estimated prompt and completion tokens and HTTP calls to main.py,
+taken from the spans of custom_tracing. With --baseline, the totals are
+compared with an earlier report, e.g. one of the previous commit.
+
+LLM calls for which the session has no recorded completion are answered
+with a final answer and counted as unreplayed: the pipeline no longer makes
+the calls it made when the session was recorded. Record sessions again with
+a real model:
+
+    python -m benchmarks.replay --record --ollama-url http://localhost:11434
+    python -m benchmarks.replay --output after.json --baseline before.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks.base import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from benchmarks.agent_modes import AGENT_MODES, TASKS
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.stub_ollama import StubOllama
+from custom_agent_tracing import (
+    TracedRequestsWrapper,
+    TracingCallback,
+    get_llm_chain,
+)
+from custom_ollama import CustomLLM, model_name
+from custom_spec import reduce_openapi_spec
+from custom_tracing import Tracer, correlation_id
+
+SESSIONS_PATH = Path(__file__).parent / "sessions" / "react.json"
+"""Sessions replayed by default, recorded with the react agent mode."""
+
+API_URL = "<api_url>"
+"""Stands in for the url of main.py in recorded completions."""
+
+FINAL_ANSWER = "I am finished executing the plan.\nFinal Answer: Done."
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ReplayedCompletions:
+    """Completion callable for StubOllama replaying one session at a time."""
+
+    def __init__(self, api_url: str):
+        self.api_url = api_url
+        self.queues: Dict[str, List[str]] = {}
+        self.unreplayed = 0
+        self.lock = threading.Lock()
+
+    def start(self, session: Dict[str, Any]) -> None:
+        with self.lock:
+            self.queues = {}
+            for call in session["completions"]:
+                self.queues.setdefault(call["kind"], []).append(call["completion"])
+            self.unreplayed = 0
+
+    def __call__(self, prompt: str) -> str:
+        kind = get_llm_chain(prompt)
+        with self.lock:
+            queue = self.queues.get(kind)
+            if not queue:
+                self.unreplayed += 1
+                return "" if kind == "planner" else FINAL_ANSWER
+            return queue.pop(0).replace(API_URL, self.api_url)
+
+
+class RecordingCallback(BaseCallbackHandler):
+    """Records the kind and completion of every LLM call, in call order."""
+
+    def __init__(self, api_url: str):
+        self.api_url = api_url
+        self.completions: List[Dict[str, str]] = []
+        self._calls: Dict[UUID, Dict[str, str]] = {}
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> Any:
+        call = {"kind": get_llm_chain(prompts[0]), "completion": ""}
+        self._calls[run_id] = call
+        self.completions.append(call)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            text = response.generations[0][0].text if response.generations else ""
+            call["completion"] = text.replace(self.api_url, API_URL)
+
+
+def create_agent(agent_mode, api, llm, requests_wrapper):
+    return AGENT_MODES[agent_mode](
+        reduce_openapi_spec(api.spec),
+        requests_wrapper,
+        llm,
+        verbose=False,
+        agent_executor_kwargs={"handle_parsing_errors": True, "max_iterations": 10},
+    )
+
+
+def record(queries, agent_mode, ollama_url):
+    """Run the queries with a real model, return the sessions to replay."""
+    with BlenderAPI() as api:
+        api.reset()
+        llm = CustomLLM(model=model_name, base_url=ollama_url)
+        agent = create_agent(agent_mode, api, llm, TracedRequestsWrapper(headers={}))
+        sessions = []
+        for query in queries:
+            recorder = RecordingCallback(api.url)
+            agent.invoke({"input": query}, {"callbacks": [recorder]})
+            sessions.append({"query": query, "completions": recorder.completions})
+    return {"agent_mode": agent_mode, "model": model_name, "sessions": sessions}
+
+
+def summarize_query(query, spans, seconds, unreplayed):
+    llm_spans = [span for span in spans if span["stage"] == "llm"]
+    return {
+        "query": query,
+        "seconds": round(seconds, 3),
+        "llm_calls": len(llm_spans),
+        "unreplayed_llm_calls": unreplayed,
+        "prompt_tokens": sum(
+            span["attributes"].get("prompt_tokens") or 0 for span in llm_spans
+        ),
+        "completion_tokens": sum(
+            span["attributes"].get("completion_tokens") or 0 for span in llm_spans
+        ),
+        "http_calls": sum(1 for span in spans if span["stage"] == "http"),
+        "errors": sum(1 for span in spans if span["status"] != "ok"),
+    }
+
+
+def replay(recording, stub_kwargs):
+    """Replay the recorded sessions in order on a fresh scene, return the report."""
+    tracer = Tracer("replay")
+    with BlenderAPI() as api:
+        api.reset()
+        completions = ReplayedCompletions(api.url)
+        with StubOllama(completion=completions, load_seconds=0, **stub_kwargs) as stub:
+            llm = CustomLLM(model=model_name, base_url=stub.url)
+            agent = create_agent(
+                recording["agent_mode"],
+                api,
+                llm,
+                TracedRequestsWrapper(headers={}, tracer=tracer),
+            )
+            callbacks = [TracingCallback(tracer)]
+            rows = []
+            for number, session in enumerate(recording["sessions"]):
+                completions.start(session)
+                trace_id = f"query-{number}"
+                token = correlation_id.set(trace_id)
+                start = time.perf_counter()
+                try:
+                    agent.invoke({"input": session["query"]}, {"callbacks": callbacks})
+                finally:
+                    seconds = time.perf_counter() - start
+                    correlation_id.reset(token)
+                spans = [span for span in tracer.spans if span["trace_id"] == trace_id]
+                rows.append(
+                    summarize_query(
+                        session["query"], spans, seconds, completions.unreplayed
+                    )
+                )
+
+    totals = {
+        key: round(sum(row[key] for row in rows), 3)
+        for key in rows[0]
+        if key != "query"
+    }
+    return {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "bpy": "fake" if api.fake_bpy else "real",
+        "agent_mode": recording["agent_mode"],
+        "stub": stub_kwargs,
+        "queries": len(rows),
+        "totals": totals,
+        "per_query": rows,
+    }
+
+
+def compare(baseline, report):
+    """Change of every total from the baseline report to this one."""
+    changes = {}
+    for key, value in report["totals"].items():
+        before = baseline.get("totals", {}).get(key)
+        if before is None:
+            continue
+        changes[key] = {
+            "before": before,
+            "after": value,
+            "change": round((value - before) / before, 3) if before else None,
+        }
+    return {"baseline_commit": baseline.get("commit"), "changes": changes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default=str(SESSIONS_PATH))
+    parser.add_argument("--token-seconds", type=float, default=0.01)
+    parser.add_argument("--prompt-token-seconds", type=float, default=0.0005)
+    parser.add_argument("--baseline", help="Compare with this earlier report")
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Record the sessions with the model at --ollama-url instead",
+    )
+    parser.add_argument("--ollama-url", default="http://localhost:11434")
+    parser.add_argument("--agent-mode", default="react", choices=list(AGENT_MODES))
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.record:
+        # Record the queries of the sessions again, or the agent_modes tasks.
+        queries = TASKS
+        if Path(args.sessions).exists():
+            with open(args.sessions) as f:
+                queries = [session["query"] for session in json.load(f)["sessions"]]
+        recording = record(queries, args.agent_mode, args.ollama_url)
+        with open(args.sessions, "w") as f:
+            json.dump(recording, f, indent=2)
+        print(f"Recorded {len(recording['sessions'])} sessions to {args.sessions}")
+    else:
+        with open(args.sessions) as f:
+            recording = json.load(f)
+        stub_kwargs = {
+            "token_seconds": args.token_seconds,
+            "prompt_token_seconds": args.prompt_token_seconds,
+        }
+        report = replay(recording, stub_kwargs)
+        if args.baseline:
+            with open(args.baseline) as f:
+                report["comparison"] = compare(json.load(f), report)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        print(text)
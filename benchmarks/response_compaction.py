@@ -0,0 +1,79 @@
+"""Benchmark response compaction against blind truncation.
+
+Reports prompt token counts of the parsing prompt input for scenes of
+10/100/1000 objects, compaction time, and whether the objects named in the
+instructions survive. With --model the parsing prompt is also sent to Ollama
+to measure end-to-end latency of both variants.
+
+    python -m benchmarks.response_compaction --output compaction.json
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.scenes import make_operation_result
+from custom_response import compact_response, estimate_tokens, is_mentioned
+
+MAX_RESPONSE_LENGTH = 5000
+MAX_RESPONSE_TOKENS = 1000
+
+
+def time_generation(model: str, response: str, instructions: str) -> float:
+    import ollama
+
+    from custom_planner_prompt import PARSING_POST_PROMPT
+
+    prompt = PARSING_POST_PROMPT.format(response=response, instructions=instructions)
+    start = time.perf_counter()
+    ollama.generate(model=model, prompt=prompt)
+    return time.perf_counter() - start
+
+
+def run(scene_sizes, max_tokens, model=None):
+    results = []
+    for count in scene_sizes:
+        payload = make_operation_result(count)
+        target = payload["scene_graph"]["objects"][count // 2]["name"]
+        instructions = f"the location of {target}"
+        response = json.dumps(payload)
+
+        truncated = response[:MAX_RESPONSE_LENGTH]
+        start = time.perf_counter()
+        compacted = compact_response(response, instructions, max_tokens)
+        compaction_seconds = time.perf_counter() - start
+
+        result = {
+            "objects": count,
+            "raw_tokens": estimate_tokens(response),
+            "truncated_tokens": estimate_tokens(truncated),
+            "truncated_keeps_target": is_mentioned(target, truncated),
+            "compacted_tokens": estimate_tokens(compacted),
+            "compacted_keeps_target": is_mentioned(target, compacted),
+            "compaction_ms": round(compaction_seconds * 1000, 3),
+        }
+        if model:
+            result["truncated_latency_s"] = time_generation(
+                model, truncated, instructions
+            )
+            result["compacted_latency_s"] = time_generation(
+                model, compacted, instructions
+            )
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--max-tokens", type=int, default=MAX_RESPONSE_TOKENS)
+    parser.add_argument("--model", help="Ollama model for end-to-end latency")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.max_tokens, args.model)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,178 @@
+"""Throughput of concurrent GET /scene_graph, with and without main.scene_cache.
+
+For every scene size, with main.py's scene cache off (every request walks
+bpy.data.objects, builds and serializes the scene graph) and on (concurrent
+requests share one build, whose JSON is served until the next mutation), and
+for 1, 10 and 100 concurrent clients, the clients send --requests requests
+in total. Meanwhile a writer moves an object every --write-interval seconds,
+0 for none, and reads the scene graph right after each move: a read without
+the new location is counted as stale.
+
+The report gives the throughput, p50/p95 latency, stale reads and the scene
+graph builds, cache hits and coalesced requests from main.py's /metrics.
+main.py runs in its own process per configuration (benchmarks.blender_api,
+with benchmarks.fake_bpy if bpy is not installed).
+
+    python -m benchmarks.scene_graph_reads --scene-size 1000 --requests 500
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.load_test import serve_scene, summarize_latencies
+from benchmarks.replay import get_commit
+
+CACHE_PATTERN = re.compile(
+    r'cache_requests_total\{cache="scene_graph",result="(\w+)"\} (\S+)'
+)
+
+
+def get_cache_counts(api_url: str) -> Dict[str, int]:
+    text = requests.get(f"{api_url}/metrics", timeout=60).text
+    return {result: int(float(value)) for result, value in CACHE_PATTERN.findall(text)}
+
+
+def get_z(session: requests.Session, api_url: str, name: str) -> float:
+    objects = session.get(f"{api_url}/scene_graph", timeout=600).json()["objects"]
+    obj = next(obj for obj in objects if obj["name"] == name)
+    return obj["object_transform"]["location"]["z"]
+
+
+def write(
+    api_url: str, interval: float, stop: threading.Event, counts: Dict[str, int]
+) -> None:
+    """Move an object up every interval seconds and check the next read sees it."""
+    with requests.Session() as session:
+        # main.py removes the first cube at startup; add an active object.
+        result = session.post(f"{api_url}/add_cube", timeout=600).json()
+        name = result["active_object"]["name"]
+        z = get_z(session, api_url, name)
+        while not stop.wait(interval):
+            try:
+                session.post(
+                    f"{api_url}/move_object?name={name}",
+                    json={"x": 0, "y": 0, "z": 1},
+                    timeout=600,
+                ).raise_for_status()
+                z += 1
+                counts["writes"] += 1
+                counts["stale_reads"] += abs(get_z(session, api_url, name) - z) > 1e-6
+            except requests.RequestException:
+                # An overloaded main.py drops connections, count the failed write.
+                counts["write_errors"] += 1
+                z = get_z(session, api_url, name)
+
+
+def run_clients(
+    api_url: str, clients: int, total: int, write_interval: float
+) -> Dict[str, Any]:
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def client() -> None:
+        with requests.Session() as session:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                try:
+                    session.get(
+                        f"{api_url}/scene_graph", timeout=600
+                    ).raise_for_status()
+                except requests.RequestException as e:
+                    errors.append(str(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    counts = get_cache_counts(api_url)
+    stop = threading.Event()
+    writes = {"writes": 0, "write_errors": 0, "stale_reads": 0}
+    writer = threading.Thread(
+        target=write, args=(api_url, write_interval, stop, writes)
+    )
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    if write_interval > 0:
+        writer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    stop.set()
+    if write_interval > 0:
+        writer.join()
+    after = get_cache_counts(api_url)
+    cache = {
+        result: after.get(result, 0) - counts.get(result, 0)
+        for result in ("miss", "hit", "coalesced")
+    }
+    return {
+        "clients": clients,
+        "requests": total,
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / seconds, 2),
+        **summarize_latencies(latencies),
+        **writes,
+        "builds": cache["miss"],
+        "cache_hits": cache["hit"],
+        "coalesced": cache["coalesced"],
+    }
+
+
+def run(scene_sizes, concurrencies, total, write_interval) -> Dict[str, Any]:
+    results = []
+    for objects in scene_sizes:
+        for cached in (False, True):
+            args = () if cached else ("--no-scene-cache",)
+            with serve_scene(objects, *args) as api_url:
+                for clients in concurrencies:
+                    result = {
+                        "scene_objects": objects,
+                        "scene_cache": cached,
+                        **run_clients(api_url, clients, total, write_interval),
+                    }
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+    return {
+        "commit": get_commit(),
+        "requests_per_run": total,
+        "write_interval": write_interval,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scene-size", type=int, action="append", help="Default: 100 and 1000"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, action="append", help="Default: 1, 10 and 100"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--write-interval", type=float, default=0.1)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.scene_size or [100, 1000],
+        args.concurrency or [1, 10, 100],
+        args.requests,
+        args.write_interval,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,120 @@
+"""Response size and latency of filtered, projected and paginated /scene_graph queries.
+
+For every scene size, starts main.py (benchmarks.blender_api) with that many
+cubes plus the Light and Camera, and sends every query of QUERIES --repeats
+times. The first request of a query misses main.py's scene cache, the first
+of the run also builds the scene index; the others are cache hits. The
+report gives the response bytes, the objects returned, the latency of the
+first request and the median of the others per query, and for "all_pages"
+the requests, bytes and time to page through the meshes.
+
+    python -m benchmarks.scene_queries --scene-size 1000 --scene-size 10000
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.load_test import serve_scene
+from benchmarks.replay import get_commit
+
+QUERIES = {
+    "full": {},
+    "lights": {"type": "LIGHT"},
+    "names_only": {"fields": "name"},
+    "meshes_locations": {"type": "MESH", "fields": "location"},
+    "name_prefix": {"name": "Cube.00"},
+    "name_glob": {"name": "*.01?", "fields": "name"},
+    "top_10_by_z": {"sort": "-location.z", "limit": "10", "fields": "location"},
+    "first_page": {"type": "MESH", "limit": "100"},
+}
+"""Query parameters of GET /scene_graph per query name."""
+PAGE_SIZE = 500
+
+
+def time_request(session: requests.Session, url: str, params) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = session.get(url, params=params, timeout=600)
+    seconds = time.perf_counter() - start
+    response.raise_for_status()
+    return {
+        "seconds": seconds,
+        "bytes": len(response.content),
+        "body": response.json(),
+    }
+
+
+def page_through(session: requests.Session, url: str) -> Dict[str, Any]:
+    """Fetch the names of all meshes page by page."""
+    params = {"type": "MESH", "fields": "name", "limit": str(PAGE_SIZE)}
+    requests_, total_bytes, objects = 0, 0, 0
+    start = time.perf_counter()
+    while True:
+        result = time_request(session, url, params)
+        requests_ += 1
+        total_bytes += result["bytes"]
+        objects += len(result["body"]["objects"])
+        if not result["body"]["next_cursor"]:
+            break
+        params = {**params, "cursor": result["body"]["next_cursor"]}
+    return {
+        "query": "all_pages",
+        "params": {**params, "cursor": None},
+        "requests": requests_,
+        "bytes": total_bytes,
+        "objects": objects,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def run_scene(objects: int, repeats: int) -> List[Dict[str, Any]]:
+    results = []
+    with serve_scene(objects) as api_url, requests.Session() as session:
+        url = f"{api_url}/scene_graph"
+        for name, params in QUERIES.items():
+            runs = [time_request(session, url, params) for _ in range(repeats)]
+            warm = [run["seconds"] for run in runs[1:]] or [runs[0]["seconds"]]
+            results.append(
+                {
+                    "scene_objects": objects,
+                    "query": name,
+                    "params": params,
+                    "bytes": runs[0]["bytes"],
+                    "objects": len(runs[0]["body"]["objects"]),
+                    "total": runs[0]["body"]["total"],
+                    "first_ms": round(runs[0]["seconds"] * 1000, 3),
+                    "cached_p50_ms": round(statistics.median(warm) * 1000, 3),
+                }
+            )
+            print(json.dumps(results[-1]), file=sys.stderr)
+        results.append({"scene_objects": objects, **page_through(session, url)})
+    return results
+
+
+def run(scene_sizes: List[int], repeats: int) -> Dict[str, Any]:
+    results = []
+    for objects in scene_sizes:
+        results += run_scene(objects, repeats)
+    return {"commit": get_commit(), "repeats": repeats, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scene-size", type=int, action="append", help="Default: 1000 and 10000"
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.scene_size or [1000, 10000], args.repeats)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,47 @@
+"""Synthetic main.py payloads used by the benchmarks."""
+
+import random
+from typing import Any, Dict, List
+
+OBJECT_TYPES = ["MESH", "MESH", "MESH", "LIGHT", "CAMERA", "EMPTY"]
+
+
+def make_vector(rng: random.Random, default: float) -> Dict[str, float]:
+    if rng.random() < 0.3:
+        return {"x": default, "y": default, "z": default}
+    return {
+        "x": rng.uniform(-10, 10),
+        "y": rng.uniform(-10, 10),
+        "z": rng.uniform(-10, 10),
+    }
+
+
+def make_objects(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Build count BlenderObject dicts with Blender style names (Cube.001, ...)."""
+    rng = random.Random(seed)
+    objects = []
+    for index in range(count):
+        name = "Cube" if index == 0 else f"Cube.{index:03d}"
+        objects.append(
+            {
+                "id": name,
+                "name": name,
+                "type": rng.choice(OBJECT_TYPES),
+                "object_transform": {
+                    "location": make_vector(rng, 0.0),
+                    "rotation": make_vector(rng, 0.0),
+                    "scale": make_vector(rng, 1.0),
+                },
+            }
+        )
+    return objects
+
+
+def make_operation_result(count: int, seed: int = 0) -> Dict[str, Any]:
+    """Build an OperationResult payload as returned by POST /add_cube."""
+    objects = make_objects(count, seed)
+    return {
+        "message": "Cube added",
+        "active_object": objects[-1],
+        "scene_graph": {"objects": objects},
+    }
@@ -0,0 +1,118 @@
+"""Benchmark the orchestrator's prompt size over the steps of a long task.
+
+Every step of the task plans and then executes a change to a scene of
+--objects objects whose observation lists the whole scene, as when the
+controller was asked for the scene graph. Reports the prompt tokens of the
+orchestrator at every step with the scratchpad bounded by
+custom_memory.bound_intermediate_steps and unbounded, and with --model the
+latency of the last prompt of both on Ollama.
+
+    python -m benchmarks.scratchpad --steps 12 --objects 50
+"""
+
+import argparse
+import json
+import time
+
+from langchain.chains.llm import LLMChain
+from langchain_core.agents import AgentAction
+from langchain_core.prompts import PromptTemplate
+
+from benchmarks.scenes import make_operation_result
+from custom_memory import SCRATCHPAD_MAX_TOKENS
+from custom_ollama import CustomLLM, model_name
+from custom_planner import BoundedZeroShotAgent
+from custom_planner_prompt import API_ORCHESTRATOR_PROMPT
+from custom_response import estimate_tokens, summarize_response
+
+
+def make_steps(count: int, objects: int):
+    """count planner and controller steps, each observing the whole scene."""
+    scene = summarize_response(make_operation_result(objects), "scene graph")
+    steps = []
+    for index in range(count):
+        query = f"move Object{index} up by 1"
+        plan = f'1. POST /move_object?name=Object{index} {{"x": 0, "y": 0, "z": 1}}'
+        if index % 2 == 0:
+            log = f"Thought: I should plan.\nAction: api_planner\nAction Input: {query}"
+            steps.append((AgentAction("api_planner", query, log), plan))
+        else:
+            log = f"Thought: I'm ready.\nAction: api_controller\nAction Input: {plan}"
+            steps.append((AgentAction("api_controller", plan, log), scene))
+    return steps
+
+
+def create_agent(max_scratchpad_tokens: int) -> BoundedZeroShotAgent:
+    prompt = PromptTemplate(
+        template=API_ORCHESTRATOR_PROMPT,
+        input_variables=["input", "agent_scratchpad"],
+        partial_variables={
+            "tool_names": "api_planner, api_controller",
+            "tool_descriptions": "api_planner: plans\napi_controller: executes",
+            "history": "",
+        },
+    )
+    return BoundedZeroShotAgent(
+        # Only formats prompts, the model is never called.
+        llm_chain=LLMChain(llm=CustomLLM(model=model_name), prompt=prompt),
+        allowed_tools=["api_planner", "api_controller"],
+        max_scratchpad_tokens=max_scratchpad_tokens,
+    )
+
+
+def format_prompt(agent: BoundedZeroShotAgent, steps) -> str:
+    inputs = agent.get_full_inputs(steps, input="Tidy up the scene")
+    return agent.llm_chain.prompt.format(**inputs)
+
+
+def time_generation(model: str, prompt: str) -> float:
+    import ollama
+
+    start = time.perf_counter()
+    ollama.generate(model=model, prompt=prompt, options={"num_predict": 32})
+    return time.perf_counter() - start
+
+
+def run(steps, objects, max_tokens, model=None):
+    task = make_steps(steps, objects)
+    agents = {
+        "bounded": create_agent(max_tokens),
+        "unbounded": create_agent(10**9),
+    }
+    results = []
+    for step in range(steps + 1):
+        result = {"step": step}
+        for name, agent in agents.items():
+            start = time.perf_counter()
+            prompt = format_prompt(agent, task[:step])
+            result[f"{name}_tokens"] = estimate_tokens(prompt)
+            result[f"{name}_format_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        results.append(result)
+    report = {
+        "objects": objects,
+        "max_scratchpad_tokens": max_tokens,
+        "steps": results,
+    }
+    if model:
+        for name, agent in agents.items():
+            report[f"{name}_last_prompt_latency_s"] = time_generation(
+                model, format_prompt(agent, task)
+            )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=12)
+    parser.add_argument("--objects", type=int, default=50)
+    parser.add_argument("--max-tokens", type=int, default=SCRATCHPAD_MAX_TOKENS)
+    parser.add_argument("--model", help="Ollama model for end-to-end latency")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.steps, args.objects, args.max_tokens, args.model)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
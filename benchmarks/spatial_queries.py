@@ -0,0 +1,193 @@
+"""Latency of main.py's spatial index against linear scans, and of its updates.
+
+For every scene size, populates an in-process main.py (benchmarks.blender_api,
+with benchmarks.fake_bpy if bpy is not installed) with that many cubes and
+measures:
+
+- the build of main.spatial_index from bpy, and the incremental update after
+  moving one object (main.mark_scene_changed with its name), which replaces
+  a rebuild on every mutation;
+- nearest neighbours, radius, box and overlap queries at random points, with
+  the index and with a linear scan over every bounding box, and whether they
+  returned the same objects;
+- the response bytes and latency of the /spatial endpoints, next to those of
+  the full /scene_graph an agent would otherwise read.
+
+    python -m benchmarks.spatial_queries --scene-size 1000 --scene-size 10000
+"""
+
+import argparse
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from benchmarks.blender_api import BlenderAPI
+from benchmarks.replay import get_commit
+from custom_spatial import SpatialIndex, contains, get_distance, intersects, touches
+
+
+def get_p50_ms(function: Callable[[], Any], repeats: int) -> float:
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return round(statistics.median(seconds) * 1000, 4)
+
+
+def scan_nearest(index: SpatialIndex, point, k: int):
+    distances = [(name, get_distance(point, box)) for name, box in index.boxes.items()]
+    return sorted(distances, key=lambda item: (item[1], item[0]))[:k]
+
+
+def scan_radius(index: SpatialIndex, point, radius: float):
+    matches = [(name, get_distance(point, box)) for name, box in index.boxes.items()]
+    return sorted(
+        ((name, distance) for name, distance in matches if distance <= radius),
+        key=lambda match: (match[1], match[0]),
+    )
+
+
+def scan_box(index: SpatialIndex, box, contained: bool):
+    check = contains if contained else touches
+    return sorted(name for name, other in index.boxes.items() if check(box, other))
+
+
+def scan_overlaps(index: SpatialIndex):
+    return sorted(
+        (a, b)
+        for a, b in itertools.combinations(sorted(index.boxes), 2)
+        if intersects(index.boxes[a], index.boxes[b])
+    )
+
+
+def compare_queries(
+    api: BlenderAPI, rng: random.Random, repeats: int
+) -> List[Dict[str, Any]]:
+    index = api.main.get_spatial_index()
+    extent = max(abs(value) for box in index.boxes.values() for value in box[1])
+
+    def random_point():
+        return tuple(rng.uniform(-extent, extent) for _ in range(3))
+
+    point, box_point = random_point(), random_point()
+    box = (box_point, tuple(value + 5 for value in box_point))
+    queries = {
+        "nearest_k10": (
+            lambda: index.nearest(point, 10),
+            lambda: scan_nearest(index, point, 10),
+        ),
+        "radius_5": (
+            lambda: index.query_radius(point, 5),
+            lambda: scan_radius(index, point, 5),
+        ),
+        "box_5": (
+            lambda: index.query_box(box),
+            lambda: scan_box(index, box, False),
+        ),
+        "box_5_contained": (
+            lambda: index.query_box(box, True),
+            lambda: scan_box(index, box, True),
+        ),
+    }
+    if len(index) <= 2000:
+        # The pairwise scan is quadratic.
+        queries["overlaps"] = (index.overlaps, lambda: scan_overlaps(index))
+    results = []
+    for name, (indexed, scan) in queries.items():
+        results.append(
+            {
+                "query": name,
+                "matches": len(indexed()),
+                "same_result": indexed() == scan(),
+                "index_p50_ms": get_p50_ms(indexed, repeats),
+                "scan_p50_ms": get_p50_ms(scan, max(1, repeats // 10)),
+            }
+        )
+    return results
+
+
+def measure_updates(api: BlenderAPI, rng: random.Random, repeats: int) -> Dict:
+    import bpy
+
+    def build():
+        api.main.mark_scene_changed()
+        api.main.get_spatial_index()
+
+    build_ms = get_p50_ms(build, max(1, repeats // 10))
+    obj = next(iter(bpy.data.objects))
+
+    def update():
+        obj.location = tuple(rng.uniform(-10, 10) for _ in range(3))
+        api.main.mark_scene_changed(obj.name)
+
+    return {"build_ms": build_ms, "update_p50_ms": get_p50_ms(update, repeats)}
+
+
+def measure_endpoints(api: BlenderAPI, repeats: int) -> List[Dict[str, Any]]:
+    endpoints = {
+        "/spatial/nearest": {"name": "Cube", "k": 10},
+        "/spatial/radius": {"name": "Cube", "radius": 5},
+        "/spatial/box": dict(min_x=0, min_y=0, min_z=0, max_x=5, max_y=5, max_z=5),
+        "/spatial/overlaps": {"name": "Cube"},
+        "/scene_graph": {},
+    }
+    results = []
+    with requests.Session() as session:
+        for path, params in endpoints.items():
+
+            def get():
+                response = session.get(api.url + path, params=params, timeout=600)
+                response.raise_for_status()
+                return response
+
+            results.append(
+                {
+                    "endpoint": path,
+                    "bytes": len(get().content),
+                    "p50_ms": get_p50_ms(get, repeats),
+                }
+            )
+    return results
+
+
+def run(scene_sizes: List[int], repeats: int, seed: int) -> Dict[str, Any]:
+    results = []
+    with BlenderAPI() as api:
+        for objects in scene_sizes:
+            rng = random.Random(seed)
+            api.reset()
+            api.populate(objects, seed)
+            result = {
+                "scene_objects": objects,
+                **measure_updates(api, rng, repeats),
+                "queries": compare_queries(api, rng, repeats),
+                "endpoints": measure_endpoints(api, repeats),
+            }
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return {"commit": get_commit(), "repeats": repeats, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scene-size", type=int, action="append", help="Default: 1000 and 10000"
+    )
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.scene_size or [1000, 10000], args.repeats, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
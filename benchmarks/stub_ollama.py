@@ -0,0 +1,338 @@
+"""A local stand-in for the Ollama HTTP API with a simple latency model.
+
+The stub answers /api/generate, /api/show, /api/pull and /api/tags, and like
+an OpenAI-compatible server /v1/completions and /v1/models. Latency follows
+what matters for our agent:
+
+- pulling a model costs pull_seconds,
+- loading a model that is not resident costs load_seconds; a model stays
+  resident for the request's keep_alive (default 5m, like Ollama),
+- prompt evaluation costs prompt_token_seconds per token, except for the
+  longest prefix shared with one of the model's cached slots (like
+  llama.cpp's prompt cache, run Ollama with OLLAMA_NUM_PARALLEL for several
+  slots),
+- every generated token costs token_seconds,
+- both scaled by the model's factor in model_speeds, e.g. 0.3 for a small
+  model.
+
+Completions come from a callable, so benchmarks can replay recorded sessions.
+Set unavailable to answer every request with 503, or stall_seconds to hang
+before answering, to test failover (see custom_backends).
+
+    python -m benchmarks.stub_ollama --port 11435
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+def tokenize(text: str) -> List[int]:
+    return [hash(token) & 0xFFFFFF for token in TOKEN_PATTERN.findall(text)]
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def parse_keep_alive(value) -> float:
+    """Convert an Ollama keep_alive ("5m", "30s", 0, -1) to seconds."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", str(value))
+    if not match:
+        return 300.0
+    number = float(match.group(1))
+    if number < 0:
+        return float("inf")
+    return number * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+
+
+def default_completion(prompt: str) -> str:
+    return "Thought: I am finished executing the plan.\nFinal Answer: Done."
+
+
+class StubOllama:
+    """Threaded stub server, use as a context manager or with start()/stop()."""
+
+    def __init__(
+        self,
+        port: int = 0,
+        models: Optional[List[str]] = None,
+        completion: Callable[[str], str] = default_completion,
+        load_seconds: float = 2.0,
+        pull_seconds: float = 0.0,
+        prompt_token_seconds: float = 0.0005,
+        token_seconds: float = 0.01,
+        slots: int = 1,
+        model_speeds: Optional[Dict[str, float]] = None,
+    ):
+        self.models = set(["mistral:instruct"] if models is None else models)
+        self.completion = completion
+        self.load_seconds = load_seconds
+        self.pull_seconds = pull_seconds
+        self.prompt_token_seconds = prompt_token_seconds
+        self.token_seconds = token_seconds
+        self.slot_count = slots
+        self.slots: Dict[str, List[List[int]]] = {}
+        self.slot_used: Dict[str, List[float]] = {}
+        self.model_speeds = model_speeds or {}
+        self.resident_until: Dict[str, float] = {}
+        self.unavailable = False
+        self.stall_seconds = 0.0
+        self.stats = {"requests": 0, "loads": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllama":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubOllama":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def get_speed(self, model: str) -> float:
+        return self.model_speeds.get(model, 1.0)
+
+    def evaluate_prompt(self, model: str, tokens: List[int], keep_alive) -> dict:
+        """Apply the load and prompt evaluation latency, return eval stats."""
+        with self.lock:
+            self.stats["requests"] += 1
+            start = time.perf_counter()
+            if self.resident_until.get(model, 0) < time.monotonic():
+                self.stats["loads"] += 1
+                self.slots[model] = [[] for _ in range(self.slot_count)]
+                self.slot_used[model] = [0.0] * self.slot_count
+                time.sleep(self.load_seconds)
+            load_duration = time.perf_counter() - start
+            slots, slot_used = self.slots[model], self.slot_used[model]
+
+            # Reuse the slot sharing the longest prefix, unless that is less
+            # than half of what it holds; then evict the least recently used.
+            slot = max(
+                range(len(slots)),
+                key=lambda index: common_prefix_length(slots[index], tokens),
+            )
+            cached = common_prefix_length(slots[slot], tokens)
+            if cached * 2 < len(slots[slot]):
+                slot = min(range(len(slots)), key=slot_used.__getitem__)
+                cached = common_prefix_length(slots[slot], tokens)
+            slot_used[slot] = time.monotonic()
+            time.sleep(
+                (len(tokens) - cached)
+                * self.prompt_token_seconds
+                * self.get_speed(model)
+            )
+            slots[slot] = list(tokens)
+            self.stats["prompt_tokens"] += len(tokens)
+            self.stats["cached_tokens"] += cached
+            self.resident_until[model] = time.monotonic() + parse_keep_alive(keep_alive)
+            return {
+                "slot": slot,
+                "load_duration": int(load_duration * 1e9),
+                "prompt_eval_count": len(tokens) - cached,
+            }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def send_json(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_chunk(self, body: dict) -> None:
+                data = json.dumps(body).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def send_event(self, body: dict) -> None:
+                data = b"data: " + json.dumps(body).encode() + b"\n\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def is_unavailable(self) -> bool:
+                time.sleep(stub.stall_seconds)
+                if stub.unavailable:
+                    self.send_json(503, {"error": "unavailable"})
+                return stub.unavailable
+
+            def do_GET(self):
+                if self.is_unavailable():
+                    return
+                if self.path.rstrip("/") == "/api/tags":
+                    models = [{"name": name} for name in sorted(stub.models)]
+                    return self.send_json(200, {"models": models})
+                if self.path.rstrip("/") == "/v1/models":
+                    models = [{"id": name} for name in sorted(stub.models)]
+                    return self.send_json(200, {"object": "list", "data": models})
+                self.send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                path = self.path.rstrip("/")
+                body = self.read_json()
+                if self.is_unavailable():
+                    return
+                model = body.get("model") or body.get("name")
+                if path == "/api/pull":
+                    time.sleep(stub.pull_seconds)
+                    stub.models.add(model)
+                    return self.send_json(200, {"status": "success"})
+                if path == "/api/show":
+                    if model not in stub.models:
+                        return self.send_json(
+                            404, {"error": f"model '{model}' not found"}
+                        )
+                    return self.send_json(200, {"modelfile": f"FROM {model}"})
+                if path == "/api/generate":
+                    return self.generate(model, body)
+                if path == "/v1/completions":
+                    options = {
+                        "num_predict": body.get("max_tokens"),
+                        "stop": body.get("stop"),
+                    }
+                    return self.generate(model, {**body, "options": options}, True)
+                self.send_json(404, {"error": "not found"})
+
+            def generate(self, model: str, body: dict, openai: bool = False) -> None:
+                if model not in stub.models:
+                    return self.send_json(404, {"error": f"model '{model}' not found"})
+                prompt = body.get("prompt") or ""
+                tokens = list(body.get("context") or []) + tokenize(prompt)
+                start = time.perf_counter()
+                stats = stub.evaluate_prompt(model, tokens, body.get("keep_alive"))
+
+                options = body.get("options") or {}
+                pieces = (
+                    TOKEN_PATTERN.findall(stub.completion(prompt)) if prompt else []
+                )
+                num_predict = options.get("num_predict")
+                if num_predict is not None and num_predict >= 0:
+                    pieces = pieces[:num_predict]
+                text = "".join(pieces)
+                for stop in options.get("stop") or []:
+                    if stop and stop in text:
+                        text = text[: text.index(stop)]
+                        pieces = TOKEN_PATTERN.findall(text)
+
+                final = {
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "response": "",
+                    "done": True,
+                    "context": tokens + tokenize(text),
+                    "prompt_eval_count": stats["prompt_eval_count"],
+                    "eval_count": len(pieces),
+                    "load_duration": stats["load_duration"],
+                }
+                if openai:
+                    final = {"model": model, "choices": [{"text": text}]}
+                if not body.get("stream", not openai):
+                    time.sleep(len(pieces) * stub.token_seconds * stub.get_speed(model))
+                    if not openai:
+                        final["response"] = text
+                        final["total_duration"] = int(
+                            (time.perf_counter() - start) * 1e9
+                        )
+                    return self.send_json(200, final)
+
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "text/event-stream" if openai else "application/x-ndjson",
+                )
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for piece in pieces:
+                        time.sleep(stub.token_seconds * stub.get_speed(model))
+                        if openai:
+                            self.send_event(
+                                {"model": model, "choices": [{"text": piece}]}
+                            )
+                            continue
+                        self.send_chunk(
+                            {
+                                "model": model,
+                                "created_at": datetime.now(timezone.utc).isoformat(),
+                                "response": piece,
+                                "done": False,
+                            }
+                        )
+                    if openai:
+                        data = b"data: [DONE]\n\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    else:
+                        final["total_duration"] = int(
+                            (time.perf_counter() - start) * 1e9
+                        )
+                        self.send_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading, e.g. after the first token.
+                    self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", action="append", default=None)
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--slots", type=int, default=1)
+    args = parser.parse_args()
+
+    stub = StubOllama(
+        port=args.port,
+        models=args.model,
+        load_seconds=args.load_seconds,
+        slots=args.slots,
+    )
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,270 @@
+"""Tracing of agent runs in the language server, see custom_tracing.
+
+TracingCallback turns the callbacks of a run into spans: the whole agent
+run, every LLM call (with its chain, token counts and time-to-first-token) and
+every tool call, e.g. the api_planner, the api_controller and its requests tools.
+TracedRequestsWrapper times the HTTP calls to main.py and sends them the
+correlation id of the run.
+"""
+
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from uuid import UUID
+
+import requests
+from langchain_community.utilities.requests import Requests, RequestsWrapper
+from langchain_core.callbacks.base import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from custom_planner_prompt import (
+    API_CONTROLLER_PROMPT,
+    API_ORCHESTRATOR_PROMPT,
+    API_PLANNER_PROMPT,
+    PARSING_GET_PROMPT,
+    STRUCTURED_AGENT_PROMPT,
+)
+from custom_response import estimate_tokens
+from custom_tracing import CORRELATION_HEADER, Tracer, correlation_id
+
+LLM_CHAINS = {
+    "orchestrator": API_ORCHESTRATOR_PROMPT,
+    "planner": API_PLANNER_PROMPT,
+    "controller": API_CONTROLLER_PROMPT,
+    "parser": PARSING_GET_PROMPT.template,
+    "structured": STRUCTURED_AGENT_PROMPT,
+}
+"""Chains of the agents by the template their prompts start with."""
+
+
+def get_llm_chain(prompt: str) -> str:
+    """Name of the chain a prompt was formatted for, "other" if unknown."""
+    for chain, template in LLM_CHAINS.items():
+        if prompt.startswith(template.split("\n", 1)[0]):
+            return chain
+    return "other"
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Records spans for agent runs, LLM calls and tool calls.
+
+    Pass it with the callbacks of an invocation, so it is inherited by the
+    nested chains, LLMs and tools. Spans without a correlation id get the run
+    id of the top-level run as their trace id.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans: Dict[UUID, Dict[str, Any]] = {}
+        self._trace_ids: Dict[UUID, str] = {}
+
+    def _get_trace_id(self, run_id: UUID, parent_run_id: Optional[UUID]) -> str:
+        trace_id = (
+            correlation_id.get() or self._trace_ids.get(parent_run_id) or run_id.hex
+        )
+        self._trace_ids[run_id] = trace_id
+        return trace_id
+
+    def _start(
+        self,
+        stage: str,
+        name: str,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        **attributes: Any,
+    ) -> None:
+        self._spans[run_id] = self.tracer.start_span(
+            stage,
+            name,
+            span_id=run_id.hex,
+            parent_id=parent_run_id.hex if parent_run_id else None,
+            trace_id=self._get_trace_id(run_id, parent_run_id),
+            **attributes,
+        )
+
+    def _end(
+        self, run_id: UUID, error: Optional[BaseException] = None, **attributes: Any
+    ) -> None:
+        self._trace_ids.pop(run_id, None)
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span["attributes"].update(attributes)
+            self.tracer.end_span(span, error)
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        if parent_run_id is None:
+            name = kwargs.get("name") or serialized.get("id", ["agent"])[-1]
+            self._start("agent", name, run_id, None)
+        else:
+            # Nested chains only pass the trace id on to their LLM calls.
+            self._get_trace_id(run_id, parent_run_id)
+
+    def on_chain_end(
+        self,
+        outputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        self._end(run_id)
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        self._end(run_id, error)
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        model = (kwargs.get("invocation_params") or {}).get("model")
+        self._start(
+            "llm",
+            model or serialized.get("id", ["llm"])[-1],
+            run_id,
+            parent_run_id,
+            chain=get_llm_chain(prompts[0]) if prompts else "other",
+            prompt_tokens=sum(estimate_tokens(prompt) for prompt in prompts),
+        )
+
+    def on_llm_new_token(
+        self,
+        token: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        span = self._spans.get(run_id)
+        if span is not None and "ttft_ms" not in span["attributes"]:
+            span["attributes"]["ttft_ms"] = round(self.tracer.elapsed_ms(span), 3)
+
+    def on_llm_end(
+        self,
+        response: LLMResult,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        generations = [g for gs in response.generations for g in gs]
+        # Ollama reports the prompt tokens it evaluated, prompt cache hits excluded.
+        infos = [g.generation_info or {} for g in generations]
+        self._end(
+            run_id,
+            completion_tokens=sum(
+                info.get("eval_count", estimate_tokens(g.text))
+                for g, info in zip(generations, infos)
+            ),
+            prompt_eval_tokens=sum(info.get("prompt_eval_count", 0) for info in infos)
+            or None,
+        )
+
+    def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        self._end(run_id, error)
+
+    def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        name = serialized.get("name", "tool")
+        self._start(f"tool.{name}", name, run_id, parent_run_id)
+
+    def on_tool_end(
+        self,
+        output: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        self._end(run_id)
+
+    def on_tool_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> Any:
+        self._end(run_id, error)
+
+
+class TracedRequests(Requests):
+    """Requests recording an http span per call."""
+
+    tracer: Optional[Any] = None
+
+    def _traced(self, method: str, url: str, send, *args, **kwargs):
+        if self.tracer is None:
+            return send(url, *args, **kwargs)
+        path = urlsplit(url).path
+        with self.tracer.span("http", f"{method} {path}", url=url) as span:
+            response: requests.Response = send(url, *args, **kwargs)
+            span["attributes"]["status_code"] = response.status_code
+            span["attributes"]["response_bytes"] = len(response.content)
+            return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self._traced("GET", url, super().get, **kwargs)
+
+    def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self._traced("POST", url, super().post, data, **kwargs)
+
+    def patch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self._traced("PATCH", url, super().patch, data, **kwargs)
+
+    def put(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        return self._traced("PUT", url, super().put, data, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self._traced("DELETE", url, super().delete, **kwargs)
+
+
+class TracedRequestsWrapper(RequestsWrapper):
+    """RequestsWrapper sending the correlation id and tracing its calls."""
+
+    tracer: Optional[Any] = None
+
+    @property
+    def requests(self) -> Requests:
+        headers = dict(self.headers or {})
+        if correlation_id.get():
+            headers[CORRELATION_HEADER] = correlation_id.get()
+        return TracedRequests(
+            headers=headers,
+            aiosession=self.aiosession,
+            auth=self.auth,
+            tracer=self.tracer,
+        )
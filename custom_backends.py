@@ -0,0 +1,361 @@
+"""Pool of LLM servers behind CustomLLM, for throughput and availability.
+
+CustomLLM used to send every request to the one Ollama server of its
+base_url, with a new HTTP connection per request. With a BackendPool it
+sends each request to the backend with the fewest requests in flight (its
+queue depth), over a persistent connection per backend, so the agent's
+throughput grows with the number of servers.
+
+Backends are Ollama servers or OpenAI-compatible servers (vLLM, llama.cpp's
+server, ...), whose /v1/completions stream is translated to Ollama's. A
+backend that does not connect or answer within its timeout, or answers with
+a server error, is marked unhealthy and the request fails over to the next
+one; unhealthy backends are skipped until a health check or, after
+RETRY_AFTER seconds, a request succeeds again. Failures after the response
+started streaming are raised, as the tokens were already passed on.
+"""
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from custom_metrics import (
+    llm_backend_healthy,
+    llm_backend_in_flight,
+    llm_backend_requests,
+)
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+CONNECT_TIMEOUT = 3.0
+"""Seconds to connect to a backend before failing over."""
+HEALTH_CHECK_INTERVAL = 10.0
+"""Seconds between health checks of the backends."""
+RETRY_AFTER = 30.0
+"""Seconds an unhealthy backend is skipped before requests try it again."""
+MAX_CONNECTIONS = 8
+"""Persistent connections kept per backend."""
+
+pinned_backend: contextvars.ContextVar[Optional["Backend"]] = contextvars.ContextVar(
+    "pinned_backend", default=None
+)
+"""Backend the requests of the current context must go to, see BackendPool.pin."""
+
+
+class Backend:
+    """An Ollama or OpenAI-compatible server with its own connection pool."""
+
+    def __init__(
+        self,
+        url: str,
+        kind: str = "ollama",
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_connections: int = MAX_CONNECTIONS,
+    ):
+        """
+        Args:
+            kind: "ollama" or "openai" for an OpenAI-compatible server.
+            model: Name of the model on this backend, if it differs from the
+                model of the request, e.g. on an OpenAI-compatible server.
+        """
+        if kind not in ("ollama", "openai"):
+            raise ValueError(f"Unknown backend kind {kind!r}")
+        self.url = url.rstrip("/")
+        self.kind = kind
+        self.model = model
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.in_flight = 0
+        self.healthy = True
+        self.failed_at = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def __repr__(self) -> str:
+        return f"Backend({self.url!r}, kind={self.kind!r})"
+
+    def post(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: Tuple[float, Optional[float]],
+    ) -> requests.Response:
+        """Send an Ollama request, translated for OpenAI-compatible servers."""
+        if self.kind == "openai":
+            path, payload = "/v1/completions", to_openai_completion(payload)
+            if self.api_key:
+                headers = {**headers, "Authorization": f"Bearer {self.api_key}"}
+        if self.model:
+            payload = {**payload, "model": self.model}
+        return self.session.post(
+            self.url + path, json=payload, headers=headers, stream=True, timeout=timeout
+        )
+
+    def iter_lines(self, response: requests.Response) -> Iterator[str]:
+        """The streamed lines of a response, as Ollama's /api/generate sends them."""
+        lines = response.iter_lines(decode_unicode=True)
+        if self.kind == "ollama":
+            yield from lines
+        else:
+            yield from from_openai_stream(lines)
+
+    def check_health(self, timeout: float = CONNECT_TIMEOUT) -> bool:
+        path = "/api/tags" if self.kind == "ollama" else "/v1/models"
+        try:
+            response = self.session.get(self.url + path, timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+
+def to_openai_completion(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """An OpenAI /v1/completions request for an Ollama /api/generate payload."""
+    options = payload.get("options") or {}
+    request = {
+        "model": payload.get("model"),
+        "prompt": payload.get("prompt") or "",
+        "stream": True,
+        "stop": options.get("stop") or None,
+        "temperature": options.get("temperature"),
+        "top_p": options.get("top_p"),
+    }
+    if (options.get("num_predict") or -1) >= 0:
+        request["max_tokens"] = options["num_predict"]
+    return {key: value for key, value in request.items() if value is not None}
+
+
+def from_openai_stream(lines: Iterator[str]) -> Iterator[str]:
+    """Ollama stream lines for the server-sent events of an OpenAI completion."""
+    completion_tokens = 0
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        text = "".join(choice.get("text") or "" for choice in chunk.get("choices", []))
+        if text:
+            completion_tokens += 1
+            yield json.dumps({"response": text, "done": False})
+    yield json.dumps({"response": "", "done": True, "eval_count": completion_tokens})
+
+
+class BackendPool:
+    """Spreads requests over backends by queue depth, with health checks."""
+
+    def __init__(
+        self,
+        backends: Sequence[Union[str, Backend]],
+        connect_timeout: float = CONNECT_TIMEOUT,
+        retry_after: float = RETRY_AFTER,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+    ):
+        """
+        Args:
+            backends: Backends or the urls of Ollama servers.
+        """
+        if not backends:
+            raise ValueError("A backend pool needs at least one backend")
+        self.backends = [
+            backend if isinstance(backend, Backend) else Backend(backend)
+            for backend in backends
+        ]
+        self.connect_timeout = connect_timeout
+        self.retry_after = retry_after
+        self.health_check_interval = health_check_interval
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for backend in self.backends:
+            llm_backend_healthy.set(1, backend=backend.url)
+            llm_backend_in_flight.set(0, backend=backend.url)
+
+    def select(
+        self,
+        exclude: Sequence[Backend] = (),
+        kinds: Sequence[str] = ("ollama", "openai"),
+    ) -> Optional[Backend]:
+        """The available backend with the fewest requests in flight.
+
+        Ties go round robin. Unhealthy backends are only selected after
+        retry_after seconds, or when no other backend is left.
+        """
+        with self._lock:
+            candidates = [
+                backend
+                for backend in self.backends
+                if backend not in exclude and backend.kind in kinds
+            ]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            available = [
+                backend
+                for backend in candidates
+                if backend.healthy or now - backend.failed_at >= self.retry_after
+            ]
+            if not available:
+                # Better a backend that failed than no answer at all.
+                return min(candidates, key=lambda backend: backend.failed_at)
+            self._next = (self._next + 1) % len(self.backends)
+            order = {
+                backend: (index - self._next) % len(self.backends)
+                for index, backend in enumerate(self.backends)
+            }
+            return min(
+                available, key=lambda backend: (backend.in_flight, order[backend])
+            )
+
+    def _acquire(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+            llm_backend_in_flight.set(backend.in_flight, backend=backend.url)
+
+    def release(self, backend: Backend, response: Optional[requests.Response]) -> None:
+        """Give back a backend and the connection of its response."""
+        if response is not None:
+            response.close()
+        with self._lock:
+            backend.in_flight -= 1
+            llm_backend_in_flight.set(backend.in_flight, backend=backend.url)
+
+    def mark(self, backend: Backend, healthy: bool) -> None:
+        with self._lock:
+            if not healthy:
+                backend.failures += 1
+                backend.failed_at = time.monotonic()
+            if healthy != backend.healthy:
+                logging.log(
+                    logging.INFO if healthy else logging.WARNING,
+                    f"LLM backend {backend.url} is {'up' if healthy else 'down'}",
+                )
+            backend.healthy = healthy
+        llm_backend_healthy.set(float(healthy), backend=backend.url)
+
+    def post(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[Backend, requests.Response]:
+        """Send a request to the best backend, failing over to the others.
+
+        Args:
+            url: Url of the request on any backend, only its path is used.
+            timeout: Seconds to wait for the response to start, e.g. while the
+                model loads and evaluates the prompt.
+
+        Returns:
+            The backend and its response, to be passed to iter_lines, or to
+            release if the response is not read.
+        """
+        path = urlsplit(url).path
+        # Only Ollama can continue the context of an earlier response.
+        kinds = ("ollama",) if payload.get("context") else ("ollama", "openai")
+        pinned = pinned_backend.get()
+        tried: List[Backend] = []
+        errors: List[str] = []
+        while True:
+            backend = pinned if pinned is not None else self.select(tried, kinds)
+            if backend is None or backend in tried:
+                raise ConnectionError(f"No LLM backend answered: {'; '.join(errors)}")
+            tried.append(backend)
+            self._acquire(backend)
+            try:
+                response = backend.post(
+                    path, payload, headers or {}, (self.connect_timeout, timeout)
+                )
+            except requests.RequestException as e:
+                error = f"{backend.url}: {type(e).__name__}"
+                response = None
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    self.mark(backend, True)
+                    llm_backend_requests.inc(backend=backend.url, result="ok")
+                    return backend, response
+                error = f"{backend.url}: status {response.status_code}"
+            self.release(backend, response)
+            self.mark(backend, False)
+            llm_backend_requests.inc(backend=backend.url, result="failed")
+            logging.log(logging.WARNING, f"LLM backend failed, {error}")
+            errors.append(error)
+
+    def iter_lines(
+        self, backend: Backend, response: requests.Response
+    ) -> Iterator[str]:
+        """Stream the lines of a response, then release its backend."""
+        try:
+            yield from backend.iter_lines(response)
+        except requests.RequestException:
+            self.mark(backend, False)
+            raise
+        finally:
+            self.release(backend, response)
+
+    @contextmanager
+    def pin(self, backend: Backend) -> Iterator[None]:
+        """Send the requests of the block to backend, e.g. to warm it up."""
+        token = pinned_backend.set(backend)
+        try:
+            yield
+        finally:
+            pinned_backend.reset(token)
+
+    def check_health(self) -> Dict[str, bool]:
+        """Check every backend now, return whether each is healthy."""
+        results = {}
+        for backend in self.backends:
+            results[backend.url] = backend.check_health(self.connect_timeout)
+            self.mark(backend, results[backend.url])
+        return results
+
+    def _check_health_periodically(self) -> None:
+        while not self._stopped.wait(self.health_check_interval):
+            self.check_health()
+
+    def start(self) -> "BackendPool":
+        """Check the backends' health every health_check_interval seconds."""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._check_health_periodically, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "url": backend.url,
+                    "kind": backend.kind,
+                    "healthy": backend.healthy,
+                    "in_flight": backend.in_flight,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                }
+                for backend in self.backends
+            ]
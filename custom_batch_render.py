@@ -0,0 +1,180 @@
+"""Batch renders of several views and frames by a pool of Blender processes.
+
+POST /render_scene renders the current frame from the scene camera, inside
+main.py's process, where bpy renders one image at a time and blocks the
+event loop meanwhile. A batch (views x frames) goes to a RenderPool instead:
+main.py saves the scene once per scene version into a snapshot .blend, the
+scene preparation all jobs share, and worker processes, each with its own
+bpy, open the snapshot once and render the jobs they are given, a frame from
+a view each, into files main.py serves from /static.
+
+Views are a camera of the snapshot, or the scene camera at another location
+and rotation; a worker restores the camera and frame after every job, so
+jobs do not leak into each other. Renders use all CPU threads by default, so
+each worker is limited to its share of them. No bpy import at module level:
+render_job imports it, in workers after the pool's initializer.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+MAX_JOBS = 256
+"""Views times frames a batch may render."""
+
+
+class RenderJob(NamedTuple):
+    """One image of a batch: a frame seen from a view."""
+
+    filepath: str
+    frame: Optional[int] = None
+    camera: Optional[str] = None
+    location: Optional[Tuple[float, float, float]] = None
+    rotation: Optional[Tuple[float, float, float]] = None
+    """Euler angles in degrees."""
+
+
+_snapshot: Optional[str] = None
+"""Snapshot the scene of this worker process was opened from."""
+_threads: Optional[int] = None
+"""Render threads of this worker process, None in main.py's."""
+
+
+def _start_worker(threads: int, initializer: Optional[Callable[[], None]]) -> None:
+    global _threads
+    if initializer is not None:
+        initializer()
+    _threads = threads
+
+
+def render_job(snapshot: Optional[str], job: RenderJob) -> float:
+    """Render job into its filepath, in a worker or in-process.
+
+    Args:
+        snapshot: The .blend file to render from, opened unless it is the one
+            this process has open; None renders the scene as it is.
+
+    Returns:
+        float: Seconds spent opening the snapshot and rendering.
+    """
+    import bpy
+
+    global _snapshot
+    start = time.perf_counter()
+    if snapshot is not None and snapshot != _snapshot:
+        bpy.ops.wm.open_mainfile(filepath=snapshot)
+        _snapshot = snapshot
+    scene = bpy.context.scene
+    if _threads is not None:
+        # Set per job: every snapshot opened brings its own render settings.
+        scene.render.threads_mode = "FIXED"
+        scene.render.threads = _threads
+    camera, frame = scene.camera, scene.frame_current
+    if job.camera is not None:
+        scene.camera = bpy.data.objects[job.camera]
+    view = scene.camera
+    if view is None:
+        raise ValueError("The scene has no camera")
+    transform = (tuple(view.location), tuple(view.rotation_euler))
+    try:
+        if job.location is not None:
+            view.location = job.location
+        if job.rotation is not None:
+            view.rotation_euler = tuple(math.radians(angle) for angle in job.rotation)
+        if job.frame is not None:
+            scene.frame_set(job.frame)
+        scene.render.filepath = job.filepath
+        scene.render.image_settings.file_format = "PNG"
+        bpy.ops.render.render(write_still=True)
+    finally:
+        view.location, view.rotation_euler = transform
+        scene.camera = camera
+        if job.frame is not None:
+            scene.frame_set(frame)
+    return time.perf_counter() - start
+
+
+class RenderPool:
+    """Worker processes rendering RenderJobs from snapshots of the scene."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            workers: Worker processes, by default one per 4 CPUs and at least 2.
+            initializer: Called first in every worker, before bpy is imported,
+                e.g. to choose the bpy module; must be picklable.
+        """
+        cpus = os.cpu_count() or 1
+        self.workers = workers or max(2, cpus // 4)
+        self.threads = max(1, cpus // self.workers)
+        """Render threads per worker."""
+        self.initializer = initializer
+        self.directory = tempfile.mkdtemp(prefix="blendchain-snapshots-")
+        self.version: Optional[int] = None
+        self.snapshot: Optional[str] = None
+        self._batches: Dict[str, int] = {}
+        """Batches rendering each snapshot."""
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def acquire_snapshot(self, version: int, save: Callable[[str], None]) -> str:
+        """The snapshot of scene version for a batch, saved with save(filepath)
+        unless it already was; pass it to release_snapshot after the batch."""
+        if version != self.version:
+            filepath = os.path.join(self.directory, f"scene-{version}.blend")
+            save(filepath)
+            previous, self.version, self.snapshot = self.snapshot, version, filepath
+            if previous is not None:
+                self._delete_unused(previous)
+        self._batches[self.snapshot] = self._batches.get(self.snapshot, 0) + 1
+        return self.snapshot
+
+    def release_snapshot(self, snapshot: str) -> None:
+        """A batch is done with snapshot, deleted once no batch renders it and
+        a newer version replaced it."""
+        if snapshot not in self._batches:
+            return  # The pool was closed meanwhile.
+        self._batches[snapshot] -= 1
+        self._delete_unused(snapshot)
+
+    def _delete_unused(self, snapshot: str) -> None:
+        if snapshot != self.snapshot and not self._batches.get(snapshot):
+            self._batches.pop(snapshot, None)
+            os.remove(snapshot)
+
+    def submit(self, snapshot: str, job: RenderJob) -> Future:
+        """Render job in a worker; the workers start with the first job."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                # fork would copy main.py's threads and Blender's state.
+                mp_context=get_context("spawn"),
+                initializer=_start_worker,
+                initargs=(self.threads, self.initializer),
+            )
+        try:
+            return self._executor.submit(render_job, snapshot, job)
+        except BrokenProcessPool:
+            self.restart()
+            raise
+
+    def restart(self) -> None:
+        """Drop the workers, e.g. after one crashed; new ones start on demand."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def close(self) -> None:
+        self.restart()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.version = self.snapshot = None
+        self._batches.clear()
@@ -0,0 +1,119 @@
+"""World-space bounding boxes and dimensions of many objects at once.
+
+The agent sees only an object's location, rotation and scale, so it guesses
+sizes and fixes overlaps with extra move and scale calls. BoundsCache gives
+every object its world-space axis-aligned bounding box and its dimensions,
+computed with NumPy for all objects in one pass: the 8 local corners of
+bound_box under matrix_world, with matrices and corners read in bulk by
+foreach_get when the collection supports it. The results are cached per
+object until main.mark_scene_changed invalidates it, after its transform
+or mesh changes, so a mutation costs one object and not the scene.
+
+Dimensions are those of Blender's Object.dimensions: the size of the local
+bounding box along the object's own axes, scaled by its world matrix.
+Objects without geometry (lights, cameras, empties) are points at their
+origin with zero dimensions. No bpy import: callers pass bpy objects.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+GEOMETRY_TYPES = {"MESH", "CURVE", "SURFACE", "META", "FONT"}
+"""Object types with a bound_box; the others count as points."""
+
+Bounds = Tuple[Tuple[float, ...], Tuple[float, ...], Tuple[float, ...]]
+"""Minimum and maximum corner of the world-space AABB, and the dimensions."""
+
+
+def compute_bounds(
+    matrices: np.ndarray, corners: np.ndarray, has_geometry: np.ndarray
+) -> np.ndarray:
+    """Bounds of n objects as an (n, 3, 3) array of min, max and dimensions.
+
+    Args:
+        matrices: (n, 4, 4) world matrices, rows first.
+        corners: (n, 8, 3) local bounding box corners.
+        has_geometry: (n,) False for objects that count as points.
+    """
+    corners = np.where(has_geometry[:, None, None], corners, 0.0)
+    points = (
+        np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners)
+        + matrices[:, None, :3, 3]
+    )
+    scale = np.linalg.norm(matrices[:, :3, :3], axis=1)
+    dimensions = (corners.max(axis=1) - corners.min(axis=1)) * scale
+    return np.stack((points.min(axis=1), points.max(axis=1), dimensions), axis=1)
+
+
+def read_objects(objects: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """World matrices and local corners of objects, one object at a time."""
+    matrices = np.array([[tuple(row) for row in obj.matrix_world] for obj in objects])
+    corners = np.array([[tuple(corner) for corner in obj.bound_box] for obj in objects])
+    return matrices.reshape(-1, 4, 4), corners.reshape(-1, 8, 3)
+
+
+def read_collection(collection: Any, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """World matrices and local corners of a whole collection with foreach_get,
+    e.g. bpy.data.objects, without a Python call per object."""
+    matrices = np.empty(count * 16, dtype=np.float32)
+    collection.foreach_get("matrix_world", matrices)
+    corners = np.empty(count * 24, dtype=np.float32)
+    collection.foreach_get("bound_box", corners)
+    # Blender stores matrices column by column.
+    matrices = matrices.reshape(count, 4, 4).transpose(0, 2, 1)
+    return matrices.astype(np.float64), corners.reshape(count, 8, 3).astype(np.float64)
+
+
+class BoundsCache:
+    """Bounds of objects by name, computed in bulk and kept until invalidated."""
+
+    def __init__(self):
+        self.bounds: Dict[str, Bounds] = {}
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def invalidate(self, names: Optional[Iterable[str]] = None) -> None:
+        """Forget the bounds of the named objects, or of all without names."""
+        if names is None:
+            self.bounds.clear()
+            return
+        for name in names:
+            self.bounds.pop(name, None)
+
+    def get(self, objects: Iterable[Any]) -> List[Bounds]:
+        """The bounds of objects in their order, computing the missing ones.
+
+        Args:
+            objects: bpy objects, or a collection like bpy.data.objects, read
+                with foreach_get when none of its objects is cached.
+        """
+        items = list(objects)
+        stale = [
+            index for index, obj in enumerate(items) if obj.name not in self.bounds
+        ]
+        if stale:
+            self._compute(objects, items, stale)
+        return [self.bounds[obj.name] for obj in items]
+
+    def _compute(self, objects: Any, items: List[Any], stale: List[int]) -> None:
+        arrays = None
+        if hasattr(objects, "foreach_get") and len(stale) == len(items):
+            try:
+                arrays = read_collection(objects, len(items))
+            except (AttributeError, RuntimeError, TypeError, ValueError):
+                # Not every collection or version of Blender supports it.
+                arrays = None
+        if arrays is None:
+            arrays = read_objects([items[index] for index in stale])
+        has_geometry = np.array(
+            [items[index].type in GEOMETRY_TYPES for index in stale], dtype=bool
+        )
+        bounds = compute_bounds(*arrays, has_geometry).tolist()
+        for index, (low, high, dimensions) in zip(stale, bounds):
+            self.bounds[items[index].name] = (
+                tuple(low),
+                tuple(high),
+                tuple(dimensions),
+            )
@@ -0,0 +1,311 @@
+"""Direct execution of well-formed plans from the API planner.
+
+A plan step like ``2. POST /move_object?name=Cube {"x": 0, "y": 0, "z": 2}``
+names the endpoint and all of its parameters, so running it needs an HTTP
+call, not another agent. PlanExecutor runs the leading steps of a plan that
+resolve completely against the OpenAPI spec and hands whatever is left to the
+controller agent.
+
+Steps that do not depend on each other run concurrently: reads commute with
+reads, adding objects commutes with adding objects, and changes to different
+objects commute with each other; see get_step_dependencies.
+"""
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec
+from langchain_community.utilities.requests import RequestsWrapper
+from langchain_core.pydantic_v1 import BaseModel
+
+from custom_response import compact_response, extract_response
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+STEP_PATTERN = re.compile(r"^\s*(?:\d+\s*[.)]|-|\*)\s*(.*)$")
+"""A numbered or bulleted line of the plan."""
+CALL_PATTERN = re.compile(r"\b(GET|POST|PUT|PATCH|DELETE)\s+(/[^\s{]*)")
+"""An API call in a plan step, e.g. POST /move_object?name=Cube."""
+MAX_STEP_RESPONSE_TOKENS = 500
+"""Token budget of each step's result in the executor's output."""
+CREATE_PATH_PATTERN = re.compile(r"/(add|create)_?\w*$")
+"""Endpoints that only add new objects to the scene, e.g. /add_cube."""
+NAME_PARAMETER_PATTERN = re.compile(r"(^|_)name$")
+"""Query parameters naming the object a step changes, e.g. name or object_name."""
+MAX_CONCURRENCY = 4
+"""Independent plan steps executed at the same time."""
+
+
+class PlanStep(BaseModel):
+    """A single API call parsed from the plan."""
+
+    text: str
+    method: Optional[str] = None
+    path: Optional[str] = None
+    endpoint: Optional[str] = None
+    params: Dict[str, Any] = {}
+    data: Optional[Dict[str, Any]] = None
+    resolved: bool = False
+    """Whether the endpoint and all of its required parameters are known."""
+
+
+def split_plan(plan_str: str) -> List[str]:
+    """Split a plan into its steps, continuation lines are kept with their step."""
+    steps: List[str] = []
+    for line in plan_str.strip().splitlines():
+        match = STEP_PATTERN.match(line)
+        if match or not steps:
+            steps.append(match.group(1) if match else line.strip())
+        elif line.strip():
+            steps[-1] += " " + line.strip()
+    return [step for step in steps if step]
+
+
+def find_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Return the first valid JSON object in the text."""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def find_parameter(name: str, text: str) -> Optional[str]:
+    """Find a value given as name=value, name: value or name "value" in the text."""
+    quoted = r"\"([^\"]+)\"|'([^']+)'|`([^`]+)`"
+    pattern = (
+        r"\b" + re.escape(name) + r"\b\s*"
+        r"(?:[=:]\s*(?:" + quoted + r"|([\w.\-]+))|(?:is\s+)?(?:" + quoted + r"))"
+    )
+    match = re.search(pattern, text)
+    if not match:
+        return None
+    return next(group for group in match.groups() if group is not None)
+
+
+def match_endpoint(
+    method: str, path: str, endpoints: List[Tuple[str, str, Dict[str, Any]]]
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Find the endpoint of a call, path parameters like {id} match any segment."""
+    for name, _, docs in endpoints:
+        parts = re.split(r"(\{[^}]*\})", name)
+        regex_name = "".join(
+            "[^/]+" if part.startswith("{") else re.escape(part) for part in parts
+        )
+        if re.fullmatch(regex_name, f"{method} {path}"):
+            return name, docs
+    return None
+
+
+def get_body_schema(docs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return (
+        docs.get("requestBody", {})
+        .get("content", {})
+        .get("application/json", {})
+        .get("schema")
+    )
+
+
+def resolve_step(
+    text: str, endpoints: List[Tuple[str, str, Dict[str, Any]]]
+) -> PlanStep:
+    """Parse a plan step and check that it can be executed without the LLM."""
+    calls = CALL_PATTERN.findall(text)
+    if len(calls) != 1:
+        return PlanStep(text=text)
+    method, route = calls[0]
+    path, _, query = route.partition("?")
+    step = PlanStep(text=text, method=method, path=path)
+
+    matched = match_endpoint(method, path, endpoints)
+    if matched is None:
+        return step
+    step.endpoint, docs = matched
+
+    # Text after the call, so the endpoint path does not match a parameter name.
+    details = text[text.index(route) + len(route) :]
+    params = dict(parse_qsl(query))
+    for parameter in docs.get("parameters", []):
+        name = parameter["name"]
+        if name not in params and parameter.get("in") == "query":
+            value = find_parameter(name, details)
+            if value is not None:
+                params[name] = value
+            elif parameter.get("required"):
+                return step
+    step.params = params
+
+    body_schema = get_body_schema(docs)
+    if body_schema is not None:
+        data = find_json_object(details)
+        required = body_schema.get("required", [])
+        if data is None or not set(required) <= data.keys():
+            return step
+        step.data = data
+
+    step.resolved = True
+    return step
+
+
+def get_step_kind(step: PlanStep) -> str:
+    """Classify a resolved step as a read, a create, an update or a scene change.
+
+    read: a GET. update: changes the objects named by its name or path
+    parameters, e.g. POST /move_object?name=Cube. create: adds objects without
+    naming one, e.g. POST /add_cube. scene: any other change, e.g.
+    POST /render_scene, including steps whose parameters name no object.
+    """
+    if step.method == "GET":
+        return "read"
+    if get_step_resources(step):
+        return "update"
+    if CREATE_PATH_PATTERN.search(step.path):
+        return "create"
+    return "scene"
+
+
+def get_step_resources(step: PlanStep) -> Set[str]:
+    """The objects a step names, in its name parameters or its path, lowercased
+    as the API matches names case-insensitively."""
+    resources = {
+        str(value).lower()
+        for name, value in step.params.items()
+        if NAME_PARAMETER_PATTERN.search(name)
+    }
+    template = step.endpoint.split(" ", 1)[1].split("/")
+    for template_segment, segment in zip(template, step.path.split("/")):
+        if template_segment.startswith("{"):
+            resources.add(segment.lower())
+    return resources
+
+
+def steps_conflict(a: PlanStep, b: PlanStep) -> bool:
+    """Whether the result of either step depends on the other one running first."""
+    kinds = {get_step_kind(a), get_step_kind(b)}
+    if kinds == {"read"} or kinds == {"create"}:
+        return False
+    if kinds == {"update"}:
+        return bool(get_step_resources(a) & get_step_resources(b))
+    return True
+
+
+def get_step_dependencies(steps: List[PlanStep]) -> List[Set[int]]:
+    """For each step, the earlier steps it has to wait for."""
+    return [
+        {j for j in range(i) if steps_conflict(steps[j], steps[i])}
+        for i in range(len(steps))
+    ]
+
+
+def schedule_steps(steps: List[PlanStep]) -> List[List[int]]:
+    """Group steps into waves; the steps of a wave are independent of each other.
+
+    Returns:
+        List[List[int]]: Indices of the steps of each wave, in execution order.
+    """
+    levels: List[int] = []
+    for dependencies in get_step_dependencies(steps):
+        levels.append(1 + max((levels[j] for j in dependencies), default=-1))
+    waves: List[List[int]] = [[] for _ in range(max(levels, default=-1) + 1)]
+    for index, level in enumerate(levels):
+        waves[level].append(index)
+    return waves
+
+
+class PlanExecutor:
+    """Executes resolved plan steps directly against the API."""
+
+    def __init__(
+        self,
+        api_spec: ReducedOpenAPISpec,
+        requests_wrapper: RequestsWrapper,
+        response_schemas: Dict[str, Dict[str, Any]],
+        max_concurrency: int = MAX_CONCURRENCY,
+    ):
+        self.api_spec = api_spec
+        self.base_url = api_spec.servers[0]["url"]
+        self.requests_wrapper = requests_wrapper
+        self.response_schemas = response_schemas
+        self.max_concurrency = max_concurrency
+
+    def parse(self, plan_str: str) -> List[PlanStep]:
+        return [
+            resolve_step(text, self.api_spec.endpoints) for text in split_plan(plan_str)
+        ]
+
+    def execute_step(self, step: PlanStep) -> Tuple[bool, str]:
+        """Run one step, returns whether it succeeded and a summary of the response."""
+        url = self.base_url + step.path
+        if step.params:
+            url += "?" + urlencode(step.params)
+        requests = self.requests_wrapper.requests
+        if step.method in ("GET", "DELETE"):
+            response = getattr(requests, step.method.lower())(url)
+        else:
+            response = getattr(requests, step.method.lower())(url, step.data or {})
+
+        summary = extract_response(response.text, step.text, self.response_schemas)
+        if summary is None:
+            summary = compact_response(
+                response.text, step.text, MAX_STEP_RESPONSE_TOKENS
+            )
+        return response.ok, summary
+
+    def execute(self, plan_str: str) -> Tuple[List[str], Optional[str]]:
+        """Execute the leading resolved steps of a plan.
+
+        Independent steps run concurrently, wave by wave; after a wave with a
+        failed step no further wave is started.
+
+        Returns:
+            Tuple[List[str], Optional[str]]: The results of the executed steps, and
+            the rest of the plan for the controller agent, or None if it is done.
+        """
+        steps = self.parse(plan_str)
+        leading = next(
+            (index for index, step in enumerate(steps) if not step.resolved),
+            len(steps),
+        )
+        outcomes: Dict[int, Tuple[bool, str]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for wave in schedule_steps(steps[:leading]):
+                logging.log(
+                    logging.INFO,
+                    "Executing plan steps directly: "
+                    + ", ".join(steps[index].text for index in wave),
+                )
+                # Run each step in a copy of this context, e.g. for tracing.
+                contexts = [copy_context() for _ in wave]
+                wave_outcomes = pool.map(
+                    lambda index, context: context.run(self.execute_step, steps[index]),
+                    wave,
+                    contexts,
+                )
+                outcomes.update(zip(wave, wave_outcomes))
+                if not all(outcomes[index][0] for index in wave):
+                    break
+
+        results = [
+            f"{index + 1}. {steps[index].method} {steps[index].path}: {summary}"
+            for index, (_, summary) in sorted(outcomes.items())
+        ]
+        # Failed steps are left to the controller, which can retry them.
+        pending = [
+            index
+            for index in range(len(steps))
+            if not outcomes.get(index, (False, ""))[0]
+        ]
+        if not pending:
+            return results, None
+        remaining = "\n".join(f"{index + 1}. {steps[index].text}" for index in pending)
+        return results, remaining
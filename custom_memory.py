@@ -0,0 +1,274 @@
+"""Bounded agent scratchpads and per-session memory of the orchestrator.
+
+Every step of an agent appends its action and observation to the
+agent_scratchpad of the next prompt, so long multi-step tasks produce ever
+longer prompts and slower generations. bound_intermediate_steps keeps the
+most recent steps verbatim and, once the scratchpad exceeds its token budget,
+summarizes the observations of older steps (object listings of scene graphs
+are reduced to their names, large JSON to counts) or omits them.
+
+SessionMemory remembers the queries and answers of a session, e.g. a
+conversation of a user, and the last scene the agent observed. Its history
+is added to the orchestrator prompt, so follow-up queries ("now move it up")
+need not rediscover the scene. Older exchanges are summarized to one line
+each and dropped to keep the history under a token budget. Sessions are
+persisted as JSON files and survive restarts.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.agents import AgentAction
+from langchain_core.memory import BaseMemory
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from custom_response import compact_response, estimate_tokens, truncate_to_tokens
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+SCRATCHPAD_MAX_TOKENS = 1200
+"""Token budget of an agent's scratchpad, Ollama's default context is 2048."""
+RECENT_STEPS = 2
+"""Steps whose observations are always kept verbatim."""
+OBSERVATION_SUMMARY_TOKENS = 80
+"""Token budget of the summary of an older step's observation."""
+OMITTED_OBSERVATION = "(omitted, see the later steps)"
+
+SESSION_DIR = Path.absolute(Path(__file__).parent) / ".sessions"
+"""Where the memory of every session is persisted."""
+HISTORY_MAX_TOKENS = 600
+"""Token budget of the history a session adds to the orchestrator prompt."""
+RECENT_EXCHANGES = 2
+"""Queries and answers of a session kept verbatim, older ones are summarized."""
+EXCHANGE_SUMMARY_TOKENS = 40
+"""Token budget of the one-line summary of an older query and answer."""
+SCENE_MAX_TOKENS = 250
+"""Token budget of the last scene observed in a session."""
+
+OBJECT_DETAIL_PATTERN = re.compile(r"^\s*- .+ \([A-Z_]+\)( |$)")
+"""A line describing one object, see custom_response.describe_object."""
+SCENE_PATTERN = re.compile(r"\bobjects(_omitted)? \(\d+\)|\"objects\"\s*:")
+"""Observations listing the objects of the scene."""
+
+
+def compact_observation(
+    observation: str,
+    max_tokens: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> str:
+    """Reduce an observation so that it fits in a token budget.
+
+    Lines describing single objects are dropped first, keeping the lists of
+    their names, then JSON in the observation is compacted by structure (see
+    custom_response.compact_response) and, if it still does not fit, the
+    text is truncated.
+    """
+    if count_tokens(observation) <= max_tokens:
+        return observation
+
+    lines, omitted = [], 0
+    for line in observation.splitlines():
+        if OBJECT_DETAIL_PATTERN.match(line):
+            omitted += 1
+            continue
+        start = line.find("{")
+        if start != -1 and count_tokens(line) > max_tokens // 2:
+            line = line[:start] + compact_response(
+                line[start:], "", max_tokens // 2, count_tokens
+            )
+        lines.append(line)
+    if omitted:
+        lines.append(f"(details of {omitted} objects omitted)")
+    text = "\n".join(lines)
+    if count_tokens(text) <= max_tokens:
+        return text
+    return truncate_to_tokens(text, max_tokens, count_tokens) + " ..."
+
+
+def count_steps_tokens(
+    steps: Sequence[Tuple[AgentAction, Any]], count_tokens: Callable[[str], int]
+) -> int:
+    return sum(
+        count_tokens(action.log) + count_tokens(str(observation))
+        for action, observation in steps
+    )
+
+
+def bound_intermediate_steps(
+    steps: Sequence[Tuple[AgentAction, Any]],
+    max_tokens: int = SCRATCHPAD_MAX_TOKENS,
+    recent_steps: int = RECENT_STEPS,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> List[Tuple[AgentAction, Any]]:
+    """Shorten the observations of older steps to fit the scratchpad budget.
+
+    Steps are returned unchanged while they fit, so short tasks get the same
+    prompts as before. Otherwise the observations of all but the last
+    recent_steps steps are summarized, and if that is not enough they are
+    omitted, oldest first. Actions are always kept, so the agent still sees
+    what it did.
+    """
+    steps = list(steps)
+    if count_steps_tokens(steps, count_tokens) <= max_tokens:
+        return steps
+
+    older = max(len(steps) - recent_steps, 0)
+    for index in range(older):
+        action, observation = steps[index]
+        steps[index] = (
+            action,
+            compact_observation(
+                str(observation), OBSERVATION_SUMMARY_TOKENS, count_tokens
+            ),
+        )
+    for index in range(older):
+        if count_steps_tokens(steps, count_tokens) <= max_tokens:
+            break
+        steps[index] = (steps[index][0], OMITTED_OBSERVATION)
+    return steps
+
+
+def get_scene_observation(
+    steps: Sequence[Tuple[AgentAction, Any]],
+) -> Optional[str]:
+    """The last observation listing the objects of the scene."""
+    for _, observation in reversed(steps):
+        if SCENE_PATTERN.search(str(observation)):
+            return str(observation)
+    return None
+
+
+def get_history_variables(
+    memory: Optional[BaseMemory],
+) -> Tuple[List[str], Dict[str, str]]:
+    """Input and partial variables for the {history} of an agent prompt.
+
+    The memory provides the history; without one it is empty and the prompt
+    is the same as without history.
+    """
+    if memory is None:
+        return [], {"history": ""}
+    return memory.memory_variables, {}
+
+
+def get_session_path(directory: Path, session_id: str) -> Path:
+    """File of a session, named by a hash so any session id is a safe name."""
+    return directory / f"{hashlib.sha256(session_id.encode()).hexdigest()[:32]}.json"
+
+
+class SessionMemory(BaseMemory):
+    """Bounded memory of the orchestrator per session, persisted on disk.
+
+    The session is taken from the session_id input of the agent; runs
+    without one neither load nor save a history. The orchestrator prompt
+    gets the history as its history variable. Pass the agent executor's
+    intermediate steps in the outputs (return_intermediate_steps=True) to
+    also remember the last scene the agent observed.
+    """
+
+    directory: Path = SESSION_DIR
+    session_key: str = "session_id"
+    memory_key: str = "history"
+    max_tokens: int = HISTORY_MAX_TOKENS
+    recent_exchanges: int = RECENT_EXCHANGES
+    scene_max_tokens: int = SCENE_MAX_TOKENS
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_session(self, session_id: str) -> Dict[str, Any]:
+        try:
+            session = json.loads(
+                get_session_path(self.directory, session_id).read_text()
+            )
+        except (OSError, ValueError):
+            session = {}
+        if session.get("session_id") != session_id:
+            session = {"session_id": session_id}
+        return {"summaries": [], "exchanges": [], "scene": None, **session}
+
+    def save_session(self, session: Dict[str, Any]) -> None:
+        path = get_session_path(self.directory, session["session_id"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({**session, "updated": time.time()}))
+        temporary_path.replace(path)
+
+    def format_history(self, session: Dict[str, Any]) -> str:
+        """The history as it appears in the prompt, empty for a new session."""
+        parts = []
+        if session["summaries"]:
+            parts.append(
+                "Earlier queries of the User:\n" + "\n".join(session["summaries"])
+            )
+        for exchange in session["exchanges"]:
+            parts.append(
+                f"User query: {exchange['input']}\nFinal Answer: {exchange['output']}"
+            )
+        if session["scene"]:
+            parts.append(f"Last observed scene:\n{session['scene']}")
+        if not parts:
+            return ""
+        return "Previously in this conversation:\n" + "\n".join(parts) + "\n\n"
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        session_id = inputs.get(self.session_key)
+        if not session_id:
+            return {self.memory_key: ""}
+        with self._lock:
+            session = self.load_session(session_id)
+        return {self.memory_key: self.format_history(session)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> None:
+        session_id = inputs.get(self.session_key)
+        if not session_id:
+            return
+        # Share the budget between the recent exchanges and the scene.
+        exchange_tokens = self.max_tokens // (self.recent_exchanges + 2)
+        exchange = {
+            "input": compact_observation(str(inputs.get("input")), exchange_tokens),
+            "output": compact_observation(str(outputs.get("output")), exchange_tokens),
+        }
+        scene = get_scene_observation(outputs.get("intermediate_steps") or [])
+
+        with self._lock:
+            session = self.load_session(session_id)
+            session["exchanges"].append(exchange)
+            while len(session["exchanges"]) > self.recent_exchanges:
+                older = session["exchanges"].pop(0)
+                answer = (older["output"].strip().splitlines() or [""])[0]
+                session["summaries"].append(
+                    truncate_to_tokens(
+                        f"- {older['input']} -> {answer}",
+                        EXCHANGE_SUMMARY_TOKENS,
+                        estimate_tokens,
+                    )
+                )
+            if scene is not None:
+                session["scene"] = compact_observation(scene, self.scene_max_tokens)
+            while session["summaries"] and (
+                estimate_tokens(self.format_history(session)) > self.max_tokens
+            ):
+                session["summaries"].pop(0)
+            self.save_session(session)
+        logging.log(
+            logging.INFO,
+            f"Session {session_id}: {len(session['summaries'])} summarized and "
+            f"{len(session['exchanges'])} recent exchanges",
+        )
+
+    def clear(self) -> None:
+        """Forget every session."""
+        with self._lock:
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
@@ -0,0 +1,369 @@
+"""Prometheus metrics of both services, in the text exposition format.
+
+Metrics are registered on the module's registry and served by GET /metrics of
+main.py and the language server:
+
+- track_request, used as HTTP middleware, counts requests and observes their
+  latency per route template, and counts the requests in progress;
+- MetricsExporter, added to a custom_tracing.Tracer, turns spans into metrics:
+  LLM calls, tokens and latency per chain, tool calls, scene graph build and
+  render durations;
+- record_cache counts the hits and misses of the caches, e.g. the OpenAPI
+  spec cache of the language server.
+
+Gauges can read their value when scraped, e.g. the number of scene objects.
+Stdlib only, so main.py can use it inside Blender's Python.
+"""
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+"""Media type of the text format; Starlette appends the charset."""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Histogram buckets in seconds, Prometheus' defaults."""
+
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+"""Histogram buckets in seconds for LLM calls and renders."""
+
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = [
+        f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A metric family with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) of every sample."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines += [
+            f"{self.name}{suffix}{labels} {format_value(value)}"
+            for suffix, labels, value in self.samples()
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [("", format_labels(self.labels, key), value) for key, value in values]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        """
+        Args:
+            function: Computes the value of an unlabeled gauge when scraped.
+        """
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: Any) -> float:
+        if self.function is not None:
+            return self.function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        if self.function is not None:
+            return [("", "", self.function())]
+        with self._lock:
+            values = sorted(self._values.items())
+        return [("", format_labels(self.labels, key), value) for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._counts.items())
+            sums = dict(self._sums)
+        samples = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(
+                    self.labels + ("le",), key + (format_value(bound),)
+                )
+                samples.append(("_bucket", labels, cumulative))
+            labels = format_labels(self.labels, key)
+            samples.append(("_sum", labels, sums[key]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, or return the one already registered under its name."""
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by method, route and status code.",
+        ("method", "route", "status"),
+    )
+)
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Latency of HTTP requests by method and route.",
+        ("method", "route"),
+    )
+)
+http_requests_in_progress = registry.register(
+    Gauge(
+        "http_requests_in_progress",
+        "HTTP requests being handled or waiting for the event loop.",
+        ("method", "route"),
+    )
+)
+cache_requests = registry.register(
+    Counter(
+        "cache_requests_total",
+        "Cache lookups by cache and result: hit, miss or coalesced (joined a "
+        "build in flight).",
+        ("cache", "result"),
+    )
+)
+llm_calls = registry.register(
+    Counter(
+        "llm_calls_total",
+        "LLM calls by chain (orchestrator, planner, controller, parser, "
+        "structured), model and status.",
+        ("chain", "model", "status"),
+    )
+)
+llm_tokens = registry.register(
+    Counter(
+        "llm_tokens_total",
+        "LLM tokens by chain and kind: prompt (estimated), prompt_eval "
+        "(evaluated by Ollama, prompt cache hits excluded) and completion.",
+        ("chain", "kind"),
+    )
+)
+llm_duration = registry.register(
+    Histogram(
+        "llm_call_duration_seconds",
+        "Latency of LLM calls by chain.",
+        ("chain",),
+        LLM_BUCKETS,
+    )
+)
+llm_time_to_first_token = registry.register(
+    Histogram(
+        "llm_time_to_first_token_seconds",
+        "Time to the first streamed token of LLM calls by chain.",
+        ("chain",),
+        LLM_BUCKETS,
+    )
+)
+llm_backend_requests = registry.register(
+    Counter(
+        "llm_backend_requests_total",
+        "Requests to the LLM backends of custom_backends.BackendPool by backend "
+        "and result: ok or failed (timeout, connection or server error, failed "
+        "over to another backend).",
+        ("backend", "result"),
+    )
+)
+llm_backend_in_flight = registry.register(
+    Gauge(
+        "llm_backend_in_flight",
+        "Requests in flight per LLM backend, its queue depth.",
+        ("backend",),
+    )
+)
+llm_backend_healthy = registry.register(
+    Gauge(
+        "llm_backend_healthy",
+        "1 if the LLM backend answered its last request or health check, else 0.",
+        ("backend",),
+    )
+)
+endpoint_retrievals = registry.register(
+    Counter(
+        "planner_endpoint_retrievals_total",
+        "Planner calls by endpoint retrieval result: retrieved (the top-k "
+        "endpoints sufficed), fallback (no endpoint matched the query) and "
+        "replanned (the plan needed endpoints that were not retrieved).",
+        ("result",),
+    )
+)
+tool_calls = registry.register(
+    Counter(
+        "agent_tool_calls_total",
+        "Tool calls of the agents by tool and status.",
+        ("tool", "status"),
+    )
+)
+scene_graph_build_duration = registry.register(
+    Histogram(
+        "scene_graph_build_seconds",
+        "Time to build the scene graph from bpy.data.objects.",
+    )
+)
+render_duration = registry.register(
+    Histogram("render_duration_seconds", "Duration of renders.", (), LLM_BUCKETS)
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def get_route(request: Any) -> str:
+    """Path template of the route matching the request, e.g. /debug/profile/{id}."""
+    from starlette.routing import Match
+
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+async def track_request(request: Any, call_next: Callable) -> Any:
+    """HTTP middleware counting requests and observing their latency."""
+    method, route = request.method, get_route(request)
+    http_requests_in_progress.inc(method=method, route=route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_requests_in_progress.dec(method=method, route=route)
+        http_request_duration.observe(
+            time.perf_counter() - start, method=method, route=route
+        )
+        http_requests.inc(method=method, route=route, status=status)
+
+
+class MetricsExporter:
+    """custom_tracing exporter turning spans into metrics."""
+
+    def export(self, span: Dict[str, Any]) -> None:
+        stage, attributes = span["stage"], span["attributes"]
+        seconds = span["duration_ms"] / 1000
+        if stage == "llm":
+            chain = attributes.get("chain") or "other"
+            llm_calls.inc(chain=chain, model=span["name"], status=span["status"])
+            llm_duration.observe(seconds, chain=chain)
+            if attributes.get("ttft_ms") is not None:
+                llm_time_to_first_token.observe(
+                    attributes["ttft_ms"] / 1000, chain=chain
+                )
+            for kind in ("prompt", "prompt_eval", "completion"):
+                if attributes.get(f"{kind}_tokens"):
+                    llm_tokens.inc(attributes[f"{kind}_tokens"], chain=chain, kind=kind)
+        elif stage.startswith("tool."):
+            tool_calls.inc(tool=span["name"], status=span["status"])
+        elif stage == "scene_graph":
+            scene_graph_build_duration.observe(seconds)
+        elif stage == "render":
+            render_duration.observe(seconds)
@@ -1,21 +1,234 @@
-from typing import Any, Dict, List, Mapping, Optional
-from langchain_community.llms.ollama import Ollama
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Union
+from langchain_community.llms.ollama import (
+    Ollama,
+    OllamaEndpointNotFoundError,
+    _stream_response_to_generation_chunk,
+)
+from langchain_core.outputs import GenerationChunk
+from langchain_core.pydantic_v1 import PrivateAttr
 from langchain_core.language_models.llms import LLMResult
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+import json
 import logging
+from contextlib import nullcontext
 from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.agents import AgentAction, AgentFinish
 from uuid import UUID
 
+import requests
 from tenacity import RetryCallState
 
+from custom_backends import BackendPool
+from custom_metrics import record_cache
+from custom_response import estimate_tokens
 
 logging.basicConfig(level=logging.INFO)
 
 model_name = "mistral:instruct"
+ollama_base_url = "http://localhost:11434"
 
 
 class CustomLLM(Ollama):
+    keep_alive: Optional[Union[int, str]] = "30m"
+    """How long Ollama keeps the model loaded after a request, e.g. "30m" or -1."""
+    reuse_prefix_context: bool = False
+    """Evaluate registered prompt prefixes once and send their Ollama context
+    instead of the prefix text. The prefix then becomes a preceding turn of the
+    conversation, so this trades some prompt fidelity for latency; keep_alive
+    and static-first prompts already let Ollama's prompt cache skip a prefix
+    shared with the previous request."""
+    prompt_prefixes: List[str] = []
+    """Static prompt prefixes, see add_prompt_prefix."""
+    backend_pool: Optional[BackendPool] = None
+    """Servers to spread the requests over instead of base_url, whose path is
+    kept; see custom_backends."""
+
+    _prefix_contexts: Dict[str, List[int]] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _default_params(self) -> Dict[str, Any]:
+        return {**super()._default_params, "keep_alive": self.keep_alive}
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        # Ollama inherits BaseLLM's empty params first, so callbacks never
+        # saw the model in their invocation_params.
+        return {"model": self.model, "format": self.format, **self._default_params}
+
+    def add_prompt_prefix(self, prefix: str) -> None:
+        """Register the static beginning of a prompt template for context reuse."""
+        prefix = self.pre_process_input(prefix)
+        if prefix and prefix not in self.prompt_prefixes:
+            self.prompt_prefixes.append(prefix)
+
+    def _match_prompt_prefix(self, prompt: str) -> Optional[str]:
+        matches = [
+            prefix for prefix in self.prompt_prefixes if prompt.startswith(prefix)
+        ]
+        return max(matches, key=len) if matches else None
+
+    def _get_prefix_context(self, prefix: str) -> List[int]:
+        """Evaluate a prompt prefix once per session and cache its context."""
+        record_cache("prompt_prefix_context", prefix in self._prefix_contexts)
+        if prefix not in self._prefix_contexts:
+            logging.log(
+                logging.INFO, f"evaluating prompt prefix of {len(prefix)} chars"
+            )
+            options = {**self._default_params["options"], "num_predict": 1}
+            for stream_resp in super()._create_generate_stream(prefix, options=options):
+                if stream_resp:
+                    parsed_response = json.loads(stream_resp)
+                    if parsed_response.get("done"):
+                        self._prefix_contexts[prefix] = parsed_response["context"]
+        return self._prefix_contexts[prefix]
+
+    def warm_up(self, prompts: Optional[List[str]] = None) -> None:
+        """Load the model and evaluate prompts so they are in Ollama's prompt cache.
+
+        Args:
+            prompts (Optional[List[str]]): Prompts to evaluate, defaults to the
+                registered prompt prefixes.
+        """
+        options = {**self._default_params["options"], "num_predict": 1}
+        prompts = ["", *(self.prompt_prefixes if prompts is None else prompts)]
+        if self.backend_pool is None:
+            backends = [None]
+        else:
+            # Every Ollama backend loads the model and caches its own prompts.
+            backends = [
+                backend
+                for backend in self.backend_pool.backends
+                if backend.kind == "ollama"
+            ]
+        for backend in backends:
+            with self.backend_pool.pin(backend) if backend else nullcontext():
+                for prompt in prompts:
+                    for _ in super()._create_generate_stream(prompt, options=options):
+                        pass
+
+    def _create_generate_stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        images: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        prefix = (
+            self._match_prompt_prefix(prompt) if self.reuse_prefix_context else None
+        )
+        if prefix is not None:
+            kwargs["context"] = self._get_prefix_context(prefix)
+            prompt = prompt[len(prefix) :]
+        yield from super()._create_generate_stream(prompt, stop, images, **kwargs)
+
+    def _create_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        """Same request as Ollama._create_stream, but a context passed as kwarg
+        is sent as Ollama's top-level context instead of being folded into options,
+        and the model's stop sequences are added to those of the call, e.g. of an
+        agent, instead of conflicting with them."""
+        stop = list(dict.fromkeys([*(stop or []), *(self.stop or [])]))
+
+        params = self._default_params
+        top_level_keys = [*params, "context"]
+        for key in top_level_keys:
+            if key in kwargs:
+                params[key] = kwargs[key]
+
+        if "options" in kwargs:
+            params["options"] = kwargs["options"]
+        else:
+            params["options"] = {
+                **params["options"],
+                "stop": stop,
+                **{k: v for k, v in kwargs.items() if k not in top_level_keys},
+            }
+
+        if payload.get("messages"):
+            request_payload = {"messages": payload.get("messages", []), **params}
+        else:
+            request_payload = {
+                "prompt": payload.get("prompt"),
+                "images": payload.get("images", []),
+                **params,
+            }
+
+        headers = {
+            "Content-Type": "application/json",
+            **(self.headers if isinstance(self.headers, dict) else {}),
+        }
+        if self.backend_pool is not None:
+            backend, response = self.backend_pool.post(
+                api_url, request_payload, headers, self.timeout
+            )
+        else:
+            response = requests.post(
+                url=api_url,
+                headers=headers,
+                json=request_payload,
+                stream=True,
+                timeout=self.timeout,
+            )
+        response.encoding = "utf-8"
+        if response.status_code != 200:
+            if self.backend_pool is not None:
+                # Free the backend's slot, the error below may still read the response.
+                self.backend_pool.release(backend, None)
+            if response.status_code == 404:
+                raise OllamaEndpointNotFoundError(
+                    "Ollama call failed with status code 404. "
+                    "Maybe your model is not found "
+                    f"and you should pull the model with `ollama pull {self.model}`."
+                )
+            optional_detail = response.json().get("error")
+            raise ValueError(
+                f"Ollama call failed with status code {response.status_code}."
+                f" Details: {optional_detail}"
+            )
+        if self.backend_pool is not None:
+            return self.backend_pool.iter_lines(backend, response)
+        return response.iter_lines(decode_unicode=True)
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream cleaned chunks as Ollama generates them.
+
+        Trailing backslashes are held back until the next chunk so that a "\\_"
+        split across chunk boundaries is still cleaned.
+        """
+        preprocessed_prompt = self.pre_process_input(prompt)
+        pending = ""
+        for stream_resp in self._create_generate_stream(
+            preprocessed_prompt, stop, **kwargs
+        ):
+            if not stream_resp:
+                continue
+            chunk = _stream_response_to_generation_chunk(stream_resp)
+            text = pending + chunk.text
+            if chunk.generation_info is None:
+                held = len(text) - len(text.rstrip("\\"))
+                text, pending = text[: len(text) - held], text[len(text) - held :]
+            else:
+                pending = ""
+            chunk = GenerationChunk(
+                text=self.clean_text(text), generation_info=chunk.generation_info
+            )
+            if not chunk.text and chunk.generation_info is None:
+                continue
+            yield chunk
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, verbose=self.verbose)
+
     def _generate(
         self,
         prompts: List[str],
@@ -26,32 +239,32 @@ class CustomLLM(Ollama):
     ) -> LLMResult:
         generations = []
         for prompt in prompts:
-            # Apply preprocessing here
-            # logging.log(logging.INFO, f"Original prompt: {prompt}")
-            preprocessed_prompt = self.pre_process_input(prompt)
-            # logging.log(logging.INFO, f"Preprocessed prompt: {preprocessed_prompt}")
-            # run_manager.handlers.append(RemoveBackslashesCallback())
-            # logging.log(logging.INFO, f"run_manager handlers: {run_manager.handlers}")
-
-            final_chunk = super()._stream_with_aggregation(
-                preprocessed_prompt,
-                stop=stop,
-                images=images,
-                run_manager=run_manager,
-                verbose=self.verbose,
-                **kwargs,
-            )
+            final_chunk: Optional[GenerationChunk] = None
+            for chunk in self._stream(
+                prompt, stop=stop, images=images, run_manager=run_manager, **kwargs
+            ):
+                final_chunk = chunk if final_chunk is None else final_chunk + chunk
+            if final_chunk is None:
+                raise ValueError("No data received from Ollama stream.")
             logging.log(
                 logging.INFO, f"final_chunk before post processing: {final_chunk.text}"
             )
             final_chunk.text = self.post_process_output(final_chunk.text)
-            # logging.log(
-            #     logging.INFO, f"final_chunk after post processing: {final_chunk.text}"
-            # )
             generations.append([final_chunk])
 
         return LLMResult(generations=generations)
 
+    def get_num_tokens(self, text: str) -> int:
+        """Count tokens with the model's tokenizer.
+
+        Set custom_get_token_ids to plug in the tokenizer matching the Ollama
+        model; without it and without transformers installed we estimate.
+        """
+        try:
+            return super().get_num_tokens(text)
+        except ImportError:
+            return estimate_tokens(text)
+
     def clean_text(self, text: str) -> str:
         return text.replace("\\_", "_").replace("\_", "_")
 
@@ -159,3 +372,83 @@ class RemoveBackslashesCallback(BaseCallbackHandler):
         return super().on_text(
             text, run_id=run_id, parent_run_id=parent_run_id, **kwargs
         )
+
+
+class AgentStatsCallback(BaseCallbackHandler):
+    """Counts agent steps, output parsing failures and LLM calls per task.
+
+    A task is a run of a top-level chain, e.g. one invocation of the agent.
+    Attached to the agent executor it sees the executor's own steps; passed
+    with the callbacks of an invocation it also sees those of nested agents.
+    """
+
+    def __init__(self):
+        self.tasks = 0
+        self.failed_tasks = 0
+        self.steps = 0
+        self.parsing_failures = 0
+        self.llm_calls = 0
+
+    def on_chain_end(
+        self,
+        outputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        if parent_run_id is None:
+            self.tasks += 1
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        if parent_run_id is None:
+            self.tasks += 1
+            self.failed_tasks += 1
+
+    def on_agent_action(
+        self,
+        action: AgentAction,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        self.steps += 1
+        # AgentExecutor reports output it could not parse as this action.
+        if action.tool == "_Exception":
+            self.parsing_failures += 1
+
+    def on_agent_finish(
+        self,
+        finish: AgentFinish,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        self.steps += 1
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ) -> Any:
+        self.llm_calls += len(prompts)
+
+    def summary(self) -> Dict[str, Any]:
+        tasks = max(self.tasks, 1)
+        return {
+            "tasks": self.tasks,
+            "failed_tasks": self.failed_tasks,
+            "steps_per_task": round(self.steps / tasks, 2),
+            "llm_calls_per_task": round(self.llm_calls / tasks, 2),
+            "parsing_failures": self.parsing_failures,
+            "parsing_failure_rate": round(
+                self.parsing_failures / max(self.steps, 1), 4
+            ),
+        }
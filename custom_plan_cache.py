@@ -0,0 +1,315 @@
+"""Cache of the planner's plans by query template.
+
+Users repeat the same kinds of requests ("move the cube up by 2", "move the
+sphere up by 3.5"), and every one of them used to cost an api_planner LLM
+call. PlanCache turns a query and its plan into a template: numbers and
+object names of the query that the plan uses as parameters become slots,
+e.g. "move <o0> up by <n1>" with the plan
+'1. POST /move_object?name=<o0> {"x": 0, "y": 0, "z": <n1>}'. A later query
+matching the template gets the plan with its own values, names written in
+the case the planner used for them ("cube" -> "Cube").
+
+A template is only served once it is trusted: the planner made the same plan
+for it at least MIN_AGREEMENTS times, in at least MIN_CONFIDENCE of its
+observations, and for new values only if it was seen with different values
+before, which shows that the slots are parameters. Numbers or names that are
+also part of an endpoint (add a cube -> POST /add_cube) are never slots. Plans
+are only cached and served if every endpoint they call is in the spec, and
+the cache is cleared when the spec's hash changes.
+"""
+
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from custom_executor import split_plan
+from custom_metrics import record_cache
+from custom_retrieval import get_plan_endpoints, is_plan_covered
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+PLAN_CACHE_PATH = Path.absolute(Path(__file__).parent) / ".plan_cache.json"
+"""Where the plan cache is persisted, with the hash of its spec."""
+MIN_AGREEMENTS = 2
+"""Times the planner must have made a template's plan before it is served."""
+MIN_CONFIDENCE = 0.75
+"""Share of a template's observations that must agree with its plan."""
+MAX_ENTRIES = 1000
+"""Templates kept; the least recently used are dropped first."""
+MAX_SAMPLES = 5
+"""Slot values kept per template, to tell repeated from new values."""
+
+FILLER_WORDS = {"a", "an", "the", "please", "can", "could", "would", "you"}
+"""Words dropped from templates, "Please add a cube" matches "add cube"."""
+TOKEN_PATTERN = re.compile(r"[\w.-]+")
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+PLAN_NUMBER_PATTERN = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w]|\.\d)")
+"""A number in a plan that is not part of a name like Cube.001."""
+STEP_NUMBER_PATTERN = re.compile(r"^\s*\d+\.", re.MULTILINE)
+"""The number of a step of a plan, which is never a slot."""
+PLAN_NAME_PATTERN = re.compile(r"[?&]name=([^&\s{]+)|\"name\"\s*:\s*\"([^\"]+)\"")
+"""Object names a plan passes as parameters."""
+SLOT_PATTERN = re.compile(r"<([no])(\d+)>")
+"""A slot of a query or plan template, <n0> for a number, <o0> for a name."""
+CASES = ("same", "lower", "upper", "capitalize")
+"""How the planner may write an object name of the query, "cube" -> "Cube"."""
+
+
+def tokenize(query: str) -> List[str]:
+    """Words of a query, in their case, without fillers and trailing dots."""
+    tokens = [token.rstrip(".") for token in TOKEN_PATTERN.findall(query)]
+    return [token for token in tokens if token and token.lower() not in FILLER_WORDS]
+
+
+def is_number(token: str) -> bool:
+    return NUMBER_PATTERN.fullmatch(token) is not None
+
+
+def get_plan_signature(plan: str) -> List[str]:
+    """The calls of a plan without their descriptions, to compare plans."""
+    signature = []
+    for step in split_plan(plan):
+        match = re.search(r"\b(GET|POST|PUT|PATCH|DELETE)\s+\S+", step)
+        if match is None:
+            continue
+        call, rest = match.group(0), step[match.end() :].lstrip()
+        if rest.startswith("{"):
+            depth = 0
+            for index, char in enumerate(rest):
+                depth += {"{": 1, "}": -1}.get(char, 0)
+                if depth == 0:
+                    call += " " + "".join(rest[: index + 1].split())
+                    break
+        signature.append(call)
+    return signature
+
+
+def apply_case(value: str, case: str) -> str:
+    return value if case == "same" else getattr(value, case)()
+
+
+def get_cases(text: str, value: str) -> List[str]:
+    """The CASES that write value as text, both same and capitalize for Cube."""
+    return [case for case in CASES if apply_case(value, case) == text]
+
+
+def make_template(
+    query: str, plan: str
+) -> Tuple[List[str], str, List[str], List[List[str]]]:
+    """Turn a query and its plan into templates.
+
+    Returns:
+        The query template's tokens, the plan template, the slot values and
+        the CASES every slot is consistent with.
+    """
+    tokens = tokenize(query)
+    paths = " ".join(get_plan_endpoints(plan)).lower()
+    names = {
+        (query_name or body_name).lower()
+        for query_name, body_name in PLAN_NAME_PATTERN.findall(plan)
+    }
+    numbers = [float(token) for token in tokens if is_number(token)]
+
+    template, values, slot_cases = [], [], []
+    for token in tokens:
+        slot = f"<{'n' if is_number(token) else 'o'}{len(values)}>"
+        if is_number(token):
+            value = float(token)
+            step_numbers = {
+                match.end() - 1 for match in STEP_NUMBER_PATTERN.finditer(plan)
+            }
+            occurrences = [
+                match
+                for match in PLAN_NUMBER_PATTERN.finditer(plan)
+                if float(match.group(0)) == value and match.end() not in step_numbers
+            ]
+            cases = ["same"]
+            is_slot = bool(occurrences) and numbers.count(value) == 1
+        else:
+            pattern = r"(?<![\w.])" + re.escape(token) + r"(?![\w]|\.\d)"
+            occurrences = list(re.finditer(pattern, plan, re.IGNORECASE))
+            cases = list(CASES)
+            for match in occurrences:
+                cases = [
+                    case for case in get_cases(match.group(0), token) if case in cases
+                ]
+            is_slot = token.lower() in names and token.lower() not in paths
+        if not is_slot or not cases or token in values:
+            template.append(token.lower())
+            continue
+        for match in reversed(occurrences):
+            plan = plan[: match.start()] + slot + plan[match.end() :]
+        template.append(slot)
+        values.append(token)
+        slot_cases.append(cases)
+    return template, plan, values, slot_cases
+
+
+def match_template(
+    template: Sequence[str], tokens: Sequence[str]
+) -> Optional[List[str]]:
+    """The slot values if the query tokens match the template, else None."""
+    if len(template) != len(tokens):
+        return None
+    values: Dict[str, str] = {}
+    for part, token in zip(template, tokens):
+        slot = SLOT_PATTERN.fullmatch(part)
+        if slot is None:
+            if part != token.lower():
+                return None
+        elif is_number(token) != (slot.group(1) == "n"):
+            return None
+        elif values.setdefault(int(slot.group(2)), token) != token:
+            return None
+    return [values[index] for index in sorted(values)]
+
+
+def fill_template(
+    plan: str, values: Sequence[str], slot_cases: Sequence[Sequence[str]]
+) -> Optional[str]:
+    """The plan for the slot values, None if the case of a name is ambiguous.
+
+    A template learned from "move Cube" -> name=Cube does not tell whether
+    "move lamp" is name=lamp or name=Lamp; it needs a sample of each.
+    """
+    texts = []
+    for value, cases in zip(values, slot_cases):
+        candidates = {apply_case(value, case) for case in cases}
+        if len(candidates) != 1:
+            return None
+        texts.append(candidates.pop())
+    return SLOT_PATTERN.sub(lambda match: texts[int(match.group(2))], plan)
+
+
+class PlanCache:
+    """Plans by query template, for one spec at a time; thread safe."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = PLAN_CACHE_PATH,
+        min_agreements: int = MIN_AGREEMENTS,
+        min_confidence: float = MIN_CONFIDENCE,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        """
+        Args:
+            path: File to persist the cache to, None to keep it in memory.
+        """
+        self.path = path
+        self.min_agreements = min_agreements
+        self.min_confidence = min_confidence
+        self.max_entries = max_entries
+        self.spec_hash: Optional[str] = None
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                cached = json.loads(path.read_text())
+                self.spec_hash, self.entries = cached["spec_hash"], cached["entries"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def set_spec_hash(self, spec_hash: str) -> None:
+        """Clear the cache if its plans were made for another spec."""
+        with self._lock:
+            if spec_hash == self.spec_hash:
+                return
+            if self.entries:
+                logging.log(logging.INFO, "The spec changed, clearing the plan cache")
+            self.spec_hash, self.entries = spec_hash, {}
+            self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        temporary_path = self.path.with_suffix(".tmp")
+        temporary_path.write_text(
+            json.dumps({"spec_hash": self.spec_hash, "entries": self.entries})
+        )
+        temporary_path.replace(self.path)
+
+    def is_trusted(self, entry: Dict[str, Any], values: List[str]) -> bool:
+        return (
+            entry["agreements"] >= self.min_agreements
+            and entry["agreements"] / entry["observations"] >= self.min_confidence
+            and (values in entry["samples"] or len(entry["samples"]) > 1)
+        )
+
+    def get(self, query: str, endpoint_names: Sequence[str]) -> Optional[str]:
+        """The plan for the query from a trusted template, None on a miss."""
+        tokens = tokenize(query)
+        plan = None
+        with self._lock:
+            for key, entry in self.entries.items():
+                values = match_template(entry["template"], tokens)
+                if values is None or not self.is_trusted(entry, values):
+                    continue
+                plan = fill_template(entry["plan"], values, entry["cases"])
+                if plan is not None and is_plan_covered(plan, endpoint_names):
+                    entry["hits"] += 1
+                    # Most recently used last, see add.
+                    self.entries[key] = self.entries.pop(key)
+                    break
+                plan = None
+        record_cache("plan", plan is not None)
+        return plan
+
+    def add(self, query: str, plan: str, endpoint_names: Sequence[str]) -> None:
+        """Record a plan the planner made for the query."""
+        if not is_plan_covered(plan, endpoint_names):
+            return
+        template, plan_template, values, cases = make_template(query, plan)
+        key = " ".join(template)
+        signature = get_plan_signature(plan_template)
+        with self._lock:
+            entry = self.entries.pop(key, None) or {
+                "template": template,
+                "plan": plan_template,
+                "signature": signature,
+                "cases": cases,
+                "observations": 0,
+                "agreements": 0,
+                "samples": [],
+                "hits": 0,
+            }
+            entry["observations"] += 1
+            # Names must have been written the same way, e.g. capitalized.
+            common_cases = [
+                [case for case in old if case in new]
+                for old, new in zip(entry["cases"], cases)
+            ]
+            if entry["signature"] == signature and all(common_cases):
+                entry["agreements"] += 1
+                entry["cases"] = common_cases
+                if values not in entry["samples"]:
+                    entry["samples"] = (entry["samples"] + [values])[-MAX_SAMPLES:]
+            elif entry["agreements"] <= 1:
+                # The planner changed its mind before the plan was trusted.
+                entry.update(
+                    plan=plan_template,
+                    signature=signature,
+                    cases=cases,
+                    agreements=1,
+                    samples=[values],
+                )
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.pop(next(iter(self.entries)))
+            self._save()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self.entries.values())
+        return {
+            "spec_hash": self.spec_hash,
+            "templates": len(entries),
+            "trusted": sum(
+                self.is_trusted(entry, entry["samples"][0] if entry["samples"] else [])
+                for entry in entries
+            ),
+            "hits": sum(entry["hits"] for entry in entries),
+        }
@@ -3,14 +3,21 @@
 import json
 import re
 from functools import partial
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import yaml
-from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import (
+    BaseCallbackManager,
+    CallbackManagerForToolRun,
+    Callbacks,
+)
+from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.prompts import BasePromptTemplate, PromptTemplate
 from langchain_core.pydantic_v1 import Field
 from langchain_core.tools import BaseTool, Tool
+from langchain.agents.mrkl.base import ZeroShotAgent
 
 from custom_planner_prompt import (
     API_CONTROLLER_PROMPT,
@@ -36,34 +43,94 @@ from langchain_community.llms import OpenAI
 from langchain_community.tools.requests.tool import BaseRequestsTool
 from langchain_community.utilities.requests import RequestsWrapper
 
-from custom_ollama import CustomLLM, model_name, RemoveBackslashesCallback
+from custom_executor import PlanExecutor
+from custom_memory import (
+    RECENT_STEPS,
+    SCRATCHPAD_MAX_TOKENS,
+    bound_intermediate_steps,
+    get_history_variables,
+)
+from custom_metrics import endpoint_retrievals
+from custom_plan_cache import PlanCache
+from custom_ollama import CustomLLM, RemoveBackslashesCallback
+from custom_routing import ModelRouter
+from custom_retrieval import (
+    MIN_ENDPOINTS,
+    TOP_K as ENDPOINT_TOP_K,
+    EndpointIndex,
+    is_plan_covered,
+)
+from custom_response import (
+    compact_response,
+    estimate_tokens,
+    extract_response,
+    get_response_schemas,
+)
 
 import logging
 
 logging.basicConfig(level=logging.INFO)
 #
-# Requests tools with LLM-instructed extraction of truncated responses.
+# Requests tools with LLM-instructed extraction of compacted responses.
 #
-# Of course, truncating so bluntly may lose a lot of valuable
-# information in the response.
-# However, the goal for now is to have only a single inference step.
+# Responses are compacted by structure (see custom_response.compact_response)
+# to fit a token budget rather than sliced mid-JSON, so that large scene graphs
+# keep the objects the instructions are about.
 MAX_RESPONSE_LENGTH = 5000
-"""Maximum length of the response to be returned."""
+"""Maximum length of a response that is not JSON, see compact_response."""
+MAX_RESPONSE_TOKENS = 1000
+"""Token budget of the response handed to the parsing LLM."""
 
 base_url = ""
+router: Optional[ModelRouter] = None
+"""Router of the parser chain of tools created without one, set by
+langserver.py; a ModelRouter of ROUTES on first use otherwise."""
 
 
 def _get_default_llm_chain(prompt: BasePromptTemplate) -> Any:
     from langchain.chains.llm import LLMChain
 
+    global router
     logging.log(logging.INFO, f"in _get_default_llm_chain prompt: {prompt}")
+    if router is None:
+        router = ModelRouter()
 
     return LLMChain(
-        llm=CustomLLM(model=model_name),
+        llm=router.get_llm("parser"),
         prompt=prompt,
     )
 
 
+def _get_token_counter(llm_chain: Any) -> Callable[[str], int]:
+    """Returns the token counter of the chain's model, or a rough estimate."""
+    llm = getattr(llm_chain, "llm", None)
+    if isinstance(llm, BaseLanguageModel):
+        return llm.get_num_tokens
+    return estimate_tokens
+
+
+def _get_static_prompt_prefix(
+    prompt: PromptTemplate, per_call_variables: Optional[List[str]] = None
+) -> str:
+    """Returns the beginning of the prompt that is identical for every call.
+
+    Input variables and the given partial variables are treated as changing
+    per call; everything before the first of them is static.
+    """
+    sentinel = "\x00"
+    variables = [*prompt.input_variables, *(per_call_variables or [])]
+    return prompt.format(**{name: sentinel for name in variables}).split(sentinel)[0]
+
+
+def _register_prompt_prefix(
+    llm: BaseLanguageModel,
+    prompt: PromptTemplate,
+    per_call_variables: Optional[List[str]] = None,
+) -> None:
+    if isinstance(llm, CustomLLM):
+        llm.add_prompt_prefix(_get_static_prompt_prefix(prompt, per_call_variables))
+
+
 def _get_default_llm_chain_factory(
     prompt: BasePromptTemplate,
 ) -> Callable[[], Any]:
@@ -71,191 +138,248 @@ def _get_default_llm_chain_factory(
     return partial(_get_default_llm_chain, prompt)
 
 
-class RequestsGetToolWithParsing(BaseRequestsTool, BaseTool):
-    """Requests GET tool with LLM-instructed extraction of truncated responses."""
+class RequestsToolWithParsing(BaseRequestsTool, BaseTool):
+    """Requests tool with LLM-instructed extraction of truncated responses.
+
+    Subclasses send their request in _request; _run extracts the response
+    with the response schemas or, failing that, compacts it for the LLM chain.
+    """
 
-    name: str = "requests_get"
-    """Tool name."""
-    description = REQUESTS_GET_TOOL_DESCRIPTION
-    """Tool description."""
     response_length: Optional[int] = MAX_RESPONSE_LENGTH
-    """Maximum length of the response to be returned."""
-    llm_chain: Any = Field(
-        default_factory=_get_default_llm_chain_factory(PARSING_GET_PROMPT)
-    )
+    """Maximum length of a response that is not JSON; JSON is compacted instead."""
+    response_tokens: int = MAX_RESPONSE_TOKENS
+    """Token budget of the response handed to the LLM chain."""
+    llm_chain: Any = None
     """LLMChain used to extract the response."""
+    response_schemas: Dict[str, Any] = Field(default_factory=dict)
+    """Known response schemas, used to extract structured responses without the LLM."""
+
+    def _request(self, data: Dict[str, Any]) -> str:
+        """Sends the request of the parsed tool input, returns the response."""
+        raise NotImplementedError()
 
-    def _run(self, text: str) -> str:
+    def _run(
+        self, text: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
         from langchain.output_parsers.json import parse_json_markdown
 
-        try:
-            data = parse_json_markdown(text)
-        except json.JSONDecodeError as e:
-            raise e
-        data_params = data.get("params")
-        response = self.requests_wrapper.get(data["url"], params=data_params)
-        response = response[: self.response_length]
+        data = parse_json_markdown(text)
+        response = self._request(data)
+        extracted = extract_response(
+            response, data["output_instructions"], self.response_schemas
+        )
+        if extracted is not None:
+            return extracted
+        response = compact_response(
+            response,
+            data["output_instructions"],
+            self.response_tokens,
+            _get_token_counter(self.llm_chain),
+            self.response_length,
+        )
         return self.llm_chain.predict(
-            response=response, instructions=data["output_instructions"]
+            response=response,
+            instructions=data["output_instructions"],
+            callbacks=run_manager.get_child() if run_manager else None,
         ).strip()
 
     async def _arun(self, text: str) -> str:
         raise NotImplementedError()
 
 
-class RequestsPostToolWithParsing(BaseRequestsTool, BaseTool):
+class RequestsGetToolWithParsing(RequestsToolWithParsing):
+    """Requests GET tool with LLM-instructed extraction of truncated responses."""
+
+    name: str = "requests_get"
+    """Tool name."""
+    description = REQUESTS_GET_TOOL_DESCRIPTION
+    """Tool description."""
+    llm_chain: Any = Field(
+        default_factory=_get_default_llm_chain_factory(PARSING_GET_PROMPT)
+    )
+    """LLMChain used to extract the response."""
+
+    def _request(self, data: Dict[str, Any]) -> str:
+        return self.requests_wrapper.get(data["url"], params=data.get("params"))
+
+
+class RequestsPostToolWithParsing(RequestsToolWithParsing):
     """Requests POST tool with LLM-instructed extraction of truncated responses."""
 
     name: str = "requests_post"
     """Tool name."""
     description = REQUESTS_POST_TOOL_DESCRIPTION
     """Tool description."""
-    response_length: Optional[int] = MAX_RESPONSE_LENGTH
-    """Maximum length of the response to be returned."""
     llm_chain: Any = Field(
         default_factory=_get_default_llm_chain_factory(PARSING_POST_PROMPT)
     )
     """LLMChain used to extract the response."""
 
-    def _run(self, text: str) -> str:
-        from langchain.output_parsers.json import parse_json_markdown
-
-        try:
-            logging.log(logging.INFO, f"received text: {text}")
-            data = parse_json_markdown(text)
-        except json.JSONDecodeError as e:
-            raise e
-        response = self.requests_wrapper.post(data["url"], data["data"])
-        response = response[: self.response_length]
-        return self.llm_chain.predict(
-            response=response, instructions=data["output_instructions"]
-        ).strip()
-
-    async def _arun(self, text: str) -> str:
-        raise NotImplementedError()
+    def _request(self, data: Dict[str, Any]) -> str:
+        logging.log(logging.INFO, f"received data: {data}")
+        return self.requests_wrapper.post(data["url"], data["data"])
 
 
-class RequestsPatchToolWithParsing(BaseRequestsTool, BaseTool):
+class RequestsPatchToolWithParsing(RequestsToolWithParsing):
     """Requests PATCH tool with LLM-instructed extraction of truncated responses."""
 
     name: str = "requests_patch"
     """Tool name."""
     description = REQUESTS_PATCH_TOOL_DESCRIPTION
     """Tool description."""
-    response_length: Optional[int] = MAX_RESPONSE_LENGTH
-    """Maximum length of the response to be returned."""
     llm_chain: Any = Field(
         default_factory=_get_default_llm_chain_factory(PARSING_PATCH_PROMPT)
     )
     """LLMChain used to extract the response."""
 
-    def _run(self, text: str) -> str:
-        from langchain.output_parsers.json import parse_json_markdown
-
-        try:
-            data = parse_json_markdown(text)
-        except json.JSONDecodeError as e:
-            raise e
-        response = self.requests_wrapper.patch(data["url"], data["data"])
-        response = response[: self.response_length]
-        return self.llm_chain.predict(
-            response=response, instructions=data["output_instructions"]
-        ).strip()
-
-    async def _arun(self, text: str) -> str:
-        raise NotImplementedError()
+    def _request(self, data: Dict[str, Any]) -> str:
+        return self.requests_wrapper.patch(data["url"], data["data"])
 
 
-class RequestsPutToolWithParsing(BaseRequestsTool, BaseTool):
+class RequestsPutToolWithParsing(RequestsToolWithParsing):
     """Requests PUT tool with LLM-instructed extraction of truncated responses."""
 
     name: str = "requests_put"
     """Tool name."""
     description = REQUESTS_PUT_TOOL_DESCRIPTION
     """Tool description."""
-    response_length: Optional[int] = MAX_RESPONSE_LENGTH
-    """Maximum length of the response to be returned."""
     llm_chain: Any = Field(
         default_factory=_get_default_llm_chain_factory(PARSING_PUT_PROMPT)
     )
     """LLMChain used to extract the response."""
 
-    def _run(self, text: str) -> str:
-        from langchain.output_parsers.json import parse_json_markdown
-
-        try:
-            data = parse_json_markdown(text)
-        except json.JSONDecodeError as e:
-            raise e
-        response = self.requests_wrapper.put(data["url"], data["data"])
-        response = response[: self.response_length]
-        return self.llm_chain.predict(
-            response=response, instructions=data["output_instructions"]
-        ).strip()
-
-    async def _arun(self, text: str) -> str:
-        raise NotImplementedError()
+    def _request(self, data: Dict[str, Any]) -> str:
+        return self.requests_wrapper.put(data["url"], data["data"])
 
 
-class RequestsDeleteToolWithParsing(BaseRequestsTool, BaseTool):
+class RequestsDeleteToolWithParsing(RequestsToolWithParsing):
     """A tool that sends a DELETE request and parses the response."""
 
     name: str = "requests_delete"
     """The name of the tool."""
     description = REQUESTS_DELETE_TOOL_DESCRIPTION
     """The description of the tool."""
-
-    response_length: Optional[int] = MAX_RESPONSE_LENGTH
-    """The maximum length of the response."""
     llm_chain: Any = Field(
         default_factory=_get_default_llm_chain_factory(PARSING_DELETE_PROMPT)
     )
     """The LLM chain used to parse the response."""
 
-    def _run(self, text: str) -> str:
-        from langchain.output_parsers.json import parse_json_markdown
-
-        try:
-            data = parse_json_markdown(text)
-        except json.JSONDecodeError as e:
-            raise e
-        response = self.requests_wrapper.delete(data["url"])
-        response = response[: self.response_length]
-        return self.llm_chain.predict(
-            response=response, instructions=data["output_instructions"]
-        ).strip()
-
-    async def _arun(self, text: str) -> str:
-        raise NotImplementedError()
+    def _request(self, data: Dict[str, Any]) -> str:
+        return self.requests_wrapper.delete(data["url"])
 
 
 #
 # Orchestrator, planner, controller.
 #
+class BoundedZeroShotAgent(ZeroShotAgent):
+    """ZeroShotAgent keeping its scratchpad under a token budget.
+
+    See custom_memory.bound_intermediate_steps.
+    """
+
+    max_scratchpad_tokens: int = SCRATCHPAD_MAX_TOKENS
+    recent_steps: int = RECENT_STEPS
+
+    def _construct_scratchpad(
+        self, intermediate_steps: List[Tuple[AgentAction, str]]
+    ) -> str:
+        return super()._construct_scratchpad(
+            bound_intermediate_steps(
+                intermediate_steps,
+                self.max_scratchpad_tokens,
+                self.recent_steps,
+                _get_token_counter(self.llm_chain),
+            )
+        )
+
+
+def _format_endpoints(
+    api_spec: ReducedOpenAPISpec, names: Optional[List[str]] = None
+) -> str:
+    endpoint_descriptions = [
+        f"{name} {description}  "
+        for name, description, _ in api_spec.endpoints
+        if names is None or name in names
+    ]
+    return "- " + "- ".join(endpoint_descriptions)
+
+
 def _create_api_planner_tool(
-    api_spec: ReducedOpenAPISpec, llm: BaseLanguageModel
+    api_spec: ReducedOpenAPISpec,
+    llm: BaseLanguageModel,
+    endpoint_top_k: Optional[int] = ENDPOINT_TOP_K,
+    endpoint_embeddings: Optional[Embeddings] = None,
+    plan_cache: Optional[PlanCache] = None,
 ) -> Tool:
+    """Expose the planner as a tool.
+
+    For specs of at least MIN_ENDPOINTS endpoints, the planner prompt only
+    lists the endpoint_top_k endpoints an EndpointIndex retrieves for the
+    query (see custom_retrieval), and the full list when retrieval misses.
+    With a plan_cache, queries matching a trusted template get its plan
+    without calling the planner (see custom_plan_cache).
+    """
     from langchain.chains.llm import LLMChain
 
-    endpoint_descriptions = [
-        f"{name} {description}  " for name, description, _ in api_spec.endpoints
-    ]
-    logging.log(logging.INFO, f"endpoint_descriptions: {endpoint_descriptions}")
-    partial_variables = {"endpoints": "- " + "- ".join(endpoint_descriptions)}
-    logging.log(logging.INFO, f"partial_variables: {partial_variables}")
-    prompt = PromptTemplate(
-        template=API_PLANNER_PROMPT,
-        input_variables=["query"],
-        partial_variables=partial_variables,
-    )
+    all_endpoints = _format_endpoints(api_spec)
+    logging.log(logging.INFO, f"endpoints: {all_endpoints}")
+    if not endpoint_top_k or len(api_spec.endpoints) < MIN_ENDPOINTS:
+        prompt = PromptTemplate(
+            template=API_PLANNER_PROMPT,
+            input_variables=["query"],
+            partial_variables={"endpoints": all_endpoints},
+        )
+        _register_prompt_prefix(llm, prompt)
+        chain = LLMChain(llm=llm, prompt=prompt)
+        plan = chain.run
+    else:
+        index = EndpointIndex(api_spec.endpoints, endpoint_top_k, endpoint_embeddings)
+        prompt = PromptTemplate(
+            template=API_PLANNER_PROMPT, input_variables=["query", "endpoints"]
+        )
+        _register_prompt_prefix(llm, prompt)
+        chain = LLMChain(llm=llm, prompt=prompt)
+
+        def plan(query: str, callbacks: Callbacks = None) -> str:
+            names = index.retrieve(query)
+            if names is None:
+                endpoint_retrievals.inc(result="fallback")
+                return chain.run(
+                    query=query, endpoints=all_endpoints, callbacks=callbacks
+                )
+            retrieved_plan = chain.run(
+                query=query,
+                endpoints=_format_endpoints(api_spec, names),
+                callbacks=callbacks,
+            )
+            if is_plan_covered(retrieved_plan, names):
+                endpoint_retrievals.inc(result="retrieved")
+                return retrieved_plan
+            logging.log(
+                logging.INFO,
+                f"The plan needs other endpoints than {names}, planning with all of them",
+            )
+            endpoint_retrievals.inc(result="replanned")
+            return chain.run(query=query, endpoints=all_endpoints, callbacks=callbacks)
+
+    if plan_cache is not None:
+        endpoint_names = [name for name, _, _ in api_spec.endpoints]
+        planner = plan
+
+        def plan(query: str, callbacks: Callbacks = None) -> str:
+            cached_plan = plan_cache.get(query, endpoint_names)
+            if cached_plan is not None:
+                logging.log(logging.INFO, f"Cached plan: {cached_plan}")
+                return cached_plan
+            new_plan = planner(query, callbacks=callbacks)
+            plan_cache.add(query, new_plan, endpoint_names)
+            return new_plan
 
-    chain = LLMChain(llm=llm, prompt=prompt)
-    tool = Tool(
+    return Tool(
         name=API_PLANNER_TOOL_NAME,
         description=API_PLANNER_TOOL_DESCRIPTION,
-        func=chain.run,
+        func=plan,
     )
-    return tool
 
 
 def _create_api_controller_agent(
@@ -263,19 +387,24 @@ def _create_api_controller_agent(
     api_docs: str,
     requests_wrapper: RequestsWrapper,
     llm: BaseLanguageModel,
+    response_schemas: Optional[Dict[str, Any]] = None,
+    parsing_llm: Optional[BaseLanguageModel] = None,
 ) -> Any:
     from langchain.agents.agent import AgentExecutor
-    from langchain.agents.mrkl.base import ZeroShotAgent
     from langchain.chains.llm import LLMChain
 
-    get_llm_chain = LLMChain(llm=llm, prompt=PARSING_GET_PROMPT)
-    post_llm_chain = LLMChain(llm=llm, prompt=PARSING_POST_PROMPT)
+    get_llm_chain = LLMChain(llm=parsing_llm or llm, prompt=PARSING_GET_PROMPT)
+    post_llm_chain = LLMChain(llm=parsing_llm or llm, prompt=PARSING_POST_PROMPT)
     tools: List[BaseTool] = [
         RequestsGetToolWithParsing(
-            requests_wrapper=requests_wrapper, llm_chain=get_llm_chain
+            requests_wrapper=requests_wrapper,
+            llm_chain=get_llm_chain,
+            response_schemas=response_schemas or {},
         ),
         RequestsPostToolWithParsing(
-            requests_wrapper=requests_wrapper, llm_chain=post_llm_chain
+            requests_wrapper=requests_wrapper,
+            llm_chain=post_llm_chain,
+            response_schemas=response_schemas or {},
         ),
     ]
     prompt = PromptTemplate(
@@ -290,7 +419,8 @@ def _create_api_controller_agent(
             ),
         },
     )
-    agent = ZeroShotAgent(
+    _register_prompt_prefix(llm, prompt, per_call_variables=["api_docs"])
+    agent = BoundedZeroShotAgent(
         llm_chain=LLMChain(llm=llm, prompt=prompt),
         allowed_tools=[tool.name for tool in tools],
     )
@@ -301,17 +431,40 @@ def _create_api_controller_tool(
     api_spec: ReducedOpenAPISpec,
     requests_wrapper: RequestsWrapper,
     llm: BaseLanguageModel,
+    direct_execution: bool = True,
+    parsing_llm: Optional[BaseLanguageModel] = None,
 ) -> Tool:
     """Expose controller as a tool.
 
     The tool is invoked with a plan from the planner, and dynamically
     creates a controller agent with relevant documentation only to
     constrain the context.
+
+    With direct_execution, the leading plan steps that name their endpoint and
+    all of its parameters are executed by a PlanExecutor without the LLM, and
+    the controller agent only runs for the rest of the plan.
     """
     global base_url
     base_url = api_spec.servers[0]["url"]  # TODO: do better.
+    response_schemas = get_response_schemas(api_spec.endpoints)
+    executor = PlanExecutor(api_spec, requests_wrapper, response_schemas)
+
+    def _create_and_run_api_controller_agent(
+        plan_str: str, callbacks: Callbacks = None
+    ) -> str:
+        results: List[str] = []
+        if direct_execution:
+            results, plan_str = executor.execute(plan_str)
+            if plan_str is None:
+                return "\n".join(results)
+            if results:
+                plan_str = (
+                    "These steps of the plan were already executed:\n"
+                    + "\n".join(results)
+                    + "\nExecute the rest of the plan:\n"
+                    + plan_str
+                )
 
-    def _create_and_run_api_controller_agent(plan_str: str) -> str:
         pattern = r"\b(GET|POST|PATCH|DELETE)\s+(/\S+)*"
         matches = re.findall(pattern, plan_str)
         endpoint_names = [
@@ -330,8 +483,12 @@ def _create_api_controller_tool(
             if not found_match:
                 raise ValueError(f"{endpoint_name} endpoint does not exist.")
         print(f"{docs_str}")
-        agent = _create_api_controller_agent(base_url, docs_str, requests_wrapper, llm)
-        return agent.run(plan_str)
+        agent = _create_api_controller_agent(
+            base_url, docs_str, requests_wrapper, llm, response_schemas, parsing_llm
+        )
+        # Pass the tool's callbacks on so the controller's steps show up in
+        # the stream of the orchestrator run.
+        return agent.run(plan_str, callbacks=callbacks)
 
     return Tool(
         name=API_CONTROLLER_TOOL_NAME,
@@ -348,6 +505,11 @@ def create_openapi_agent(
     callback_manager: Optional[BaseCallbackManager] = None,
     verbose: bool = True,
     agent_executor_kwargs: Optional[Dict[str, Any]] = None,
+    direct_execution: bool = True,
+    endpoint_top_k: Optional[int] = ENDPOINT_TOP_K,
+    endpoint_embeddings: Optional[Embeddings] = None,
+    plan_cache: Optional[PlanCache] = None,
+    router: Optional[ModelRouter] = None,
     **kwargs: Any,
 ) -> Any:
     """Instantiate OpenAI API planner and controller for a given spec.
@@ -357,34 +519,70 @@ def create_openapi_agent(
     We use a top-level "orchestrator" agent to invoke the planner and controller,
     rather than a top-level planner
     that invokes a controller with its plan. This is to keep the planner simple.
+
+    Set direct_execution=False to run every plan through the controller agent.
+
+    The planner gets the endpoint_top_k endpoints relevant to a query, ranked
+    by BM25 or, with endpoint_embeddings, by embeddings; set endpoint_top_k=None
+    to always give it every endpoint. With a plan_cache, e.g. the one of
+    langserver.py, queries matching a trusted template skip the planner.
+
+    With a router, the orchestrator, planner, controller and parser chains
+    get the models and generation options of their routes (see
+    custom_routing) instead of llm.
+
+    shared_memory, e.g. a custom_memory.SessionMemory, is the memory of the
+    orchestrator across runs: it provides the history variable of the
+    orchestrator prompt and saves every run. Without it the history is empty.
     """
     from langchain.agents.agent import AgentExecutor
-    from langchain.agents.mrkl.base import ZeroShotAgent
     from langchain.chains.llm import LLMChain
 
+    def get_llm(chain: str) -> BaseLanguageModel:
+        return router.get_llm(chain) if router is not None else llm
+
     tools = [
-        _create_api_planner_tool(api_spec, llm),
-        _create_api_controller_tool(api_spec, requests_wrapper, llm),
+        _create_api_planner_tool(
+            api_spec,
+            get_llm("planner"),
+            endpoint_top_k,
+            endpoint_embeddings,
+            plan_cache,
+        ),
+        _create_api_controller_tool(
+            api_spec,
+            requests_wrapper,
+            get_llm("controller"),
+            direct_execution=direct_execution,
+            parsing_llm=get_llm("parser"),
+        ),
     ]
+    memory_variables, history_variables = get_history_variables(shared_memory)
     prompt = PromptTemplate(
         template=API_ORCHESTRATOR_PROMPT,
-        input_variables=["input", "agent_scratchpad"],
+        input_variables=["input", "agent_scratchpad", *memory_variables],
         partial_variables={
             "tool_names": ", ".join([tool.name for tool in tools]),
             "tool_descriptions": "\n".join(
                 [f"{tool.name}: {tool.description}" for tool in tools]
             ),
+            **history_variables,
         },
     )
-    agent = ZeroShotAgent(
-        llm_chain=LLMChain(llm=llm, prompt=prompt, memory=shared_memory),
+    orchestrator_llm = get_llm("orchestrator")
+    _register_prompt_prefix(orchestrator_llm, prompt)
+    agent = BoundedZeroShotAgent(
+        llm_chain=LLMChain(llm=orchestrator_llm, prompt=prompt),
         allowed_tools=[tool.name for tool in tools],
         **kwargs,
     )
+    # The executor loads the history before and saves it after every run; on
+    # the LLMChain the memory would save every step of the run instead.
     return AgentExecutor.from_agent_and_tools(
         agent=agent,
         tools=tools,
         callback_manager=callback_manager,
         verbose=verbose,
+        memory=shared_memory,
         **(agent_executor_kwargs or {}),
     )
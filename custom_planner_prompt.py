@@ -2,6 +2,9 @@
 
 from langchain_core.prompts.prompt import PromptTemplate
 
+# Prompts keep static content (instructions, examples, tools, endpoints of the
+# session's spec) first and per-call content (query, plan, scratchpad) last, so
+# Ollama can reuse the evaluated prefix between calls.
 
 API_PLANNER_PROMPT = """You are a planner that plans a sequence of API calls to assist with user queries against an API.
 
@@ -9,6 +12,7 @@ You should:
 1) evaluate whether the user query can be solved by the API documentated below. If no, say why.
 2) if yes, generate a plan of API calls and say what they are doing step by step.
 3) If the plan includes a DELETE call, you should always return an ask from the User for authorization first unless the User has specifically asked to delete something.
+4) when you know all parameters of a call, write them into its step: query parameters after the path, then the JSON body, e.g. POST /users/42/cart?quantity=2 {{"product_id": 7}}. Such steps are executed without further interpretation.
 
 You should only use API endpoints documented below ("Endpoints you can use:").
 You can only use the DELETE tool if the User has specifically asked to delete something. Otherwise, you should return a request authorization from the User first.
@@ -40,6 +44,9 @@ Plan: 1. GET /products with a query param to search for lamps
 2. GET /user to find the user's id
 3. PATCH /users/{{id}}/cart to add a lamp to the user's cart
 
+User query: add two of product 7 to the cart of user 42
+Plan: 1. POST /users/42/cart?quantity=2 {{"product_id": 7}} to add the products to the user's cart
+
 User query: I want to add a coupon to my cart
 Plan: 1. GET /user to find the user's id
 2. PUT /users/{{id}}/coupon to apply the coupon
@@ -67,16 +74,12 @@ API_PLANNER_TOOL_NAME = "api_planner"
 API_PLANNER_TOOL_DESCRIPTION = f"Can be used to generate the right API calls to assist with a user query, like {API_PLANNER_TOOL_NAME}(query). Should always be called before trying to call the API controller."
 
 # Execution.
+# The documentation of the endpoints in the plan changes with every plan, so it
+# comes after the static instructions to keep the prompt prefix cacheable.
 API_CONTROLLER_PROMPT = """You are an agent that gets a sequence of API calls and given their documentation, should execute them and return the final response.
 If you cannot complete them and run into issues, you should explain the issue. If you're unable to resolve an API call, you can retry the API call. When interacting with API objects, you should extract names for inputs to other API calls but ids and names for outputs returned to the User.
 
 
-Here is documentation on the API:
-Base url: {api_url}
-Endpoints:
-{api_docs}
-
-
 Here are tools to execute requests against the API: {tool_descriptions}
 
 
@@ -92,6 +95,12 @@ Thought: I am finished executing the plan (or, I cannot finish executing the pla
 Final Answer: the final output from executing the plan or missing information I'd need to re-plan correctly.
 
 
+Here is documentation on the API:
+Base url: {api_url}
+Endpoints:
+{api_docs}
+
+
 Begin!
 
 Plan: {input}
@@ -143,10 +152,33 @@ Action Input: 1) GET /items params 'trending' is 'True' to get trending item ids
 
 Begin!
 
-User query: {input}
+{history}User query: {input}
 Thought: I should generate a plan to help with this query and then copy that plan exactly to the controller.
 {agent_scratchpad}"""
 
+# Structured tool calls.
+# Every endpoint is a tool with typed arguments and the model is constrained to
+# answer with JSON, so there is no free-text Action/Action Input to parse.
+STRUCTURED_AGENT_PROMPT = """You are an agent that assists with user queries against an API, things like querying information or creating resources.
+You call the API's endpoints through tools, one tool per response, and get the result of the call as an Observation.
+If a query needs a DELETE call, only make it if the User has specifically asked to delete something. Otherwise, ask the User for authorization first.
+
+
+Here are the tools, with their arguments:
+{tool_descriptions}
+
+
+Respond with a single JSON object and nothing else. To call a tool:
+{{"thought": "what you should do next", "action": "the tool name, one of [{tool_names}]", "action_input": {{"argument": "value"}}}}
+When you are finished, or need more information from the User:
+{{"thought": "I am finished", "action": "Final Answer", "action_input": "the final output for the User"}}
+
+
+Begin!
+
+{history}User query: {input}
+{agent_scratchpad}"""
+
 REQUESTS_GET_TOOL_DESCRIPTION = """Use this to GET content from a website.
 Input to the tool should be a json string with 3 keys: "url", "params" and "output_instructions".
 The value of "url" should be a string. 
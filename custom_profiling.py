@@ -0,0 +1,204 @@
+"""Opt-in profiling of single main.py requests.
+
+A request sent with ?profile=1 or the X-Profile: 1 header runs under cProfile.
+Its breakdown combines the custom_tracing spans recorded during the request
+(bpy operators, view_layer.update, saving the .blend file, get_scene_graph,
+the render) with the time cProfile measured for serializing the response
+(response_model validation, jsonable_encoder and json.dumps); what remains
+is "other". The breakdown is returned in the Server-Timing header, and the
+profile is kept under the X-Profile-Id for /debug/profile/{profile_id}.
+RequestProfiler.hot_paths merges the recent profiles into one report.
+
+cProfile measures the whole event loop thread while the request runs, so
+work of other requests interleaved with it is included. Only one request is
+profiled at a time; others sent meanwhile run without a profile.
+"""
+
+import cProfile
+import pstats
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+PROFILE_HEADER = "X-Profile"
+"""Request header (or query parameter "profile") asking for a profile."""
+
+PROFILE_ID_HEADER = "X-Profile-Id"
+"""Response header with the id of the profile, see /debug/profile/{profile_id}."""
+
+MAX_PROFILES = 100
+"""Profiles kept for /debug/profile."""
+
+TOP_FUNCTIONS = 25
+
+SERIALIZATION_FUNCTIONS = {
+    ("fastapi/routing.py", "serialize_response"),
+    ("starlette/responses.py", "render"),
+}
+"""Functions whose cumulative time counts as serializing the response."""
+
+
+def is_profile_requested(headers: Any, query_params: Any) -> bool:
+    value = headers.get(PROFILE_HEADER) or query_params.get("profile") or ""
+    return value.lower() in ("1", "true", "yes")
+
+
+def shorten_filename(filename: str) -> str:
+    """/.../site-packages/fastapi/routing.py -> fastapi/routing.py."""
+    return "/".join(filename.replace("\\", "/").split("/")[-2:])
+
+
+def get_function_label(function: Tuple[str, int, str]) -> str:
+    """("/.../fastapi/routing.py", 120, "app") -> "fastapi/routing.py:120(app)"."""
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{shorten_filename(filename)}:{line}({name})"
+
+
+def get_top_functions(
+    stats: pstats.Stats, sort: str, count: int = TOP_FUNCTIONS, divisor: int = 1
+) -> List[Dict[str, Any]]:
+    """The count functions with the highest tottime or cumtime, in milliseconds.
+
+    Args:
+        divisor: Number of profiles merged into stats, to report means per
+            request.
+    """
+    index = {"tottime": 2, "cumtime": 3}[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)
+    return [
+        {
+            "function": get_function_label(function),
+            "calls": calls // divisor,
+            "tottime_ms": round(tottime * 1000 / divisor, 3),
+            "cumtime_ms": round(cumtime * 1000 / divisor, 3),
+        }
+        for function, (_, calls, tottime, cumtime, _) in rows[:count]
+    ]
+
+
+def get_serialization_seconds(stats: pstats.Stats) -> float:
+    return sum(
+        cumtime
+        for (filename, _, name), (_, _, _, cumtime, _) in stats.stats.items()
+        if (shorten_filename(filename), name) in SERIALIZATION_FUNCTIONS
+    )
+
+
+def get_breakdown(
+    spans: Iterable[Dict[str, Any]], stats: pstats.Stats, total_ms: float
+) -> Dict[str, float]:
+    """Milliseconds per span stage and name, serialization and other."""
+    breakdown: Dict[str, float] = {}
+    for span in spans:
+        key = f"{span['stage']}.{span['name']}"
+        breakdown[key] = breakdown.get(key, 0.0) + span["duration_ms"]
+    breakdown["serialization"] = get_serialization_seconds(stats) * 1000
+    breakdown["other"] = max(total_ms - sum(breakdown.values()), 0.0)
+    breakdown["total"] = total_ms
+    return {key: round(value, 3) for key, value in breakdown.items()}
+
+
+def format_server_timing(breakdown: Dict[str, float]) -> str:
+    """Server-Timing header value, e.g. "bpy.save_mainfile;dur=12.5, ..."."""
+    return ", ".join(f"{key};dur={value}" for key, value in breakdown.items())
+
+
+class RequestProfiler:
+    """Profiles requests one at a time and keeps the recent profiles."""
+
+    def __init__(self, max_profiles: int = MAX_PROFILES):
+        self.max_profiles = max_profiles
+        self.profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._active = False
+
+    async def profile(
+        self, awaitable: Awaitable[Any]
+    ) -> Tuple[Any, Optional[cProfile.Profile]]:
+        """Await under cProfile, unless another request is being profiled.
+
+        Returns:
+            The result and the profile, None if the request was not profiled.
+        """
+        if self._active:
+            logging.log(logging.INFO, "Another request is being profiled, skipping")
+            return await awaitable, None
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return await awaitable, profile
+        finally:
+            profile.disable()
+            self._active = False
+
+    def add(
+        self,
+        name: str,
+        profile: cProfile.Profile,
+        spans: Iterable[Dict[str, Any]],
+        total_ms: float,
+    ) -> Dict[str, Any]:
+        """Keep the profile of a finished request, return its summary."""
+        stats = pstats.Stats(profile)
+        record = {
+            "id": uuid.uuid4().hex[:16],
+            "name": name,
+            "breakdown": get_breakdown(spans, stats, total_ms),
+            "profile": profile,
+        }
+        self.profiles[record["id"]] = record
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+        return record
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """Breakdown and top functions by cumulative time of one request."""
+        record = self.profiles.get(profile_id)
+        if record is None:
+            return None
+        stats = pstats.Stats(record["profile"])
+        return {
+            "id": record["id"],
+            "name": record["name"],
+            "breakdown_ms": record["breakdown"],
+            "top_functions": get_top_functions(stats, "cumtime"),
+        }
+
+    def hot_paths(self) -> Dict[str, Any]:
+        """Hot-path report over the kept profiles.
+
+        Gives the mean breakdown per request name and the functions with the
+        most own time per request.
+        """
+        records = list(self.profiles.values())
+        if not records:
+            return {"profiles": 0, "breakdown_ms": {}, "hot_functions": []}
+        breakdowns: Dict[str, Dict[str, List[float]]] = {}
+        for record in records:
+            for key, value in record["breakdown"].items():
+                breakdowns.setdefault(record["name"], {}).setdefault(key, []).append(
+                    value
+                )
+        stats = pstats.Stats(records[0]["profile"])
+        for record in records[1:]:
+            stats.add(record["profile"])
+        return {
+            "profiles": len(records),
+            "breakdown_ms": {
+                name: {
+                    "requests": len(values["total"]),
+                    **{
+                        key: round(sum(samples) / len(samples), 3)
+                        for key, samples in values.items()
+                    },
+                }
+                for name, values in breakdowns.items()
+            },
+            "hot_functions": get_top_functions(stats, "tottime", divisor=len(records)),
+        }
@@ -0,0 +1,97 @@
+"""In-memory encoding of rendered pixels into PNG, JPEG or WebP.
+
+POST /render_scene writes a PNG into rendered_images, and the client fetches
+it again from /static: a file write, a file read and a second request.
+POST /render_image instead reads the float pixels of the render from
+Blender into a NumPy array and encodes them here, in memory, answering the
+request with the image itself.
+
+Blender keeps pixels in scene-linear floats, bottom row first. to_srgb8
+turns them into 8-bit sRGB rows top first, Blender's "Standard" view
+transform; renders with Filmic or AgX look flatter than the files Blender
+writes. PNG is encoded with zlib and NumPy only, and iter_png yields it in
+bands so a response can stream it while the rest is being compressed. JPEG
+and WebP need Pillow, imported when first used. No bpy here.
+"""
+
+import io
+import struct
+import zlib
+from typing import Iterator
+
+import numpy as np
+
+IMAGE_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+"""Media type per format render_image can encode."""
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+BAND_ROWS = 64
+"""Rows compressed per IDAT chunk when streaming a PNG."""
+
+
+def to_srgb8(pixels: np.ndarray) -> np.ndarray:
+    """8-bit sRGB (alpha linear) of (height, width, 4) linear floats, flipped so
+    the top row comes first."""
+    pixels = np.clip(pixels[::-1], 0.0, 1.0)
+    rgb = pixels[..., :3]
+    srgb = np.where(
+        rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1 / 2.4) - 0.055
+    )
+    rgba = np.concatenate((srgb, pixels[..., 3:]), axis=-1)
+    return (rgba * 255 + 0.5).astype(np.uint8)
+
+
+def get_png_level(compression: int) -> int:
+    """zlib level of Blender's PNG compression percentage (0-100, default 15)."""
+    return max(0, min(9, round(compression * 9 / 100)))
+
+
+def _png_chunk(kind: bytes, payload: bytes) -> bytes:
+    body = kind + payload
+    return struct.pack(">I", len(payload)) + body + struct.pack(">I", zlib.crc32(body))
+
+
+def iter_png(rgba: np.ndarray, level: int = 1) -> Iterator[bytes]:
+    """The PNG of (height, width, channels) uint8 pixels, BAND_ROWS at a time."""
+    height, width, channels = rgba.shape
+    color_type = {3: 2, 4: 6}[channels]
+    yield PNG_SIGNATURE + _png_chunk(
+        b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    )
+    # Every row starts with its filter type, 0 (none).
+    rows = np.zeros((height, 1 + width * channels), dtype=np.uint8)
+    rows[:, 1:] = rgba.reshape(height, -1)
+    compressor = zlib.compressobj(level)
+    for start in range(0, height, BAND_ROWS):
+        data = compressor.compress(rows[start : start + BAND_ROWS].tobytes())
+        if data:
+            yield _png_chunk(b"IDAT", data)
+    yield _png_chunk(b"IDAT", compressor.flush()) + _png_chunk(b"IEND", b"")
+
+
+def encode_png(rgba: np.ndarray, level: int = 1) -> bytes:
+    return b"".join(iter_png(rgba, level))
+
+
+def encode_image(
+    rgba: np.ndarray, format: str = "PNG", quality: int = 90, level: int = 1
+) -> bytes:
+    """Encode (height, width, 4) uint8 pixels.
+
+    Args:
+        format: A key of IMAGE_FORMATS.
+        quality: 1-100, for JPEG and WebP.
+        level: zlib level, for PNG.
+    """
+    if format == "PNG":
+        return encode_png(rgba, level)
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError(f"Encoding {format} needs Pillow.") from e
+    # JPEG has no alpha channel.
+    image = Image.fromarray(rgba[..., :3] if format == "JPEG" else rgba)
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,311 @@
+"""Deterministic handling of structured API responses.
+
+The Blender API in main.py answers with pydantic models (OperationResult,
+SceneGraph, RenderedScene). When a response matches one of the response
+schemas published in its OpenAPI spec we can extract what the controller asked
+for without running another LLM inference.
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ALL_OBJECTS_PATTERN = re.compile(
+    r"\b(scene[ _]?graph|all (the )?objects|every object|each object)\b"
+)
+"""Instructions matching this pattern get details for every object."""
+
+
+def get_response_schemas(
+    endpoints: Iterable[Tuple[str, str, Dict[str, Any]]]
+) -> Dict[str, Dict[str, Any]]:
+    """Collect the JSON response schema of every endpoint in a reduced spec.
+
+    Args:
+        endpoints: The (name, description, docs) tuples of a ReducedOpenAPISpec.
+
+    Returns:
+        A mapping of endpoint name (e.g. "POST /add_cube") to its response schema.
+    """
+    schemas = {}
+    for name, _, docs in endpoints:
+        schema = (
+            docs.get("responses", {})
+            .get("content", {})
+            .get("application/json", {})
+            .get("schema")
+        )
+        if schema and schema.get("properties"):
+            schemas[name] = schema
+    return schemas
+
+
+def match_response_schema(
+    data: Any, schemas: Dict[str, Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Return the first schema whose properties describe the given JSON object."""
+    if not isinstance(data, dict):
+        return None
+    for schema in schemas.values():
+        properties = schema.get("properties", {})
+        required = schema.get("required", [])
+        if set(required) <= data.keys() <= properties.keys():
+            return schema
+    return None
+
+
+def format_vector(vector: Optional[Dict[str, float]]) -> str:
+    if not vector:
+        return "None"
+    return "({:g}, {:g}, {:g})".format(
+        round(vector["x"], 3), round(vector["y"], 3), round(vector["z"], 3)
+    )
+
+
+def describe_object(obj: Dict[str, Any]) -> str:
+    """Describe a BlenderObject on a single line."""
+    description = f"{obj.get('name')} ({obj.get('type')})"
+    transform = obj.get("object_transform") or {}
+    for field in ("location", "rotation", "scale"):
+        if field in transform:
+            description += f" {field}={format_vector(transform[field])}"
+    if obj.get("dimensions"):
+        description += f" dimensions={format_vector(obj['dimensions'])}"
+    if obj.get("bounding_box"):
+        box = obj["bounding_box"]
+        description += (
+            f" bounds={format_vector(box.get('min'))}..{format_vector(box.get('max'))}"
+        )
+    return description
+
+
+def is_mentioned(name: str, instructions: str) -> bool:
+    pattern = r"(?<!\w)" + re.escape(name.lower()) + r"(?!\w)"
+    return re.search(pattern, instructions.lower()) is not None
+
+
+def summarize_objects(key: str, objects: List[Any], instructions: str) -> List[str]:
+    """Summarize a list of objects, detailing the ones named in the instructions."""
+    named = [obj for obj in objects if isinstance(obj, dict) and "name" in obj]
+    if len(named) != len(objects):
+        return [f"{key}: {json.dumps(objects, separators=(',', ':'))}"]
+
+    lines = [f"{key} ({len(named)}): " + ", ".join(obj["name"] for obj in named)]
+    show_all = ALL_OBJECTS_PATTERN.search(instructions.lower()) is not None
+    for obj in named:
+        if show_all or is_mentioned(obj["name"], instructions):
+            lines.append(f"- {describe_object(obj)}")
+    return lines
+
+
+def summarize_response(data: Dict[str, Any], instructions: str) -> str:
+    """Build a compact, line oriented summary of a structured response."""
+    lines = []
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            lines.extend(summarize_objects(key, value, instructions))
+        elif isinstance(value, dict) and "name" in value:
+            lines.append(f"{key}: {describe_object(value)}")
+        elif isinstance(value, dict) and isinstance(value.get("objects"), list):
+            lines.extend(summarize_objects("objects", value["objects"], instructions))
+        elif isinstance(value, dict):
+            lines.append(f"{key}: {json.dumps(value, separators=(',', ':'))}")
+        else:
+            lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def extract_response(
+    response: str, instructions: str, schemas: Dict[str, Dict[str, Any]]
+) -> Optional[str]:
+    """Extract information from a response without an LLM call.
+
+    Args:
+        response (str): The raw HTTP response body.
+        instructions (str): The output instructions given to the requests tool.
+        schemas (Dict[str, Dict[str, Any]]): Known response schemas, see get_response_schemas.
+
+    Returns:
+        Optional[str]: A compact summary of the response, or None if the response
+        is not JSON matching a known schema and the LLM has to parse it instead.
+    """
+    try:
+        data = json.loads(response)
+    except (TypeError, ValueError):
+        return None
+    if match_response_schema(data, schemas) is None:
+        return None
+    return summarize_response(data, instructions or "")
+
+
+#
+# Token-budget-aware compaction of responses handed to the parsing LLM.
+#
+DEFAULT_TRANSFORM = {
+    "location": {"x": 0.0, "y": 0.0, "z": 0.0},
+    "rotation": {"x": 0.0, "y": 0.0, "z": 0.0},
+    "scale": {"x": 1.0, "y": 1.0, "z": 1.0},
+}
+"""Transform values that carry no information and are dropped when compacting."""
+
+FLOAT_PRECISION = 3
+"""Number of decimals floats are rounded to when compacting."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for when no tokenizer is available (~4 chars per token)."""
+    return len(text) // 4 + 1
+
+
+def dumps_compact(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def round_floats(data: Any, precision: int = FLOAT_PRECISION) -> Any:
+    if isinstance(data, float):
+        rounded = round(data, precision)
+        return int(rounded) if rounded.is_integer() else rounded
+    if isinstance(data, dict):
+        return {key: round_floats(value, precision) for key, value in data.items()}
+    if isinstance(data, list):
+        return [round_floats(value, precision) for value in data]
+    return data
+
+
+def drop_defaults(data: Any) -> Any:
+    """Drop default transforms, empty values and ids that duplicate names."""
+    if isinstance(data, list):
+        return [drop_defaults(value) for value in data]
+    if not isinstance(data, dict):
+        return data
+
+    compacted = {}
+    for key, value in data.items():
+        if value is None:
+            continue
+        if key == "id" and value == data.get("name"):
+            continue
+        if key in DEFAULT_TRANSFORM and round_floats(value) == DEFAULT_TRANSFORM[key]:
+            continue
+        value = drop_defaults(value)
+        if value == {}:
+            continue
+        compacted[key] = value
+    return compacted
+
+
+def is_object_list(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(isinstance(item, dict) and "name" in item for item in value)
+    )
+
+
+def count_types(objects: List[Dict[str, Any]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for obj in objects:
+        object_type = obj.get("type", "UNKNOWN")
+        counts[object_type] = counts.get(object_type, 0) + 1
+    return counts
+
+
+def reduce_object_lists(data: Any, instructions: str, level: int) -> Any:
+    """Shrink every list of named objects according to the compaction level.
+
+    Level 1 keeps full details only for objects mentioned in the instructions
+    and lists the names of the others, level 2 replaces those names with counts
+    per object type, and level 3 also reduces the mentioned objects to names.
+    """
+    if isinstance(data, dict):
+        reduced = {}
+        for key, value in data.items():
+            if not is_object_list(value):
+                reduced[key] = reduce_object_lists(value, instructions, level)
+                continue
+            if level == 1 and ALL_OBJECTS_PATTERN.search(instructions.lower()):
+                mentioned, omitted = value, []
+            else:
+                mentioned, omitted = [], []
+                for obj in value:
+                    if is_mentioned(obj["name"], instructions):
+                        mentioned.append(obj)
+                    else:
+                        omitted.append(obj)
+            reduced[key] = mentioned
+            if not omitted:
+                continue
+            if level == 1:
+                reduced[f"{key}_omitted"] = [obj["name"] for obj in omitted]
+            elif level == 2:
+                reduced[f"{key}_omitted"] = len(omitted)
+                reduced[f"{key}_omitted_types"] = count_types(omitted)
+            else:
+                reduced[key] = [obj["name"] for obj in mentioned]
+                reduced[f"{key}_count"] = len(value)
+                reduced[f"{key}_types"] = count_types(value)
+        return reduced
+    if isinstance(data, list):
+        return [reduce_object_lists(value, instructions, level) for value in data]
+    return data
+
+
+def truncate_to_tokens(
+    text: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> str:
+    """Cut text to the longest prefix that fits in max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def compact_response(
+    response: str,
+    instructions: str,
+    max_tokens: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    max_chars: Optional[int] = None,
+) -> str:
+    """Reduce an API response so that it fits in a token budget.
+
+    JSON responses are compacted by structure rather than sliced: floats are
+    rounded, default transforms dropped, and object lists progressively reduced
+    to the objects mentioned in the instructions, their names, and finally
+    per-type counts. Only when even that does not fit, or the response is not
+    JSON, is the text truncated.
+
+    Args:
+        response (str): The raw HTTP response body.
+        instructions (str): The output instructions given to the requests tool.
+        max_tokens (int): The token budget for the returned text.
+        count_tokens (Callable[[str], int]): Token counter, ideally the model's tokenizer.
+        max_chars (Optional[int]): Length the text of a response that is not JSON
+            is cut to before truncating it to the budget; JSON is never sliced.
+
+    Returns:
+        str: The compacted response.
+    """
+    if count_tokens(response) <= max_tokens:
+        return response
+    try:
+        data = json.loads(response)
+    except (TypeError, ValueError):
+        return truncate_to_tokens(response[:max_chars], max_tokens, count_tokens)
+
+    instructions = instructions or ""
+    compacted = drop_defaults(round_floats(data))
+    text = dumps_compact(compacted)
+    for level in (1, 2, 3):
+        if count_tokens(text) <= max_tokens:
+            return text
+        text = dumps_compact(reduce_object_lists(compacted, instructions, level))
+    return truncate_to_tokens(text, max_tokens, count_tokens)
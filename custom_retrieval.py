@@ -0,0 +1,178 @@
+"""Retrieval of the endpoints the planner needs for a query.
+
+The planner prompt used to list every endpoint of the spec, so its length and
+the planner's latency grew linearly with main.py's API. EndpointIndex indexes
+the endpoints once per spec, by BM25 over their names and descriptions or by
+the embeddings of a langchain Embeddings model (e.g. OllamaEmbeddings), and
+gives the planner the top-k endpoints for a query.
+
+Recall is checked twice. When no endpoint matches the query, retrieve returns
+None and the planner gets the full list. And a plan that uses an endpoint
+that was not retrieved, or none at all (the planner said it cannot help), is
+made again with the full list, see is_plan_covered.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, List, Optional, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+TOP_K = 8
+"""Endpoints retrieved for a query, besides ALWAYS_INCLUDED."""
+MIN_ENDPOINTS = 16
+"""Specs with fewer endpoints get the full list, which stays the same for every
+query so Ollama's prompt cache can reuse it."""
+ALWAYS_INCLUDED = ("GET /scene_graph",)
+"""Endpoints retrieved for every query, e.g. to look up objects first."""
+MIN_SIMILARITY = 0.3
+"""Cosine similarity below which no endpoint is considered to match a query."""
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 2
+"""Times the words of an endpoint's name count, e.g. add and cube of /add_cube."""
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "for", "from", "i",
+    "in", "is", "it", "its", "me", "my", "of", "on", "or", "please", "the",
+    "them", "this", "to", "what", "with", "you",
+}  # fmt: skip
+CALL_PATTERN = re.compile(r"\b(GET|POST|PUT|PATCH|DELETE)\s+(/[^\s?]*)")
+"""An API call in a plan, e.g. POST /move_object?name=Cube."""
+
+
+def stem(word: str) -> str:
+    """Strip a plural or third person s: adds -> add, spheres -> sphere."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words without stop words, scene_graph -> scene, graph."""
+    return [
+        stem(word)
+        for word in WORD_PATTERN.findall(text.lower())
+        if word not in STOP_WORDS
+    ]
+
+
+def get_endpoint_text(name: str, description: str) -> str:
+    """Name and description of an endpoint up to the returned model."""
+    return f"{name} {description.split('Returns:')[0]}"
+
+
+def get_plan_endpoints(plan: str) -> List[str]:
+    """Endpoints called in a plan, e.g. ["POST /move_object"]."""
+    return [
+        f"{method} {path.rstrip('.,;:)')}"
+        for method, path in CALL_PATTERN.findall(plan)
+    ]
+
+
+def is_plan_covered(plan: str, names: Sequence[str]) -> bool:
+    """Whether the plan calls endpoints, all of them among names.
+
+    Path parameters of names match any value, so GET /users/{id} covers
+    GET /users/42.
+    """
+    patterns = [
+        re.compile(re.sub(r"\\\{.*?\\\}", "[^/]+", re.escape(name)) + "$")
+        for name in names
+    ]
+    endpoints = get_plan_endpoints(plan)
+    return bool(endpoints) and all(
+        any(pattern.match(endpoint) for pattern in patterns) for endpoint in endpoints
+    )
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+
+class EndpointIndex:
+    """Ranks the endpoints of a reduced spec by their relevance to a query."""
+
+    def __init__(
+        self,
+        endpoints: Sequence[Tuple[str, str, Any]],
+        top_k: int = TOP_K,
+        embeddings: Optional[Embeddings] = None,
+        always_included: Sequence[str] = ALWAYS_INCLUDED,
+    ):
+        """
+        Args:
+            endpoints: The (name, description, docs) tuples of a ReducedOpenAPISpec.
+            embeddings: Model to rank by embedding similarity instead of BM25.
+                The endpoints are embedded once, the query on every retrieval.
+        """
+        self.names = [name for name, _, _ in endpoints]
+        self.top_k = top_k
+        self.embeddings = embeddings
+        self.always_included = [name for name in always_included if name in self.names]
+        texts = [
+            get_endpoint_text(name, description) for name, description, _ in endpoints
+        ]
+        if embeddings is not None:
+            self.vectors = embeddings.embed_documents(texts)
+            return
+
+        self.documents = [
+            Counter(tokenize(text) + tokenize(name) * (NAME_WEIGHT - 1))
+            for name, text in zip(self.names, texts)
+        ]
+        self.lengths = [sum(document.values()) for document in self.documents]
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+        frequencies = Counter(word for document in self.documents for word in document)
+        count = len(self.documents)
+        self.idf = {
+            word: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for word, frequency in frequencies.items()
+        }
+
+    def score(self, query: str) -> List[float]:
+        """Relevance of every endpoint to the query, in the order of the spec."""
+        if self.embeddings is not None:
+            vector = self.embeddings.embed_query(query)
+            return [cosine_similarity(vector, other) for other in self.vectors]
+
+        words = set(tokenize(query))
+        scores = []
+        for document, length in zip(self.documents, self.lengths):
+            score = 0.0
+            for word in words & document.keys():
+                frequency = document[word]
+                score += self.idf[word] * (
+                    frequency
+                    * (BM25_K1 + 1)
+                    / (
+                        frequency
+                        + BM25_K1 * (1 - BM25_B + BM25_B * length / self.average_length)
+                    )
+                )
+            scores.append(score)
+        return scores
+
+    def retrieve(self, query: str) -> Optional[List[str]]:
+        """The top_k endpoints for the query and the always included ones.
+
+        Returns:
+            Endpoint names in the order of the spec, or None if no endpoint
+            matches the query and the planner should get all of them.
+        """
+        scores = self.score(query)
+        threshold = MIN_SIMILARITY if self.embeddings is not None else 0.0
+        if not scores or max(scores) <= threshold:
+            return None
+        ranked = sorted(range(len(scores)), key=lambda index: -scores[index])
+        selected = {
+            self.names[index]
+            for index in ranked[: self.top_k]
+            if scores[index] > threshold
+        }
+        selected.update(self.always_included)
+        return [name for name in self.names if name in selected]
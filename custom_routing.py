@@ -0,0 +1,110 @@
+"""Models and generation budgets of the agents' chains, configured in ROUTES.
+
+Every LLM call of the agents belongs to a chain (see
+custom_agent_tracing.LLM_CHAINS): the orchestrator, the planner, the
+controller agent, the parser of API responses (the PARSING_*_PROMPT chains)
+and the structured agent. They used to share one model with Ollama's default
+options. ModelRouter gives every chain the model and options of its route,
+e.g. a small fast model for parsing and a stronger one for planning, with a
+num_predict limit, stop sequences and a temperature. Chains with the same
+model and options share one CustomLLM, and so its registered prompt prefixes.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.pydantic_v1 import BaseModel
+
+from custom_ollama import CustomLLM, model_name, ollama_base_url
+
+CHAINS = ("orchestrator", "planner", "controller", "parser", "structured")
+"""The chains of the agents, named as in custom_agent_tracing.LLM_CHAINS."""
+
+
+class ModelRoute(BaseModel):
+    """Model and generation options of a chain; None keeps Ollama's default."""
+
+    model: str = model_name
+    num_predict: Optional[int] = None
+    """Maximum tokens generated per call."""
+    stop: Optional[List[str]] = None
+    """Stop sequences, added to those of the agent, e.g. "\\nObservation:"."""
+    temperature: Optional[float] = None
+    base_url: Optional[str] = None
+    """Ollama server of the model, the router's by default."""
+
+
+ROUTES: Dict[str, ModelRoute] = {
+    "orchestrator": ModelRoute(num_predict=256, temperature=0),
+    # Plans list a few calls; stop before the planner continues the examples.
+    "planner": ModelRoute(num_predict=256, stop=["\nUser query:"], temperature=0),
+    "controller": ModelRoute(num_predict=256, temperature=0),
+    # Answers extract values from large responses, e.g. a list of objects.
+    "parser": ModelRoute(num_predict=512, temperature=0),
+    "structured": ModelRoute(num_predict=256, temperature=0),
+}
+"""Route of every chain. Put a small model on the parser for latency, e.g.
+ModelRoute(model="qwen2:1.5b-instruct", num_predict=512, temperature=0)."""
+
+
+class ModelRouter:
+    """Creates the LLM of every chain from its route."""
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, ModelRoute]] = None,
+        base_url: str = ollama_base_url,
+        **llm_kwargs: Any,
+    ):
+        """
+        Args:
+            routes: Route per chain, ROUTES by default. Chains without a route
+                get a ModelRoute(), the default model with default options.
+            llm_kwargs: Further CustomLLM fields of every model, e.g. keep_alive.
+        """
+        self.routes = ROUTES if routes is None else routes
+        self.base_url = base_url
+        self.llm_kwargs = llm_kwargs
+        self._llms: Dict[Tuple, CustomLLM] = {}
+
+    def get_route(self, chain: str) -> ModelRoute:
+        return self.routes.get(chain) or ModelRoute()
+
+    def get_llm(self, chain: str) -> CustomLLM:
+        """The LLM of a chain, shared by the chains of the same route."""
+        route = self.get_route(chain)
+        key = (
+            route.model,
+            route.base_url or self.base_url,
+            route.num_predict,
+            tuple(route.stop or ()),
+            route.temperature,
+        )
+        if key not in self._llms:
+            self._llms[key] = CustomLLM(
+                model=route.model,
+                base_url=route.base_url or self.base_url,
+                num_predict=route.num_predict,
+                stop=route.stop,
+                temperature=route.temperature,
+                **self.llm_kwargs,
+            )
+        return self._llms[key]
+
+    @property
+    def llms(self) -> List[CustomLLM]:
+        """The LLMs created so far, e.g. to warm them up."""
+        return list(self._llms.values())
+
+    @property
+    def models(self) -> List[str]:
+        """The models of all routes, e.g. to pull them."""
+        return sorted(
+            {self.get_route(chain).model for chain in (*CHAINS, *self.routes)}
+        )
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        """The route of every chain, as reported by the language server."""
+        return {
+            chain: self.get_route(chain).dict(exclude_none=True)
+            for chain in dict.fromkeys((*CHAINS, *self.routes))
+        }
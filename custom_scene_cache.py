@@ -0,0 +1,100 @@
+"""Serialized scene views shared by concurrent readers until the scene changes.
+
+Every GET /scene_graph used to walk bpy.data.objects, build the pydantic
+models and serialize them, even when many agents or UIs polled at once.
+SceneCache keys the serialized bytes by the scene version, which main.py
+bumps on every mutation (see invalidate), so repeated reads of an unchanged
+scene cost a lookup. Concurrent readers of a version that is not cached yet
+share one build (singleflight): the first reader takes a snapshot from bpy
+on the event loop, where all bpy access happens, then builds and serializes
+it in a worker thread, which the other readers await instead of building
+their own.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from custom_metrics import cache_requests, record_cache
+
+MAX_ENTRIES = 64
+"""Serialized views kept per scene version, e.g. of different queries."""
+
+
+class SceneCache:
+    """Bytes per key and scene version, built once for all waiting readers."""
+
+    def __init__(self, name: str = "scene_graph", max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self.enabled = True
+        """False builds every response on the event loop, as before the cache."""
+        self.version = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._builds: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def invalidate(self) -> None:
+        """Mark the scene changed; call after every bpy mutation."""
+        self.version += 1
+        self._entries.clear()
+
+    async def get(
+        self,
+        key: Hashable,
+        snapshot: Callable[[], Any],
+        serialize: Callable[[Any], bytes],
+    ) -> bytes:
+        """The bytes of key for the current scene version.
+
+        Args:
+            snapshot: Reads what serialize needs from bpy, on the event loop.
+            serialize: Turns the snapshot into bytes, in a worker thread, so it
+                must not touch bpy.
+        """
+        if not self.enabled:
+            return serialize(snapshot())
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            record_cache(self.name, True)
+            return self._entries[key]
+        build = self._builds.get((self.version, key))
+        if build is not None:
+            self.stats["coalesced"] += 1
+            cache_requests.inc(cache=self.name, result="coalesced")
+        else:
+            self.stats["misses"] += 1
+            record_cache(self.name, False)
+            build = asyncio.ensure_future(
+                self._build(self.version, key, snapshot(), serialize)
+            )
+            self._builds[(self.version, key)] = build
+        # A reader that disconnects must not cancel the build of the others.
+        return await asyncio.shield(build)
+
+    async def _build(
+        self,
+        version: int,
+        key: Hashable,
+        snapshot: Any,
+        serialize: Callable[[Any], bytes],
+    ) -> bytes:
+        try:
+            body = await asyncio.to_thread(serialize, snapshot)
+        finally:
+            del self._builds[(version, key)]
+        if version == self.version:
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def summary(self) -> Dict[str, Any]:
+        requests = sum(self.stats.values())
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / requests, 3) if requests else 0.0,
+        }
@@ -0,0 +1,252 @@
+"""Filtered, projected and paginated scene graph queries over a SceneIndex.
+
+GET /scene_graph used to return every object with every field. Its query
+parameters now select objects by type and name glob, project them to some
+fields, sort and paginate them, evaluated against a SceneIndex: the objects
+of one scene version with their positions per type and in name order, and
+sort orders built on first use. Pages continue after the sort key of the
+last object (keyset pagination), so a cursor stays valid when objects are
+added or removed between pages.
+
+No bpy here: main.py snapshots the objects, and their bounds (see
+custom_bounds) when a query asks for them; queries run in worker threads.
+"""
+
+import base64
+import binascii
+import bisect
+import fnmatch
+import json
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from custom_bounds import Bounds
+
+FIELDS = ("name", "type", "location", "rotation", "scale", "bounds")
+"""Fields a query can project the objects to; the name is always included."""
+DEFAULT_FIELDS = ("name", "type", "location", "rotation", "scale")
+"""Fields of a query without fields; bounds need a pass over the scene."""
+SORT_KEYS = ("name", "type", "location.x", "location.y", "location.z")
+"""Sort orders of a query, descending with a "-" prefix."""
+MAX_LIMIT = 1000
+"""Largest page a query can ask for."""
+
+ObjectSnapshot = Tuple[
+    str, str, Tuple[float, ...], Tuple[float, ...], Tuple[float, ...]
+]
+"""Name, type, location, rotation in degrees and scale of an object."""
+
+
+def get_sort_key(obj: ObjectSnapshot, sort: str) -> Tuple:
+    """The key of obj in a sort order, ending in the name, which is unique."""
+    name, type, location = obj[0], obj[1], obj[2]
+    if sort == "name":
+        return (name.lower(), name)
+    if sort == "type":
+        return (type, name.lower(), name)
+    return (location["xyz".index(sort[-1])], name.lower(), name)
+
+
+def to_dict(vector: Sequence[float]) -> Dict[str, float]:
+    return {"x": vector[0], "y": vector[1], "z": vector[2]}
+
+
+def split_values(value: Optional[str]) -> List[str]:
+    """The values of a comma-separated parameter, e.g. "MESH,LIGHT"."""
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+class SceneQuery:
+    """Parameters of a scene graph query; raises ValueError if invalid."""
+
+    def __init__(
+        self,
+        types: Optional[str] = None,
+        name: Optional[str] = None,
+        fields: Optional[str] = None,
+        sort: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        self.types = tuple(sorted({value.upper() for value in split_values(types)}))
+        self.name = name.lower() if name else None
+        self.fields = tuple(value.lower() for value in split_values(fields))
+        for field in self.fields:
+            if field not in FIELDS:
+                raise ValueError(f"Unknown field {field!r}, use some of {FIELDS}")
+        self.fields = self.fields or DEFAULT_FIELDS
+        if sort and sort.lstrip("-") not in SORT_KEYS:
+            raise ValueError(f"Unknown sort {sort!r}, use one of {SORT_KEYS}")
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        # Pages need a total order; the scene's own order shifts on changes.
+        self.sort = sort or ("name" if limit or cursor else None)
+        self.limit = limit
+        self.cursor = cursor
+        self.after = self._decode_cursor(cursor) if cursor else None
+
+    @property
+    def bounds(self) -> bool:
+        """Whether the query needs the bounds of the objects."""
+        return "bounds" in self.fields
+
+    @property
+    def key(self) -> Tuple:
+        """Identifies the query's response within a scene version."""
+        return (self.types, self.name, self.fields, self.sort, self.limit, self.cursor)
+
+    def _decode_cursor(self, cursor: str) -> Tuple:
+        try:
+            sort, *key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError, binascii.Error):
+            raise ValueError(f"Invalid cursor {cursor!r}")
+        if sort != self.sort:
+            raise ValueError("The cursor belongs to a query with another sort")
+        # get_sort_key's shape, or comparing it with the keys raises TypeError.
+        sort = sort.lstrip("-")
+        types = {"name": (str, str), "type": (str, str, str)}.get(
+            sort, ((int, float), str, str)
+        )
+        if len(key) != len(types) or not all(
+            isinstance(value, type) and not isinstance(value, bool)
+            for value, type in zip(key, types)
+        ):
+            raise ValueError(f"Invalid cursor {cursor!r}")
+        return tuple(key)
+
+    def encode_cursor(self, obj: ObjectSnapshot) -> str:
+        key = [self.sort, *get_sort_key(obj, self.sort.lstrip("-"))]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+class SceneIndex:
+    """The objects of one scene version, indexed for SceneQuery."""
+
+    def __init__(
+        self,
+        objects: Sequence[ObjectSnapshot],
+        version: int = 0,
+        bounds: Optional[Sequence[Bounds]] = None,
+    ):
+        """
+        Args:
+            bounds: The bounds of the objects in their order, if queries ask
+                for them.
+        """
+        self.objects = list(objects)
+        self.version = version
+        self.bounds = bounds
+        self.by_type: Dict[str, List[int]] = {}
+        for position, obj in enumerate(self.objects):
+            self.by_type.setdefault(obj[1], []).append(position)
+        self._names = sorted(
+            (obj[0].lower(), position) for position, obj in enumerate(self.objects)
+        )
+        self._ranks: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def get_ranks(self, sort: str) -> List[int]:
+        """Position in the sort order of every object, built on first use."""
+        with self._lock:
+            if sort not in self._ranks:
+                order = sorted(
+                    range(len(self.objects)),
+                    key=lambda position: get_sort_key(self.objects[position], sort),
+                )
+                ranks = [0] * len(order)
+                for rank, position in enumerate(order):
+                    ranks[position] = rank
+                self._ranks[sort] = ranks
+            return self._ranks[sort]
+
+    def match_name(self, pattern: str, positions: List[int]) -> List[int]:
+        """Positions whose lowercase name matches a glob, or starts with pattern
+        if it has no wildcards."""
+        wildcards = "*?["
+        prefix = pattern.rstrip("*")
+        if not any(char in prefix for char in wildcards):
+            # A prefix: a range of the names in order, no scan of the scene.
+            start = bisect.bisect_left(self._names, (prefix,))
+            matches = set()
+            for name, position in self._names[start:]:
+                if not name.startswith(prefix):
+                    break
+                matches.add(position)
+            return [position for position in positions if position in matches]
+        return [
+            position
+            for position in positions
+            if fnmatch.fnmatchcase(self.objects[position][0].lower(), pattern)
+        ]
+
+    def select(self, query: SceneQuery) -> Tuple[List[int], int, Optional[str]]:
+        """Positions of the page of objects, the total matches and the next cursor."""
+        if query.types:
+            positions = sorted(
+                position
+                for type in query.types
+                for position in self.by_type.get(type, [])
+            )
+        else:
+            positions = list(range(len(self.objects)))
+        if query.name:
+            positions = self.match_name(query.name, positions)
+        total = len(positions)
+        if query.sort:
+            sort = query.sort.lstrip("-")
+            descending = query.sort.startswith("-")
+            ranks = self.get_ranks(sort)
+            positions.sort(key=ranks.__getitem__, reverse=descending)
+            if query.after is not None:
+                keys = {
+                    position: get_sort_key(self.objects[position], sort)
+                    for position in positions
+                }
+                positions = [
+                    position
+                    for position in positions
+                    if (
+                        keys[position] < query.after
+                        if descending
+                        else keys[position] > query.after
+                    )
+                ]
+        next_cursor = None
+        if query.limit is not None and len(positions) > query.limit:
+            positions = positions[: query.limit]
+            next_cursor = query.encode_cursor(self.objects[positions[-1]])
+        return positions, total, next_cursor
+
+    def to_dict(self, position: int, fields: Sequence[str]) -> Dict[str, Any]:
+        """An object as SceneGraph serializes it, with only the given fields."""
+        name, type, location, rotation, scale = self.objects[position]
+        data: Dict[str, Any] = {"id": name, "name": name}
+        if "type" in fields:
+            data["type"] = type
+        transform = {}
+        for field, vector in (
+            ("location", location),
+            ("rotation", rotation),
+            ("scale", scale),
+        ):
+            if field in fields:
+                transform[field] = to_dict(vector)
+        if transform:
+            data["object_transform"] = transform
+        if "bounds" in fields:
+            low, high, dimensions = self.bounds[position]
+            data["bounding_box"] = {"min": to_dict(low), "max": to_dict(high)}
+            data["dimensions"] = to_dict(dimensions)
+        return data
+
+    def query(self, query: SceneQuery) -> bytes:
+        """The JSON response of a query."""
+        positions, total, next_cursor = self.select(query)
+        body = {
+            "objects": [self.to_dict(position, query.fields) for position in positions],
+            "total": total,
+            "next_cursor": next_cursor,
+        }
+        return json.dumps(
+            body, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
@@ -0,0 +1,258 @@
+"""Spatial index over the world-space bounding boxes of the scene's objects.
+
+Questions like "which objects are near the Cube" or "is this region free"
+used to need the whole scene graph in an LLM prompt. SpatialIndex answers
+them on the server in milliseconds: nearest neighbours, objects within a
+radius or a box, and overlapping objects.
+
+It is a uniform grid of cells, each listing the objects whose axis-aligned
+bounding box (AABB) touches it. Updating an object only moves it between
+the cells of its old and new box, so main.py keeps the index current per
+mutation instead of rebuilding it. (mathutils.kdtree needs a rebuild after
+every change and only indexes points; mathutils.bvhtree indexes triangles,
+not boxes.) Objects spanning more than MAX_CELLS cells, e.g. a ground
+plane, are kept aside and checked by every query.
+
+Distances are from a point to the nearest point of a box, 0 inside it. No
+bpy here: main.py computes the boxes, see custom_bounds.
+"""
+
+import itertools
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+Point = Tuple[float, float, float]
+AABB = Tuple[Point, Point]
+"""The minimum and maximum corner of an axis-aligned bounding box."""
+Cell = Tuple[int, int, int]
+
+CELL_SIZE = 4.0
+"""Edge of a grid cell in Blender units, a few times a default primitive."""
+MAX_CELLS = 512
+"""Objects spanning more cells are checked by every query instead."""
+
+
+def get_distance(point: Point, box: AABB) -> float:
+    """Distance from point to the nearest point of box, 0 inside."""
+    low, high = box
+    return math.sqrt(
+        sum(max(low[i] - point[i], 0.0, point[i] - high[i]) ** 2 for i in range(3))
+    )
+
+
+def get_center(box: AABB) -> Point:
+    return tuple((box[0][i] + box[1][i]) / 2 for i in range(3))
+
+
+def intersects(a: AABB, b: AABB) -> bool:
+    """Whether two boxes share volume; touching faces do not count."""
+    return all(a[0][i] < b[1][i] and b[0][i] < a[1][i] for i in range(3))
+
+
+def touches(a: AABB, b: AABB) -> bool:
+    """Whether two boxes intersect or touch, e.g. a plane lying on a box's face."""
+    return all(a[0][i] <= b[1][i] and b[0][i] <= a[1][i] for i in range(3))
+
+
+def contains(outer: AABB, inner: AABB) -> bool:
+    return all(
+        outer[0][i] <= inner[0][i] and inner[1][i] <= outer[1][i] for i in range(3)
+    )
+
+
+class SpatialIndex:
+    """Uniform grid over AABBs with incremental updates."""
+
+    def __init__(self, cell_size: float = CELL_SIZE, max_cells: int = MAX_CELLS):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.boxes: Dict[str, AABB] = {}
+        self.cells: Dict[Cell, Set[str]] = {}
+        self.large: Set[str] = set()
+        self._cells_of: Dict[str, List[Cell]] = {}
+        # Range of the cells ever occupied, the limit of nearest's search.
+        self._bounds: Optional[Tuple[Cell, Cell]] = None
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.boxes
+
+    def _cell(self, point: Point) -> Cell:
+        return tuple(math.floor(value / self.cell_size) for value in point)
+
+    def _cell_range(self, box: AABB) -> Tuple[Cell, Cell]:
+        return self._cell(box[0]), self._cell(box[1])
+
+    @staticmethod
+    def _count_cells(low: Cell, high: Cell) -> int:
+        return math.prod(high[i] - low[i] + 1 for i in range(3))
+
+    @staticmethod
+    def _iter_cells(low: Cell, high: Cell) -> Iterator[Cell]:
+        return itertools.product(*(range(low[i], high[i] + 1) for i in range(3)))
+
+    def update(self, name: str, box: AABB) -> None:
+        """Add an object or move it to its new box."""
+        self.remove(name)
+        self.boxes[name] = box
+        low, high = self._cell_range(box)
+        if self._count_cells(low, high) > self.max_cells:
+            self.large.add(name)
+            return
+        if self._bounds is None:
+            self._bounds = (low, high)
+        else:
+            self._bounds = (
+                tuple(min(low[i], self._bounds[0][i]) for i in range(3)),
+                tuple(max(high[i], self._bounds[1][i]) for i in range(3)),
+            )
+        cells = list(self._iter_cells(low, high))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(name)
+        self._cells_of[name] = cells
+
+    def remove(self, name: str) -> None:
+        if self.boxes.pop(name, None) is None:
+            return
+        self.large.discard(name)
+        for cell in self._cells_of.pop(name, []):
+            members = self.cells[cell]
+            members.discard(name)
+            if not members:
+                del self.cells[cell]
+
+    def clear(self) -> None:
+        self.boxes.clear()
+        self.cells.clear()
+        self.large.clear()
+        self._cells_of.clear()
+        self._bounds = None
+
+    def _candidates(self, box: AABB) -> Set[str]:
+        """Names of the objects that may touch box."""
+        if self._bounds is None:
+            return set(self.large)
+        # Only the cells ever occupied can hold objects, however large the box.
+        low, high = self._cell_range(box)
+        low = tuple(max(low[i], self._bounds[0][i]) for i in range(3))
+        high = tuple(min(high[i], self._bounds[1][i]) for i in range(3))
+        if any(low[i] > high[i] for i in range(3)):
+            return set(self.large)
+        if self._count_cells(low, high) > len(self.cells):
+            # Fewer occupied cells than cells in the box: scan those instead.
+            names = set(self.large)
+            for cell, members in self.cells.items():
+                if all(low[i] <= cell[i] <= high[i] for i in range(3)):
+                    names |= members
+            return names
+        names = set(self.large)
+        for cell in self._iter_cells(low, high):
+            names |= self.cells.get(cell, set())
+        return names
+
+    def query_box(self, box: AABB, contained: bool = False) -> List[str]:
+        """Names of the objects touching box, or inside it if contained."""
+        return sorted(
+            name
+            for name in self._candidates(box)
+            if (
+                contains(box, self.boxes[name])
+                if contained
+                else touches(box, self.boxes[name])
+            )
+        )
+
+    def query_radius(self, point: Point, radius: float) -> List[Tuple[str, float]]:
+        """Names and distances of the objects within radius of point, nearest first."""
+        box = (
+            tuple(value - radius for value in point),
+            tuple(value + radius for value in point),
+        )
+        matches = [
+            (name, get_distance(point, self.boxes[name]))
+            for name in self._candidates(box)
+        ]
+        return sorted(
+            ((name, distance) for name, distance in matches if distance <= radius),
+            key=lambda match: (match[1], match[0]),
+        )
+
+    def _shell(self, center: Cell, ring: int) -> Iterator[Cell]:
+        """The cells at Chebyshev distance ring from center."""
+        if ring == 0:
+            yield center
+            return
+        x, y, z = center
+        for dx in range(-ring, ring + 1):
+            for dy in range(-ring, ring + 1):
+                if abs(dx) == ring or abs(dy) == ring:
+                    dzs = range(-ring, ring + 1)
+                else:
+                    dzs = (-ring, ring)
+                for dz in dzs:
+                    yield (x + dx, y + dy, z + dz)
+
+    def nearest(
+        self, point: Point, k: int = 1, exclude: Iterable[str] = ()
+    ) -> List[Tuple[str, float]]:
+        """The k objects nearest to point with their distances, nearest first.
+
+        Searches the grid ring by ring around the point's cell: an object not
+        found within ring r lies outside it, at least r cells away, so the
+        search stops once k objects are nearer than that.
+        """
+        exclude = set(exclude)
+        distances = {
+            name: get_distance(point, self.boxes[name]) for name in self.large - exclude
+        }
+        if not self.cells:
+            return self._top(distances, k)
+        center = self._cell(point)
+        low, high = self._bounds
+        max_ring = max(max(center[i] - low[i], high[i] - center[i]) for i in range(3))
+        for ring in range(max_ring + 1):
+            if (2 * ring + 1) ** 3 > 8 * len(self.cells):
+                # A sparse grid: checking every object is cheaper than the shells.
+                for name in self.boxes.keys() - exclude - distances.keys():
+                    distances[name] = get_distance(point, self.boxes[name])
+                break
+            for cell in self._shell(center, ring):
+                for name in self.cells.get(cell, ()):
+                    if name not in distances and name not in exclude:
+                        distances[name] = get_distance(point, self.boxes[name])
+            bound = ring * self.cell_size
+            if sum(distance <= bound for distance in distances.values()) >= k:
+                break
+        return self._top(distances, k)
+
+    @staticmethod
+    def _top(distances: Dict[str, float], k: int) -> List[Tuple[str, float]]:
+        return sorted(distances.items(), key=lambda item: (item[1], item[0]))[:k]
+
+    def overlaps(self, name: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Pairs of objects whose boxes intersect, or those intersecting name."""
+        if name is not None:
+            box = self.boxes[name]
+            return [
+                (name, other)
+                for other in sorted(self._candidates(box))
+                if other != name and intersects(box, self.boxes[other])
+            ]
+        pairs: Set[Tuple[str, str]] = set()
+        candidates = [
+            pair
+            for members in self.cells.values()
+            for pair in itertools.combinations(sorted(members), 2)
+        ]
+        candidates += [
+            tuple(sorted((large, other)))
+            for large in self.large
+            for other in self.boxes
+            if other != large
+        ]
+        for a, b in candidates:
+            if (a, b) not in pairs and intersects(self.boxes[a], self.boxes[b]):
+                pairs.add((a, b))
+        return sorted(pairs)
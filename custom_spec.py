@@ -0,0 +1,212 @@
+"""Loading of the Blender API's OpenAPI spec for the language server.
+
+The spec is fetched asynchronously with retry and backoff, cached on disk so
+restarts can build the agent before main.py answers, and polled so that new
+or changed endpoints are picked up without restarting the language server.
+
+reduce_openapi_spec is langchain's, but keeps the optional query parameters
+that langchain drops, like the fields and limit of GET /scene_graph, so the
+controller and the endpoint tools can pass them.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import requests
+from langchain_community.agent_toolkits.openapi import spec as openapi_spec
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec
+from langchain_core.utils.json_schema import dereference_refs
+
+from custom_metrics import record_cache
+
+logging.basicConfig(level=logging.INFO)
+
+OPENAPI_SPEC_URL = "http://localhost:8000/openapi.json"
+"""Where main.py publishes its OpenAPI spec."""
+
+SPEC_CACHE_PATH = Path.absolute(Path(__file__).parent) / ".openapi_cache.json"
+"""On-disk cache of the last spec fetched from main.py."""
+
+REFRESH_INTERVAL = 30.0
+"""Seconds between checks for a changed spec."""
+
+
+def get_spec_hash(openapi_spec: Dict[str, Any]) -> str:
+    """Returns a stable hash of the spec's content."""
+    data = json.dumps(openapi_spec, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def load_cached_spec(cache_path: Path) -> Optional[Dict[str, Any]]:
+    """Returns the cached {"spec", "hash", "etag"} entry, if there is a valid one."""
+    try:
+        cached = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or "spec" not in cached:
+        return None
+    if cached.get("hash") != get_spec_hash(cached["spec"]):
+        logging.log(logging.WARNING, f"Ignoring corrupt spec cache {cache_path}")
+        return None
+    return cached
+
+
+def save_cached_spec(
+    cache_path: Path, openapi_spec: Dict[str, Any], etag: Optional[str] = None
+) -> None:
+    cached = {"hash": get_spec_hash(openapi_spec), "etag": etag, "spec": openapi_spec}
+    temporary_path = cache_path.with_suffix(".tmp")
+    temporary_path.write_text(json.dumps(cached))
+    temporary_path.replace(cache_path)
+
+
+async def fetch_openapi_spec(
+    url: str,
+    etag: Optional[str] = None,
+    retries: int = 5,
+    backoff: float = 0.5,
+    max_backoff: float = 10.0,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Fetch the spec without blocking the event loop.
+
+    Args:
+        url (str): The URL of the OpenAPI spec.
+        etag (Optional[str]): ETag of the cached spec, sent as If-None-Match.
+        retries (int): Attempts before giving up; the delay doubles after each.
+        backoff (float): Delay in seconds after the first failed attempt.
+        max_backoff (float): Upper bound of the delay between attempts.
+
+    Returns:
+        Tuple[Optional[Dict[str, Any]], Optional[str]]: The spec and its ETag, or
+        (None, etag) if the server answered 304 Not Modified.
+
+    Raises:
+        requests.RequestException: If every attempt failed.
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    delay = backoff
+    for attempt in range(1, retries + 1):
+        try:
+            response = await asyncio.to_thread(
+                requests.get, url, headers=headers, timeout=10
+            )
+            if response.status_code == 304:
+                return None, etag
+            response.raise_for_status()
+            return response.json(), response.headers.get("ETag")
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            logging.log(
+                logging.INFO,
+                f"Fetching {url} failed ({e}), retry {attempt}/{retries - 1} in {delay}s",
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+
+def reduce_parameter(parameter: Dict[str, Any]) -> Dict[str, Any]:
+    """An optional query parameter without the title and the repeated
+    description of its schema."""
+    schema = {
+        key: value
+        for key, value in parameter.get("schema", {}).items()
+        if key not in ("title", "description")
+    }
+    return {**parameter, "schema": schema}
+
+
+def reduce_openapi_spec(spec: Dict[str, Any]) -> ReducedOpenAPISpec:
+    """langchain's reduce_openapi_spec, keeping optional query parameters."""
+    reduced = openapi_spec.reduce_openapi_spec(spec)
+    for endpoint, _, docs in reduced.endpoints:
+        method, route = endpoint.split(" ", 1)
+        parameters = spec["paths"][route][method.lower()].get("parameters", [])
+        if parameters:
+            parameters = dereference_refs({"parameters": parameters}, full_schema=spec)[
+                "parameters"
+            ]
+            docs["parameters"] = [
+                parameter if parameter.get("required") else reduce_parameter(parameter)
+                for parameter in parameters
+                if parameter.get("required") or parameter.get("in") == "query"
+            ]
+    return reduced
+
+
+class OpenAPISpecLoader:
+    """Keeps the OpenAPI spec of the Blender API current.
+
+    on_change is awaited with the spec and its hash whenever a spec with a new
+    hash is loaded, first from the disk cache and then from main.py.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[Dict[str, Any], str], Awaitable[None]],
+        url: str = OPENAPI_SPEC_URL,
+        cache_path: Path = SPEC_CACHE_PATH,
+        refresh_interval: float = REFRESH_INTERVAL,
+    ):
+        self.on_change = on_change
+        self.url = url
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self.spec_hash: Optional[str] = None
+        self.etag: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the cached spec, if any, and start polling main.py in the background."""
+        cached = load_cached_spec(self.cache_path)
+        record_cache("openapi_spec_file", cached is not None)
+        if cached:
+            logging.log(logging.INFO, f"Loaded OpenAPI spec from {self.cache_path}")
+            self.etag = cached.get("etag")
+            try:
+                await self._apply(cached["spec"], cached["hash"])
+            except Exception as e:
+                logging.log(logging.WARNING, f"Could not apply cached spec: {e}")
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def refresh(self) -> bool:
+        """Fetch the spec from main.py, returns whether it changed."""
+        openapi_spec, etag = await fetch_openapi_spec(self.url, self.etag)
+        if self.etag:
+            record_cache("openapi_spec_etag", openapi_spec is None)
+        if openapi_spec is None:
+            return False
+        self.etag = etag
+        spec_hash = get_spec_hash(openapi_spec)
+        if spec_hash == self.spec_hash:
+            return False
+        save_cached_spec(self.cache_path, openapi_spec, etag)
+        await self._apply(openapi_spec, spec_hash)
+        return True
+
+    async def _apply(self, openapi_spec: Dict[str, Any], spec_hash: str) -> None:
+        logging.log(logging.INFO, f"Applying OpenAPI spec {spec_hash[:12]}")
+        await self.on_change(openapi_spec, spec_hash)
+        self.spec_hash = spec_hash
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.log(logging.WARNING, f"Could not refresh OpenAPI spec: {e}")
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,304 @@
+"""An agent calling typed tools generated from the OpenAPI spec.
+
+Instead of the orchestrator, planner and controller exchanging free-text
+Action/Action Input blocks, every endpoint of main.py becomes a tool whose
+arguments are a pydantic model built from the endpoint's parameters and
+request body, e.g. move_object(name: str, x: float, y: float, z: float). The
+agent answers with one JSON object per step and Ollama's format=json
+constrains generation to valid JSON, so the output always parses.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+from urllib.parse import quote
+
+from langchain.agents.agent import Agent, AgentExecutor, AgentOutputParser
+from langchain.agents.output_parsers.json import JSONAgentOutputParser
+from langchain_community.agent_toolkits.openapi.spec import ReducedOpenAPISpec
+from langchain_community.llms.ollama import Ollama
+from langchain_community.utilities.requests import RequestsWrapper
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.memory import BaseMemory
+from langchain_core.prompts import BasePromptTemplate, PromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field, create_model
+from langchain_core.tools import BaseTool, StructuredTool
+
+from custom_executor import PlanExecutor, PlanStep, get_body_schema
+from custom_memory import (
+    RECENT_STEPS,
+    SCRATCHPAD_MAX_TOKENS,
+    bound_intermediate_steps,
+    get_history_variables,
+)
+from custom_planner import _get_token_counter, _register_prompt_prefix
+from custom_planner_prompt import STRUCTURED_AGENT_PROMPT
+from custom_response import get_response_schemas
+from custom_routing import ModelRouter
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+JSON_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool}
+
+
+def schema_to_type(name: str, schema: Dict[str, Any]) -> Any:
+    """Python type of a (dereferenced) JSON schema, objects become models."""
+    if "properties" in schema:
+        return schema_to_model(name, schema)
+    if schema.get("type") == "array":
+        return List[schema_to_type(f"{name}Item", schema.get("items", {}))]
+    if len(schema.get("allOf", [])) == 1:
+        return schema_to_type(name, schema["allOf"][0])
+    return JSON_TYPES.get(schema.get("type"), Any)
+
+
+def schema_to_field(
+    name: str, schema: Dict[str, Any], required: bool
+) -> Tuple[Any, Any]:
+    field_type = schema_to_type(schema.get("title", name).replace(" ", ""), schema)
+    if not required:
+        field_type = Optional[field_type]
+    default = ... if required else schema.get("default")
+    return field_type, Field(default, description=schema.get("description"))
+
+
+def schema_to_model(name: str, schema: Dict[str, Any]) -> Type[BaseModel]:
+    required = set(schema.get("required", []))
+    fields = {
+        field: schema_to_field(field, field_schema, field in required)
+        for field, field_schema in schema.get("properties", {}).items()
+    }
+    return create_model(schema.get("title", name).replace(" ", ""), **fields)
+
+
+def describe_schema(schema: Dict[str, Any]) -> Any:
+    """A compact sketch of a JSON schema for the prompt, e.g. {"x": "number"}."""
+    if "properties" in schema:
+        return {
+            field: describe_schema(field_schema)
+            for field, field_schema in schema["properties"].items()
+        }
+    if schema.get("type") == "array":
+        return [describe_schema(schema.get("items", {}))]
+    if len(schema.get("allOf", [])) == 1:
+        return describe_schema(schema["allOf"][0])
+    return schema.get("type", "any")
+
+
+def get_tool_name(endpoint: str) -> str:
+    """POST /users/{id}/cart -> users_id_cart."""
+    return re.sub(r"\W+", "_", endpoint.split(" ", 1)[1]).strip("_") or "root"
+
+
+def to_json(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.dict(exclude_none=True)
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value
+
+
+def create_endpoint_tool(
+    name: str,
+    endpoint: str,
+    description: str,
+    docs: Dict[str, Any],
+    executor: PlanExecutor,
+) -> StructuredTool:
+    """Wrap an endpoint in a tool, with its parameters and body as arguments.
+
+    Path and query parameters are arguments of the tool. The properties of an
+    object body are too, unless one has the name of a parameter; then the body
+    is passed as a single body argument.
+    """
+    method, path = endpoint.split(" ", 1)
+    parameters = [
+        parameter
+        for parameter in docs.get("parameters", [])
+        if parameter.get("in") in ("path", "query")
+    ]
+    parameter_names = {parameter["name"] for parameter in parameters}
+    fields = {
+        parameter["name"]: schema_to_field(
+            parameter["name"],
+            {"description": parameter.get("description"), **parameter["schema"]},
+            parameter.get("required", False) or parameter["in"] == "path",
+        )
+        for parameter in parameters
+    }
+    arguments = {
+        parameter["name"]: parameter["schema"].get("type", "any")
+        for parameter in parameters
+    }
+
+    body_schema = get_body_schema(docs)
+    body_fields: List[str] = []
+    if body_schema is not None:
+        properties = body_schema.get("properties", {})
+        if properties and not parameter_names & properties.keys():
+            required = set(body_schema.get("required", []))
+            fields.update(
+                (field, schema_to_field(field, field_schema, field in required))
+                for field, field_schema in properties.items()
+            )
+            arguments.update(describe_schema(body_schema))
+            body_fields = list(properties)
+        else:
+            fields["body"] = (schema_to_type(f"{name}_body", body_schema), ...)
+            arguments["body"] = describe_schema(body_schema)
+
+    def call_endpoint(**kwargs: Any) -> str:
+        kwargs = {key: to_json(value) for key, value in kwargs.items()}
+        step_path = path
+        params = {}
+        for parameter in parameters:
+            value = kwargs.get(parameter["name"])
+            if parameter["in"] == "path":
+                step_path = step_path.replace(
+                    "{" + parameter["name"] + "}", quote(str(value), safe="")
+                )
+            elif value is not None:
+                params[parameter["name"]] = value
+        if body_fields:
+            data = {field: kwargs[field] for field in body_fields if field in kwargs}
+        else:
+            data = kwargs.get("body")
+        step = PlanStep(
+            text=f"{endpoint} {json.dumps(kwargs)}",
+            method=method,
+            path=step_path,
+            endpoint=endpoint,
+            params=params,
+            data=data,
+            resolved=True,
+        )
+        ok, summary = executor.execute_step(step)
+        return summary if ok else f"The request failed: {summary}"
+
+    summary = description.split("\n\n")[0].strip().rstrip(".")
+    return StructuredTool(
+        name=name,
+        description=f"{summary}. Arguments: {json.dumps(arguments)}",
+        args_schema=create_model(f"{name}_arguments", **fields),
+        func=call_endpoint,
+        handle_validation_error=lambda e: f"Invalid arguments: {e}",
+    )
+
+
+def create_endpoint_tools(
+    api_spec: ReducedOpenAPISpec, requests_wrapper: RequestsWrapper
+) -> List[BaseTool]:
+    """One typed tool per endpoint of the spec."""
+    executor = PlanExecutor(
+        api_spec, requests_wrapper, get_response_schemas(api_spec.endpoints)
+    )
+    names = [get_tool_name(endpoint) for endpoint, _, _ in api_spec.endpoints]
+    tools = []
+    for name, (endpoint, description, docs) in zip(names, api_spec.endpoints):
+        if names.count(name) > 1:
+            # The same path with several methods, e.g. GET and DELETE /cart.
+            name = f"{endpoint.split(' ')[0].lower()}_{name}"
+        tools.append(create_endpoint_tool(name, endpoint, description, docs, executor))
+    logging.log(logging.INFO, f"endpoint tools: {[tool.name for tool in tools]}")
+    return tools
+
+
+class JSONAgent(Agent):
+    """Agent answering with a JSON action or final answer per step."""
+
+    output_parser: AgentOutputParser = Field(default_factory=JSONAgentOutputParser)
+    max_scratchpad_tokens: int = SCRATCHPAD_MAX_TOKENS
+    recent_steps: int = RECENT_STEPS
+
+    @classmethod
+    def _get_default_output_parser(cls, **kwargs: Any) -> AgentOutputParser:
+        return JSONAgentOutputParser()
+
+    @property
+    def _agent_type(self) -> str:
+        return "structured-json"
+
+    @property
+    def observation_prefix(self) -> str:
+        return "Observation: "
+
+    @property
+    def llm_prefix(self) -> str:
+        return ""
+
+    def _construct_scratchpad(
+        self, intermediate_steps: List[Tuple[AgentAction, str]]
+    ) -> str:
+        return super()._construct_scratchpad(
+            bound_intermediate_steps(
+                intermediate_steps,
+                self.max_scratchpad_tokens,
+                self.recent_steps,
+                _get_token_counter(self.llm_chain),
+            )
+        )
+
+    @classmethod
+    def create_prompt(
+        cls, tools: Sequence[BaseTool], memory: Optional[BaseMemory] = None
+    ) -> BasePromptTemplate:
+        memory_variables, history_variables = get_history_variables(memory)
+        return PromptTemplate(
+            template=STRUCTURED_AGENT_PROMPT,
+            input_variables=["input", "agent_scratchpad", *memory_variables],
+            partial_variables={
+                "tool_names": ", ".join([tool.name for tool in tools]),
+                "tool_descriptions": "\n".join(
+                    [f"{tool.name}: {tool.description}" for tool in tools]
+                ),
+                **history_variables,
+            },
+        )
+
+    @classmethod
+    def _validate_tools(cls, tools: Sequence[BaseTool]) -> None:
+        pass
+
+
+def create_structured_openapi_agent(
+    api_spec: ReducedOpenAPISpec,
+    requests_wrapper: RequestsWrapper,
+    llm: BaseLanguageModel,
+    shared_memory: Optional[BaseMemory] = None,
+    callback_manager: Optional[BaseCallbackManager] = None,
+    verbose: bool = True,
+    agent_executor_kwargs: Optional[Dict[str, Any]] = None,
+    router: Optional[ModelRouter] = None,
+    **kwargs: Any,
+) -> AgentExecutor:
+    """Instantiate a single agent calling the endpoints of the spec as typed tools.
+
+    Takes the same arguments as custom_planner.create_openapi_agent. Ollama
+    models are asked for JSON output with format=json. With a router, the
+    agent uses the model of the "structured" route instead of llm.
+    """
+    from langchain.chains.llm import LLMChain
+
+    if router is not None:
+        llm = router.get_llm("structured")
+    tools = create_endpoint_tools(api_spec, requests_wrapper)
+    prompt = JSONAgent.create_prompt(tools, shared_memory)
+    _register_prompt_prefix(llm, prompt)
+    llm_kwargs = {"format": "json"} if isinstance(llm, Ollama) else {}
+    agent = JSONAgent(
+        llm_chain=LLMChain(llm=llm, prompt=prompt, llm_kwargs=llm_kwargs),
+        allowed_tools=[tool.name for tool in tools],
+        **kwargs,
+    )
+    return AgentExecutor.from_agent_and_tools(
+        agent=agent,
+        tools=tools,
+        callback_manager=callback_manager,
+        verbose=verbose,
+        memory=shared_memory,
+        **(agent_executor_kwargs or {}),
+    )
@@ -0,0 +1,248 @@
+"""Tracing of where the time of a request goes, shared by both services.
+
+A span is a dict recording one timed stage of a request: an LLM call, a tool
+call or an HTTP call to main.py in the language server; a request, a bpy
+operation, building the scene graph or a render in main.py. Spans carry the
+correlation id of the request, which the language server sends to main.py in
+the X-Correlation-ID header, so the spans of both services can be joined.
+
+Spans are kept in memory for summarize_spans and exported, if the TRACE_DIR
+environment variable is set, to a JSONL file per service in that directory
+and, with the opentelemetry packages installed, to an OpenTelemetry collector.
+"""
+
+import functools
+import json
+import math
+import os
+import time
+import uuid
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+CORRELATION_HEADER = "X-Correlation-ID"
+"""HTTP header carrying the correlation id from the language server to main.py."""
+
+TRACE_DIR_VARIABLE = "TRACE_DIR"
+"""Environment variable naming the directory of the span files; unset, spans
+are not written to disk."""
+MAX_TRACE_BYTES = 50 * 1024 * 1024
+"""Size at which a span file is rotated."""
+TRACE_BACKUPS = 3
+"""Rotated span files kept per service, traces-<service>.jsonl.1 to .3."""
+
+MAX_SPANS = 10000
+"""Spans kept in memory for the summary."""
+
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+"""Correlation id of the request being handled."""
+
+current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+"""Id of the innermost open span, the parent of new spans."""
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values, q in [0, 100]."""
+    if not values:
+        return 0.0
+    rank = min(max(math.ceil(q / 100 * len(values)), 1), len(values))
+    return values[rank - 1]
+
+
+def summarize_spans(spans: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Count and p50/p95/max duration in milliseconds per stage."""
+    durations: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for span in spans:
+        durations.setdefault(span["stage"], []).append(span["duration_ms"])
+        if span["status"] != "ok":
+            errors[span["stage"]] = errors.get(span["stage"], 0) + 1
+    summary = {}
+    for stage, values in sorted(durations.items()):
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "errors": errors.get(stage, 0),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "max_ms": round(values[-1], 3),
+        }
+    return summary
+
+
+class JSONLExporter:
+    """Appends spans to a file, one JSON object per line, rotated at max_bytes."""
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = MAX_TRACE_BYTES,
+        backups: int = TRACE_BACKUPS,
+    ):
+        self.path = path
+        # delay: the file is created with the first span, not on import.
+        self._handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, delay=True
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, default=str)
+        self._handler.handle(logging.makeLogRecord({"msg": line}))
+
+
+def get_file_exporters(service: str) -> List[JSONLExporter]:
+    """A JSONLExporter to traces-<service>.jsonl in the directory of TRACE_DIR,
+    none if it is unset."""
+    directory = os.environ.get(TRACE_DIR_VARIABLE)
+    if not directory:
+        return []
+    os.makedirs(directory, exist_ok=True)
+    return [JSONLExporter(Path(directory) / f"traces-{service}.jsonl")]
+
+
+class OpenTelemetryExporter:
+    """Sends spans to an OpenTelemetry collector over OTLP/HTTP.
+
+    Needs opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http; the
+    collector is configured with the usual OTEL_EXPORTER_OTLP_* variables.
+    Spans are linked by their correlation_id attribute.
+    """
+
+    def __init__(self, service: str):
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError as e:
+            raise ImportError(
+                "Exporting to OpenTelemetry needs opentelemetry-sdk and "
+                "opentelemetry-exporter-otlp-proto-http."
+            ) from e
+        provider = TracerProvider(resource=Resource.create({"service.name": service}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self._tracer = provider.get_tracer(__name__)
+        self._error_status = Status(StatusCode.ERROR)
+
+    def export(self, span: Dict[str, Any]) -> None:
+        attributes = {
+            key: value if isinstance(value, (str, int, float, bool)) else str(value)
+            for key, value in span["attributes"].items()
+            if value is not None
+        }
+        start_ns = int(span["start"] * 1e9)
+        otel_span = self._tracer.start_span(
+            f"{span['stage']} {span['name']}",
+            start_time=start_ns,
+            attributes={
+                **attributes,
+                "stage": span["stage"],
+                "correlation_id": span["trace_id"] or "",
+            },
+        )
+        if span["status"] != "ok":
+            otel_span.set_status(self._error_status)
+        otel_span.end(end_time=start_ns + int(span["duration_ms"] * 1e6))
+
+
+class Tracer:
+    """Records spans of one service and hands them to the exporters."""
+
+    def __init__(
+        self,
+        service: str,
+        exporters: Optional[List[Any]] = None,
+        max_spans: int = MAX_SPANS,
+    ):
+        self.service = service
+        self.exporters = exporters or []
+        self.spans: deque = deque(maxlen=max_spans)
+
+    def start_span(
+        self,
+        stage: str,
+        name: str,
+        span_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        **attributes: Any,
+    ) -> Dict[str, Any]:
+        """Open a span, finish it with end_span."""
+        return {
+            "service": self.service,
+            "stage": stage,
+            "name": name,
+            "trace_id": trace_id or correlation_id.get(),
+            "span_id": span_id or uuid.uuid4().hex[:16],
+            "parent_id": parent_id or current_span_id.get(),
+            "start": time.time(),
+            "duration_ms": None,
+            "status": "ok",
+            "attributes": attributes,
+            "_perf_start": time.perf_counter(),
+        }
+
+    def elapsed_ms(self, span: Dict[str, Any]) -> float:
+        return (time.perf_counter() - span["_perf_start"]) * 1000
+
+    def end_span(
+        self, span: Dict[str, Any], error: Optional[BaseException] = None
+    ) -> None:
+        span["duration_ms"] = round(self.elapsed_ms(span), 3)
+        del span["_perf_start"]
+        if error is not None:
+            span["status"] = "error"
+            span["attributes"]["error"] = repr(error)
+        self.spans.append(span)
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logging.log(logging.WARNING, f"Could not export span: {e}")
+
+    @contextmanager
+    def span(self, stage: str, name: str, **attributes: Any) -> Iterator[Dict]:
+        """Time the block as a span; nested spans get it as their parent."""
+        span = self.start_span(stage, name, **attributes)
+        token = current_span_id.set(span["span_id"])
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            current_span_id.reset(token)
+
+    def traced(self, stage: str, name: Optional[str] = None) -> Callable:
+        """Decorator recording every call of a function as a span."""
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, name or func.__name__):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return summarize_spans(list(self.spans))
@@ -1,3 +1,5 @@
+import asyncio
+import time
 from contextlib import asynccontextmanager
 from langserve import add_routes
 from langchain.requests import RequestsWrapper
@@ -7,8 +9,18 @@ from langchain_core.language_models import BaseLanguageModel
 # from langchain_community.agent_toolkits.openapi import planner
 
 import custom_planner as planner
-from langchain_community.agent_toolkits.openapi.spec import reduce_openapi_spec
-from typing import Any, Dict, List, Mapping, Optional
+from custom_spec import reduce_openapi_spec
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Type,
+    Union,
+)
 
 # from langchain.llms import ollama as Ollama
 from langchain_community.llms.ollama import Ollama
@@ -25,10 +37,35 @@ import requests
 
 # from langchain_community.agent_toolkits.openapi.base import  create_openapi_agent, OpenAPIToolkit
 import ollama
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from langchain import runnables  # Import Runnable from LangChain
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import merge_configs
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
-from custom_ollama import CustomLLM, RemoveBackslashesCallback, model_name
+from custom_ollama import (
+    AgentStatsCallback,
+    CustomLLM,
+    RemoveBackslashesCallback,
+    model_name,
+    ollama_base_url,
+)
+from custom_agent_tracing import TracedRequestsWrapper, TracingCallback
+from custom_backends import Backend, BackendPool
+from custom_memory import SessionMemory
+from custom_metrics import CONTENT_TYPE, Gauge, MetricsExporter, registry, track_request
+from custom_plan_cache import PlanCache
+from custom_routing import ROUTES, ModelRouter
+from custom_spec import SPEC_CACHE_PATH, OpenAPISpecLoader
+from custom_structured_agent import create_structured_openapi_agent
+from custom_tracing import (
+    CORRELATION_HEADER,
+    Tracer,
+    correlation_id,
+    get_file_exporters,
+    new_correlation_id,
+)
 
 # from langchain_core.language_models.llms import ollama as Ollama
 from langchain_community.llms.ollama import Ollama
@@ -36,86 +73,318 @@ from langchain_community.llms.ollama import Ollama
 from langchain_core.language_models.llms import LLMResult
 
 
-def ensure_model_is_available(model_name):
+def ensure_model_is_available(model_name, host=None):
     """
     Ensures that a model is available by checking if it exists and pulling it if necessary.
 
     Args:
         model_name (str): The name of the model to check and pull if necessary.
+        host (str): The Ollama server, ollama_base_url by default.
 
     Raises:
         ollama.ResponseError: If there is an error while checking or pulling the model.
     """
+    client = ollama.Client(host=host or ollama_base_url)
     try:
         # Attempt to show the model details
-        ollama.show(model_name)
+        client.show(model_name)
     except ollama.ResponseError as e:
         if e.status_code == 404:
             # If the model is not found, pull it
             print(f"Model {model_name} not found. Pulling the model...")
-            ollama.pull(model_name)
+            client.pull(model_name)
         else:
             # If there's another error, raise it
-            raise (f"Error pulling model {model_name}")
+            raise
+
+
+api_base_url = "http://localhost:8000"
+"""Base URL of the Blender API served by main.py."""
+spec_cache_path = SPEC_CACHE_PATH
+"""Where the last OpenAPI spec of main.py is cached."""
+warm_up_enabled = True
+"""Whether to load the model and evaluate the static prompts before traffic."""
+agent_mode = "react"
+""""react" for the orchestrator, planner and controller agents exchanging text,
+"structured" for one agent calling typed endpoint tools with JSON output."""
+model_routes = ROUTES
+"""Model and generation options of every chain of the agent, see custom_routing."""
+ollama_backends: List[Union[str, Backend]] = []
+"""Further Ollama servers, or Backend(url, kind="openai") for OpenAI-compatible
+ones, to spread the agent's LLM requests over along with ollama_base_url."""
+backend_pool: Optional[BackendPool] = None
+"""Pool of the LLM backends, see get_backend_pool."""
+
+agent_stats = AgentStatsCallback()
+"""Steps, LLM calls and parsing failures of the agent and its nested agents,
+reported by /agent_stats."""
+
+tracer = Tracer(
+    "langserver", exporters=[*get_file_exporters("langserver"), MetricsExporter()]
+)
+"""Spans of agent runs, LLM, tool and HTTP calls, summarized by /trace_summary.
+Append OpenTelemetryExporter("langserver") to the exporters to send them to a
+collector as well."""
+tracing_callback = TracingCallback(tracer)
 
+session_memory = SessionMemory()
+"""History of the agent per session_id of the input, persisted in .sessions."""
 
-requests_wrapper = RequestsWrapper()
+plan_cache = PlanCache()
+"""Plans of the planner by query template, persisted in .plan_cache.json and
+cleared when the spec changes. Only used by the react agent."""
 
-# Initialize the OpenAPI toolkit with your OpenAPI spec
-openapi_toolkit = None
-openapi_agent = None
+startup_status: Dict[str, Any] = {"model": "pending"}
+"""Progress of the background startup tasks, reported by /ready."""
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    openapi_spec_url = "http://localhost:8000/openapi.json"
-    response = requests.get(openapi_spec_url)
-    openapi_spec = response.json()  # Parse the JSON response into a Python dictionary
-    openapi_spec["servers"] = [{"url": "http://localhost:8000"}]
+class AgentInput(BaseModel):
+    input: Any
+    session_id: Optional[str] = None
+    """Runs with the same session_id share a history, e.g. the last scene."""
+
+
+class AgentOutput(BaseModel):
+    output: str
+
+
+class AgentProxy(Runnable[Dict[str, Any], Dict[str, Any]]):
+    """Forwards requests to the current agent.
+
+    The routes are bound to the proxy, so the agent can be rebuilt when the
+    OpenAPI spec changes. In-flight requests keep the agent they started with.
+    """
+
+    def __init__(self):
+        self.agent: Optional[AgentExecutor] = None
+        self.spec_hash: Optional[str] = None
+        self.router: Optional[ModelRouter] = None
+
+    def get_input_schema(
+        self, config: Optional[RunnableConfig] = None
+    ) -> Type[BaseModel]:
+        return AgentInput
+
+    def get_output_schema(
+        self, config: Optional[RunnableConfig] = None
+    ) -> Type[BaseModel]:
+        return AgentOutput
+
+    def _get_config(self, config: Optional[RunnableConfig]) -> RunnableConfig:
+        # Passed with the run's callbacks, so nested runs, e.g. the LLM calls
+        # of the planner and controller, are traced and counted too.
+        return merge_configs(config, {"callbacks": [tracing_callback, agent_stats]})
+
+    def _get_output(self, output: Dict[str, Any]) -> Dict[str, Any]:
+        # The steps are returned for session_memory, not for the client.
+        return {
+            key: value
+            for key, value in output.items()
+            if key not in ("intermediate_steps", session_memory.memory_key)
+        }
+
+    def _get_agent(self) -> AgentExecutor:
+        if self.agent is None:
+            raise HTTPException(
+                status_code=503,
+                detail="The agent is not ready, waiting for the Blender API spec.",
+            )
+        return self.agent
+
+    def invoke(
+        self,
+        input: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        return self._get_output(
+            self._get_agent().invoke(input, self._get_config(config), **kwargs)
+        )
+
+    async def ainvoke(
+        self,
+        input: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        return self._get_output(
+            await self._get_agent().ainvoke(input, self._get_config(config), **kwargs)
+        )
+
+    def stream(
+        self,
+        input: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        for chunk in self._get_agent().stream(
+            input, self._get_config(config), **kwargs
+        ):
+            yield self._get_output(chunk)
+
+    async def astream(
+        self,
+        input: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        async for chunk in self._get_agent().astream(
+            input, self._get_config(config), **kwargs
+        ):
+            yield self._get_output(chunk)
+
+
+def build_openapi_agent(
+    openapi_spec: Dict[str, Any], router: Optional[ModelRouter] = None
+) -> AgentExecutor:
+    """Builds the orchestrator agent for the given Blender API spec.
+
+    The chains of the agent get their models from the router, a new
+    ModelRouter of model_routes by default.
+    """
+    openapi_spec = {**openapi_spec, "servers": [{"url": api_base_url}]}
     reduced_openapi_spec = reduce_openapi_spec(openapi_spec)
 
-    requests_wrapper = RequestsWrapper()
+    requests_wrapper = TracedRequestsWrapper(tracer=tracer)
 
     # model_name = "wizardcoder:7b-python"
     # model_name = "deepseek-coder:6.7b"
     # model_name = "llama2:13b-text"
 
-    ensure_model_is_available(model_name)
-    llm = CustomLLM(model=model_name, verbose=True)
+    if router is None:
+        router = create_router()
+    llm = router.get_llm("orchestrator")
 
     agent_executor_kwargs = {
         "handle_parsing_errors": True,
         "callbacks": [RemoveBackslashesCallback()],
+        # So that session_memory sees the observations, e.g. of the scene.
+        "return_intermediate_steps": True,
     }
 
-    def _get_default_llm_chain(prompt: BasePromptTemplate) -> Any:
-        from langchain.chains.llm import LLMChain
-
-        logging.log(logging.INFO, f"in _get_default_llm_chain prompt: {prompt}")
-
-        return LLMChain(
-            llm=Ollama(model=model_name),
-            prompt=prompt,
-        )
-
-    # monkey patch the openapi agent planner to use our custom llm chain
-    # planner._get_default_llm_chain = _get_default_llm_chain
-
-    openapi_agent: AgentExecutor = planner.create_openapi_agent(
+    if agent_mode == "structured":
+        create_agent, agent_kwargs = create_structured_openapi_agent, {}
+    else:
+        create_agent = planner.create_openapi_agent
+        agent_kwargs = {"plan_cache": plan_cache}
+    openapi_agent: AgentExecutor = create_agent(
         reduced_openapi_spec,
         requests_wrapper,
         llm,
+        shared_memory=session_memory,
         agent_executor_kwargs=agent_executor_kwargs,
+        router=router,
+        **agent_kwargs,
     )
 
     openapi_agent.callbacks = [RemoveBackslashesCallback()]
     openapi_agent.verbose = True
 
     openapi_agent.handle_parsing_errors = True
+    return openapi_agent
+
+
+agent_proxy = AgentProxy()
+
+
+def get_backend_pool() -> BackendPool:
+    """The pool of ollama_base_url and ollama_backends, created on first use."""
+    global backend_pool
+    if backend_pool is None:
+        backend_pool = BackendPool([ollama_base_url, *ollama_backends])
+    return backend_pool
+
+
+def create_router() -> ModelRouter:
+    """A ModelRouter of model_routes whose models share the backend pool."""
+    return ModelRouter(
+        model_routes,
+        base_url=ollama_base_url,
+        backend_pool=get_backend_pool(),
+        verbose=True,
+    )
+
+
+def get_router() -> ModelRouter:
+    """The router of the agent, or of the agent to come until the spec is read."""
+    if agent_proxy.router is None:
+        agent_proxy.router = planner.router = create_router()
+    return agent_proxy.router
+
+
+def get_agent_llms() -> List[CustomLLM]:
+    """The models of the agent's chains, that of the orchestrator first."""
+    router = get_router()
+    orchestrator_llm = router.get_llm("orchestrator")
+    return [
+        orchestrator_llm,
+        *(llm for llm in router.llms if llm is not orchestrator_llm),
+    ]
+
+
+async def warm_up_model() -> None:
+    """Loads the models and evaluates the agent's static prompt prefixes."""
+    if warm_up_enabled:
+        start = time.perf_counter()
+        for llm in get_agent_llms():
+            await asyncio.to_thread(llm.warm_up)
+        logging.log(
+            logging.INFO, f"Models warmed up in {time.perf_counter() - start:.2f}s"
+        )
+
 
-    add_routes(app, openapi_agent, path="/api_interaction")
+async def prepare_model() -> None:
+    """Checks, pulls and warms up the model without blocking startup."""
+    start = time.perf_counter()
+    try:
+        startup_status["model"] = "checking"
+        for backend in get_backend_pool().backends:
+            if backend.kind != "ollama":
+                continue
+            for name in get_router().models:
+                await asyncio.to_thread(ensure_model_is_available, name, backend.url)
+        startup_status["model"] = "loading"
+        await warm_up_model()
+        startup_status["model"] = "ready"
+    except Exception as e:
+        logging.log(logging.ERROR, f"Could not prepare model {model_name}: {e}")
+        startup_status["model"] = "error"
+        startup_status["model_error"] = str(e)
+    startup_status["model_seconds"] = round(time.perf_counter() - start, 3)
+
+
+async def rebuild_openapi_agent(openapi_spec: Dict[str, Any], spec_hash: str) -> None:
+    """Builds the agent for a new spec off the event loop, then swaps it in."""
+    # Plans of the old spec may call endpoints that changed.
+    plan_cache.set_spec_hash(spec_hash)
+    router = create_router()
+    agent_proxy.agent = await asyncio.to_thread(
+        build_openapi_agent, openapi_spec, router
+    )
+    agent_proxy.router = planner.router = router
+    agent_proxy.spec_hash = spec_hash
+    if startup_status["model"] == "ready":
+        # The prompts changed with the spec, get the new prefixes cached.
+        asyncio.create_task(warm_up_model())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_backend_pool().start()
+    model_task = asyncio.create_task(prepare_model())
 
-    yield
+    spec_loader = OpenAPISpecLoader(
+        rebuild_openapi_agent,
+        url=f"{api_base_url}/openapi.json",
+        cache_path=spec_cache_path,
+    )
+    await spec_loader.start()
+    try:
+        yield
+    finally:
+        model_task.cancel()
+        await spec_loader.stop()
+        await asyncio.to_thread(get_backend_pool().stop)
 
 
 app = FastAPI(
@@ -125,6 +394,103 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+add_routes(app, agent_proxy, path="/api_interaction")
+
+
+@app.middleware("http")
+async def propagate_correlation_id(request: Request, call_next):
+    """Runs the request under the caller's X-Correlation-ID, or a new one."""
+    token = correlation_id.set(
+        request.headers.get(CORRELATION_HEADER) or new_correlation_id()
+    )
+    try:
+        response = await call_next(request)
+        response.headers[CORRELATION_HEADER] = correlation_id.get()
+        return response
+    finally:
+        correlation_id.reset(token)
+
+
+# Request counts and latencies for /metrics, added last to time the whole request.
+app.middleware("http")(track_request)
+
+registry.register(
+    Gauge(
+        "agent_ready",
+        "1 once the model is loaded and the agent is built, 0 before.",
+        function=lambda: float(
+            startup_status["model"] == "ready" and agent_proxy.agent is not None
+        ),
+    )
+)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Reports whether the language server is ready for traffic.
+
+    Returns:
+        JSONResponse: 200 once the model is loaded and the agent is built, 503 before,
+        with the status of the model and the agent.
+    """
+    is_ready = startup_status["model"] == "ready" and agent_proxy.agent is not None
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            **startup_status,
+            "agent": "ready" if agent_proxy.agent is not None else "pending",
+            "spec_hash": agent_proxy.spec_hash,
+        },
+    )
+
+
+@app.get("/agent_stats")
+async def get_agent_stats():
+    """
+    Reports how the agent copes with its tasks since startup.
+
+    Returns:
+        dict: The agent mode, tasks, steps per task, LLM calls per task, the
+        rate of LLM outputs the agent could not parse, the plan cache's
+        templates and hits, the model and options of every chain and the
+        health and load of the LLM backends.
+    """
+    return {
+        "agent_mode": agent_mode,
+        **agent_stats.summary(),
+        "plan_cache": plan_cache.summary(),
+        "model_routes": get_router().describe(),
+        "llm_backends": get_backend_pool().summary(),
+    }
+
+
+@app.get("/trace_summary")
+async def trace_summary():
+    """
+    Summarizes the recent spans of the language server.
+
+    Returns:
+        dict: Count, errors and p50/p95/max duration in milliseconds per stage,
+        e.g. agent, llm, tool.api_planner, tool.api_controller and http.
+    """
+    return tracer.summary()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Reports the metrics of the language server in the Prometheus text format.
+
+    Returns:
+        Response: Request counts and latencies per route, LLM calls, tokens,
+        latency and time-to-first-token per chain (orchestrator, planner,
+        controller, parser), tool calls and cache hits and misses.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,5 +1,10 @@
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
+import functools
+import numpy as np
+import time
 from typing import List, Tuple, Optional
 import bpy
 import os
@@ -10,6 +15,34 @@ import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
 
+from custom_metrics import (
+    CONTENT_TYPE,
+    Gauge,
+    MetricsExporter,
+    http_requests_in_progress,
+    registry,
+    track_request,
+)
+from custom_profiling import (
+    PROFILE_ID_HEADER,
+    RequestProfiler,
+    format_server_timing,
+    is_profile_requested,
+)
+from custom_batch_render import MAX_JOBS, BrokenProcessPool, RenderJob, RenderPool
+from custom_bounds import Bounds, BoundsCache
+from custom_render import IMAGE_FORMATS, encode_image, get_png_level, iter_png, to_srgb8
+from custom_scene_cache import SceneCache
+from custom_scene_query import MAX_LIMIT, ObjectSnapshot, SceneIndex, SceneQuery
+from custom_spatial import Point, SpatialIndex, get_center
+from custom_tracing import (
+    CORRELATION_HEADER,
+    Tracer,
+    correlation_id,
+    get_file_exporters,
+    new_correlation_id,
+)
+
 logging.basicConfig(level=logging.INFO)
 
 
@@ -21,15 +54,110 @@ async def lifespan(app: FastAPI):
 
     # unlink the default cube
     bpy.data.objects.remove(bpy.data.objects["Cube"], do_unlink=True)
+    mark_scene_changed()
     try:
         yield
     finally:
+        render_pool.close()
         bpy.ops.wm.quit_blender()
 
 
 app = FastAPI(lifespan=lifespan)
 image_url = ""
 
+# Spans of requests, bpy operations, scene graphs and renders, joined with the
+# language server's spans by the X-Correlation-ID header.
+tracer = Tracer("main", exporters=[*get_file_exporters("main"), MetricsExporter()])
+
+# Profiles of requests sent with ?profile=1 or the X-Profile: 1 header.
+profiler = RequestProfiler()
+
+# Serialized scene graphs of the current scene version, see mark_scene_changed.
+scene_cache = SceneCache()
+# The objects of the scene version last queried, see get_scene_index.
+scene_index: Optional[SceneIndex] = None
+# World-space bounding boxes and dimensions per object, computed in bulk and
+# kept until mark_scene_changed names the object.
+bounds_cache = BoundsCache()
+# World-space bounding boxes of the objects, updated by mark_scene_changed;
+# built by the first spatial query.
+spatial_index: Optional[SpatialIndex] = None
+# Worker processes rendering the views and frames of POST /render_batch from a
+# snapshot of the scene; they start with the first batch.
+render_pool = RenderPool()
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    token = correlation_id.set(
+        request.headers.get(CORRELATION_HEADER) or new_correlation_id()
+    )
+    try:
+        name = f"{request.method} {request.url.path}"
+        with tracer.span("request", name) as span:
+            if is_profile_requested(request.headers, request.query_params):
+                response, profile = await profiler.profile(call_next(request))
+            else:
+                response, profile = await call_next(request), None
+            span["attributes"]["status_code"] = response.status_code
+        response.headers[CORRELATION_HEADER] = correlation_id.get()
+        if profile is not None:
+            children = [s for s in tracer.spans if s["parent_id"] == span["span_id"]]
+            record = profiler.add(name, profile, children, span["duration_ms"])
+            response.headers[PROFILE_ID_HEADER] = record["id"]
+            response.headers["Server-Timing"] = format_server_timing(
+                record["breakdown"]
+            )
+        return response
+    finally:
+        correlation_id.reset(token)
+
+
+# Request counts and latencies for /metrics, added last to time the whole request.
+app.middleware("http")(track_request)
+
+
+@app.get("/trace_summary", include_in_schema=False)
+async def trace_summary():
+    """
+    Summarizes the recent spans of the Blender API.
+
+    Returns:
+        dict: Count, errors and p50/p95/max duration in milliseconds per stage:
+        request, bpy, scene_graph and render.
+    """
+    return tracer.summary()
+
+
+@app.get("/debug/profile", include_in_schema=False)
+async def profile_hot_paths():
+    """
+    Aggregates the recent request profiles into a hot-path report.
+
+    Returns:
+        dict: The mean breakdown in milliseconds per request method and path,
+        and the functions with the most own time per profiled request.
+    """
+    return profiler.hot_paths()
+
+
+@app.get("/debug/profile/{profile_id}", include_in_schema=False)
+async def get_profile(profile_id: str):
+    """
+    Retrieves the profile of a request sent with ?profile=1 or X-Profile: 1.
+
+    Args:
+        profile_id (str): The X-Profile-Id header of the profiled response.
+
+    Returns:
+        dict: The breakdown in milliseconds and the top functions by
+        cumulative time.
+    """
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return profile
+
 
 # @app.post("/api_interaction")
 # async def api_interaction(request: Request):
@@ -62,6 +190,63 @@ rendered_images_dir = script_dir / "rendered_images"
 app.mount("/static", StaticFiles(directory=rendered_images_dir), name="static")
 
 
+def get_rendered_images_usage() -> Tuple[int, int]:
+    """Number and total size in bytes of the files in rendered_images_dir and
+    its batch directories."""
+    files = [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(rendered_images_dir)
+        for name in names
+    ]
+    return len(files), sum(os.path.getsize(path) for path in files)
+
+
+registry.register(
+    Gauge(
+        "scene_objects",
+        "Objects in the Blender scene.",
+        function=lambda: len(bpy.data.objects),
+    )
+)
+registry.register(
+    Gauge(
+        "render_queue_depth",
+        "Render requests being rendered or waiting for the event loop.",
+        function=lambda: sum(
+            http_requests_in_progress.get(method="POST", route=route)
+            for route in ("/render_scene", "/render_image", "/render_batch")
+        ),
+    )
+)
+registry.register(
+    Gauge(
+        "rendered_images_files",
+        "Files in the rendered_images directory.",
+        function=lambda: get_rendered_images_usage()[0],
+    )
+)
+registry.register(
+    Gauge(
+        "rendered_images_bytes",
+        "Disk usage of the rendered_images directory in bytes.",
+        function=lambda: get_rendered_images_usage()[1],
+    )
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Reports the metrics of the Blender API in the Prometheus text format.
+
+    Returns:
+        Response: Request counts and latencies per route, scene objects, scene
+        graph build and render durations, render queue depth and the disk
+        usage of rendered images.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 # Pydantic models
 class Vector3D(BaseModel):
     x: float
@@ -75,6 +260,11 @@ class ObjectTransform(BaseModel):
     scale: Vector3D = None
 
 
+class BoundingBox(BaseModel):
+    min: Vector3D
+    max: Vector3D
+
+
 class BlenderObject(BaseModel):
     id: str = None
     name: str
@@ -92,6 +282,47 @@ class SceneGraph(BaseModel):
     objects: List[BlenderObject]
 
 
+class BoundedObject(BlenderObject):
+    # Projected by the fields parameter of /scene_graph, so all but the name
+    # may be missing.
+    type: Optional[str] = Field(None, description="If fields has type")
+    object_transform: Optional[ObjectTransform] = Field(
+        None, description="The location, rotation and scale that fields has"
+    )
+    bounding_box: Optional[BoundingBox] = Field(
+        None, description="If fields has bounds"
+    )
+    dimensions: Optional[Vector3D] = Field(
+        None, description="Size along the object's axes, if fields has bounds"
+    )
+
+
+class SceneGraphPage(SceneGraph):
+    objects: List[BoundedObject]
+    total: int = Field(description="Number of objects matching the filters")
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as cursor to get the next page, null on the last"
+    )
+
+
+class SpatialMatch(BaseModel):
+    name: str
+    distance: Optional[float] = Field(
+        None, description="From the point to the bounding box, 0 inside it"
+    )
+    bounding_box: BoundingBox
+
+
+class SpatialMatches(BaseModel):
+    objects: List[SpatialMatch]
+
+
+class Overlaps(BaseModel):
+    pairs: List[Tuple[str, str]] = Field(
+        description="Names of objects whose bounding boxes intersect"
+    )
+
+
 class OperationResult(BaseModel):
     message: str
     active_object: BlenderObject = None
@@ -103,6 +334,35 @@ class RenderedScene(BaseModel):
     scene_graph: SceneGraph
 
 
+class CameraView(BaseModel):
+    camera: Optional[str] = Field(None, description="Default: the scene camera")
+    location: Optional[Vector3D] = None
+    rotation: Optional[Vector3D] = Field(None, description="Euler angles in degrees")
+
+
+class BatchRender(BaseModel):
+    views: List[CameraView] = Field(
+        default_factory=list, description="Default: the scene camera as it is"
+    )
+    frame_start: Optional[int] = Field(None, description="Default: the current frame")
+    frame_end: Optional[int] = Field(None, description="Default: frame_start")
+    frame_step: int = Field(1, ge=1)
+
+
+class BatchImage(BaseModel):
+    view: int = Field(description="Index into the views of the request")
+    frame: int
+    rendered_image_url: str
+    seconds: float = Field(description="Spent by the worker on this image")
+
+
+class BatchManifest(BaseModel):
+    batch_id: str
+    images: List[BatchImage]
+    workers: int
+    seconds: float
+
+
 # def deg2rad(deg):
 #     return deg * math.pi / 180
 
@@ -111,7 +371,12 @@ class RenderedScene(BaseModel):
 #     return rad * 180 / math.pi
 
 
-def get_scene_graph() -> SceneGraph:
+def to_vector3d(values: Point) -> Vector3D:
+    return Vector3D(x=values[0], y=values[1], z=values[2])
+
+
+def snapshot_scene() -> List[ObjectSnapshot]:
+    """Reads the objects from bpy into plain tuples, which other threads can use."""
     objects = []
     for obj in bpy.data.objects:
         rotation_euler = (
@@ -119,27 +384,167 @@ def get_scene_graph() -> SceneGraph:
             if obj.rotation_mode == "XYZ"
             else obj.rotation_quaternion.to_euler("XYZ")
         )
-
-        location = Vector3D(x=obj.location.x, y=obj.location.y, z=obj.location.z)
-        rotation = Vector3D(
-            x=math.degrees(rotation_euler.x),
-            y=math.degrees(rotation_euler.y),
-            z=math.degrees(rotation_euler.z),
+        objects.append(
+            (
+                obj.name,
+                obj.type,
+                (obj.location.x, obj.location.y, obj.location.z),
+                (
+                    math.degrees(rotation_euler.x),
+                    math.degrees(rotation_euler.y),
+                    math.degrees(rotation_euler.z),
+                ),
+                (obj.scale.x, obj.scale.y, obj.scale.z),
+            )
         )
-        scale = Vector3D(x=obj.scale.x, y=obj.scale.y, z=obj.scale.z)
+    return objects
 
-        blender_object = BlenderObject(
-            name=obj.name,
-            type=obj.type,
-            object_transform=ObjectTransform(
-                location=location, rotation=rotation, scale=scale
-            ),
+
+def build_scene_graph(
+    snapshot: List[ObjectSnapshot], bounds: Optional[List[Bounds]] = None
+) -> SceneGraph:
+    objects = []
+    for position, (name, type, location, rotation, scale) in enumerate(snapshot):
+        object_transform = ObjectTransform(
+            location=Vector3D(x=location[0], y=location[1], z=location[2]),
+            rotation=Vector3D(x=rotation[0], y=rotation[1], z=rotation[2]),
+            scale=Vector3D(x=scale[0], y=scale[1], z=scale[2]),
         )
+        if bounds is None:
+            blender_object = BlenderObject(
+                name=name, type=type, object_transform=object_transform
+            )
+        else:
+            low, high, dimensions = bounds[position]
+            blender_object = BoundedObject(
+                name=name,
+                type=type,
+                object_transform=object_transform,
+                bounding_box=BoundingBox(min=to_vector3d(low), max=to_vector3d(high)),
+                dimensions=to_vector3d(dimensions),
+            )
         objects.append(blender_object)
 
     return SceneGraph(objects=objects)
 
 
+@tracer.traced("scene_graph")
+def get_scene_graph(bounds: bool = False) -> SceneGraph:
+    """The scene graph, with the world-space bounding box and dimensions of
+    every object if bounds."""
+    return build_scene_graph(
+        snapshot_scene(), bounds_cache.get(bpy.data.objects) if bounds else None
+    )
+
+
+def get_scene_index(bounds: bool = False) -> SceneIndex:
+    """The index of the current scene version, built from a snapshot of bpy, with
+    the bounds of the objects if asked for."""
+    global scene_index
+    if (
+        scene_index is None
+        or scene_index.version != scene_cache.version
+        or (bounds and scene_index.bounds is None)
+    ):
+        scene_index = SceneIndex(
+            snapshot_scene(),
+            scene_cache.version,
+            bounds_cache.get(bpy.data.objects) if bounds else None,
+        )
+    return scene_index
+
+
+@tracer.traced("scene_graph")
+def query_scene_graph(index: SceneIndex, query: SceneQuery) -> bytes:
+    return index.query(query)
+
+
+def get_spatial_index() -> SpatialIndex:
+    """The spatial index of the scene, built from bpy on first use."""
+    global spatial_index
+    if spatial_index is None:
+        index = SpatialIndex()
+        with tracer.span("spatial", "build"):
+            bounds = bounds_cache.get(bpy.data.objects)
+            for obj, (low, high, _) in zip(bpy.data.objects, bounds):
+                index.update(obj.name, (low, high))
+        spatial_index = index
+    return spatial_index
+
+
+def mark_scene_changed(*names: str) -> None:
+    """Invalidates what was derived from the scene; call after every bpy mutation.
+
+    Args:
+        names: The objects added, transformed or removed, whose bounds are
+            recomputed and which the spatial index updates in place, with
+            their children, which move along; none if unknown, which drops
+            all bounds and the index.
+    """
+    global spatial_index
+    children = [
+        child.name
+        for obj in map(bpy.data.objects.get, names)
+        if obj is not None
+        for child in obj.children_recursive
+    ]
+    names = tuple(dict.fromkeys(names + tuple(children)))
+    scene_cache.invalidate()
+    bounds_cache.invalidate(names or None)
+    if spatial_index is None:
+        return
+    if not names:
+        spatial_index = None
+        return
+    for name in names:
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            spatial_index.remove(name)
+        else:
+            low, high, _ = bounds_cache.get([obj])[0]
+            spatial_index.update(name, (low, high))
+
+
+def to_spatial_matches(
+    index: SpatialIndex, matches: List[Tuple[str, Optional[float]]]
+) -> SpatialMatches:
+    objects = []
+    for name, distance in matches:
+        low, high = index.boxes[name]
+        bounding_box = BoundingBox(min=to_vector3d(low), max=to_vector3d(high))
+        objects.append(
+            SpatialMatch(name=name, distance=distance, bounding_box=bounding_box)
+        )
+    return SpatialMatches(objects=objects)
+
+
+def check_finite(**values: Optional[float]) -> None:
+    """Reject infinite and NaN coordinates, which no cell of the grid holds."""
+    for name, value in values.items():
+        if value is not None and not math.isfinite(value):
+            raise HTTPException(status_code=400, detail=f"{name} must be finite")
+
+
+def get_reference_point(
+    index: SpatialIndex,
+    name: Optional[str],
+    x: Optional[float],
+    y: Optional[float],
+    z: Optional[float],
+) -> Tuple[Point, List[str]]:
+    """The center of the named object's bounding box, or the point x, y, z, and
+    the objects to leave out of the results: the named one."""
+    if name is not None:
+        obj = get_object(name)
+        if obj is None or obj.name not in index:
+            raise HTTPException(status_code=404, detail=f"Object {name} not found")
+        return get_center(index.boxes[obj.name]), [obj.name]
+    if x is None or y is None or z is None:
+        raise HTTPException(status_code=400, detail="Pass a name or x, y and z")
+    check_finite(x=x, y=y, z=z)
+    return (x, y, z), []
+
+
 # def get_object(name: str):
 
 
@@ -149,18 +554,123 @@ def get_rendered_scene(rendered_image_url: str) -> RenderedScene:
     return RenderedScene(rendered_image_url=rendered_image_url, scene_graph=scene_graph)
 
 
-@app.get("/scene_graph", response_model=SceneGraph)
-async def scene_graph():
+@app.get("/scene_graph", response_model=SceneGraphPage)
+async def scene_graph(
+    type: Optional[str] = Query(
+        None, description="Object types to return, comma-separated, e.g. MESH,LIGHT"
+    ),
+    name: Optional[str] = Query(
+        None,
+        description="Name glob, e.g. Cube* or *.001, or name prefix; case-insensitive",
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description="Fields to return besides name, comma-separated, from type, "
+        "location, rotation, scale and bounds (bounding box and dimensions); all "
+        "but bounds by default",
+    ),
+    sort: Optional[str] = Query(
+        None,
+        description="name, type, location.x, location.y or location.z; "
+        "prefix - for descending",
+    ),
+    limit: Optional[int] = Query(
+        None, ge=1, le=MAX_LIMIT, description="Objects per page, all by default"
+    ),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
     """
-    Retrieves the scene graph for the current image.
+    Retrieves the scene graph for the current image; filter it with type or name, choose fields (fields=bounds adds bounding boxes and dimensions), sort it and page it with limit and cursor.
 
     Returns:
-        SceneGraph: The scene graph object representing the current image.
+        SceneGraphPage: The scene graph object representing the current image.
     """
     global image_url
     # Render settings and process
 
-    return get_scene_graph()
+    try:
+        query = SceneQuery(type, name, fields, sort, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Concurrent requests share one build, whose JSON is served until the scene
+    # changes (not in the docstring, which goes into the agent's prompt).
+    body = await scene_cache.get(
+        query.key,
+        functools.partial(get_scene_index, bounds=query.bounds),
+        functools.partial(query_scene_graph, query=query),
+    )
+    return Response(body, media_type="application/json")
+
+
+@app.get("/spatial/nearest", response_model=SpatialMatches)
+async def nearest_objects(
+    name: Optional[str] = Query(None, description="Object to search around"),
+    x: Optional[float] = Query(None, description="Or a point to search around"),
+    y: Optional[float] = None,
+    z: Optional[float] = None,
+    k: int = Query(1, ge=1, le=MAX_LIMIT, description="Number of objects"),
+):
+    """Find the k objects nearest to the named object or to the point x, y, z"""
+    index = get_spatial_index()
+    point, exclude = get_reference_point(index, name, x, y, z)
+    return to_spatial_matches(index, index.nearest(point, k, exclude))
+
+
+@app.get("/spatial/radius", response_model=SpatialMatches)
+async def objects_within_radius(
+    radius: float = Query(..., ge=0, description="Distance in Blender units"),
+    name: Optional[str] = Query(None, description="Object to search around"),
+    x: Optional[float] = Query(None, description="Or a point to search around"),
+    y: Optional[float] = None,
+    z: Optional[float] = None,
+):
+    """Find the objects within radius of the named object or of the point x, y, z"""
+    check_finite(radius=radius)
+    index = get_spatial_index()
+    point, exclude = get_reference_point(index, name, x, y, z)
+    matches = index.query_radius(point, radius)
+    return to_spatial_matches(
+        index, [match for match in matches if match[0] not in exclude]
+    )
+
+
+@app.get("/spatial/box", response_model=SpatialMatches)
+async def objects_in_box(
+    min_x: float,
+    min_y: float,
+    min_z: float,
+    max_x: float,
+    max_y: float,
+    max_z: float,
+    contained: bool = Query(
+        False, description="Only objects entirely inside the box, not touching it"
+    ),
+):
+    """Find the objects in the box from min_x, min_y, min_z to max_x, max_y, max_z,
+    or only those it contains; none if the region is free"""
+    check_finite(
+        min_x=min_x, min_y=min_y, min_z=min_z, max_x=max_x, max_y=max_y, max_z=max_z
+    )
+    box = ((min_x, min_y, min_z), (max_x, max_y, max_z))
+    if any(box[0][i] > box[1][i] for i in range(3)):
+        raise HTTPException(status_code=400, detail="min must not exceed max")
+    index = get_spatial_index()
+    names = index.query_box(box, contained)
+    return to_spatial_matches(index, [(name, None) for name in names])
+
+
+@app.get("/spatial/overlaps", response_model=Overlaps)
+async def overlapping_objects(
+    name: Optional[str] = Query(None, description="Only overlaps with this object")
+):
+    """Find the objects whose bounding boxes overlap, or overlap the named object"""
+    index = get_spatial_index()
+    if name is None:
+        return Overlaps(pairs=index.overlaps())
+    obj = get_object(name)
+    if obj is None or obj.name not in index:
+        raise HTTPException(status_code=404, detail=f"Object {name} not found")
+    return Overlaps(pairs=index.overlaps(obj.name))
 
 
 @app.post("/render_scene", response_model=RenderedScene)
@@ -177,7 +687,8 @@ async def render_scene():
     filepath = os.path.join(rendered_images_dir, filename)
     bpy.context.scene.render.filepath = filepath
     bpy.context.scene.render.image_settings.file_format = "PNG"
-    bpy.ops.render.render(write_still=True)
+    with tracer.span("render", "render"):
+        bpy.ops.render.render(write_still=True)
 
     # URL to access the rendered image
     image_url = f"http://127.0.0.1:8000/static/{filename}"
@@ -187,6 +698,179 @@ async def render_scene():
     return rendered_scene
 
 
+def save_snapshot(filepath: str) -> None:
+    with tracer.span("bpy", "save_snapshot"):
+        # copy keeps the file the scene is saved to, and its dirty state.
+        bpy.ops.wm.save_as_mainfile(filepath=filepath, copy=True)
+
+
+def get_batch_jobs(batch: BatchRender, directory: Path) -> List[Tuple[int, RenderJob]]:
+    """The index of the view and the job of every view and frame of batch,
+    rendering into directory."""
+    scene = bpy.context.scene
+    frame_start = (
+        scene.frame_current if batch.frame_start is None else batch.frame_start
+    )
+    frame_end = frame_start if batch.frame_end is None else batch.frame_end
+    if frame_end < frame_start:
+        raise HTTPException(
+            status_code=400, detail="frame_end must not be before frame_start"
+        )
+    frames = range(frame_start, frame_end + 1, batch.frame_step)
+    views = batch.views or [CameraView()]
+    if len(views) * len(frames) > MAX_JOBS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(views) * len(frames)} images, render at most {MAX_JOBS}",
+        )
+    cameras = []
+    for view in views:
+        if view.camera is None:
+            if scene.camera is None:
+                raise HTTPException(status_code=400, detail="The scene has no camera")
+            cameras.append(None)
+            continue
+        obj = get_object(view.camera)
+        if obj is None or obj.type != "CAMERA":
+            raise HTTPException(
+                status_code=404, detail=f"Camera {view.camera} not found"
+            )
+        cameras.append(obj.name)
+    return [
+        (
+            index,
+            RenderJob(
+                filepath=str(directory / f"view{index:03d}_frame{frame:04d}.png"),
+                frame=frame,
+                camera=camera,
+                location=view.location
+                and (view.location.x, view.location.y, view.location.z),
+                rotation=view.rotation
+                and (view.rotation.x, view.rotation.y, view.rotation.z),
+            ),
+        )
+        for index, (view, camera) in enumerate(zip(views, cameras))
+        for frame in frames
+    ]
+
+
+@app.post("/render_batch", response_model=BatchManifest, include_in_schema=False)
+async def render_batch(batch: BatchRender):
+    """
+    Renders every view of the batch at every frame of its range, spread over
+    the worker processes of render_pool, and returns the URLs of the images.
+
+    Returns:
+        BatchManifest: The images by view and frame, under /static/{batch_id}.
+    """
+    start = time.perf_counter()
+    batch_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    directory = rendered_images_dir / batch_id
+    jobs = get_batch_jobs(batch, directory)
+    directory.mkdir()
+    # Saved once per scene version; the workers open it once, not per job.
+    snapshot = render_pool.acquire_snapshot(scene_cache.version, save_snapshot)
+    with tracer.span("render", "render_batch") as span:
+        span["attributes"]["images"] = len(jobs)
+        span["attributes"]["workers"] = render_pool.workers
+        try:
+            seconds = await asyncio.gather(
+                *(
+                    asyncio.wrap_future(render_pool.submit(snapshot, job))
+                    for _, job in jobs
+                )
+            )
+        except BrokenProcessPool:
+            render_pool.restart()
+            raise HTTPException(status_code=503, detail="A render worker crashed")
+        finally:
+            render_pool.release_snapshot(snapshot)
+    return BatchManifest(
+        batch_id=batch_id,
+        images=[
+            BatchImage(
+                view=view,
+                frame=job.frame,
+                rendered_image_url=f"http://127.0.0.1:8000/static/{batch_id}/"
+                + os.path.basename(job.filepath),
+                seconds=round(job_seconds, 3),
+            )
+            for (view, job), job_seconds in zip(jobs, seconds)
+        ],
+        workers=render_pool.workers,
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+VIEWER_IMAGE = "Viewer Node"
+"""Image the compositor's Viewer node renders into."""
+
+
+def ensure_viewer_node() -> None:
+    """Add a Viewer node after the Render Layers of the compositor, which keeps
+    the render's pixels readable in the Viewer Node image (the Render Result
+    image has none)."""
+    scene = bpy.context.scene
+    changed = not scene.use_nodes
+    scene.use_nodes = True
+    tree = scene.node_tree
+    if not any(node.type == "VIEWER" for node in tree.nodes):
+        layers = next((node for node in tree.nodes if node.type == "R_LAYERS"), None)
+        if layers is None:
+            layers = tree.nodes.new("CompositorNodeRLayers")
+        viewer = tree.nodes.new("CompositorNodeViewer")
+        tree.links.new(layers.outputs["Image"], viewer.inputs["Image"])
+        changed = True
+    if changed:
+        # Snapshots of the scene, e.g. for batch renders, must include the nodes.
+        mark_scene_changed()
+
+
+def read_render_pixels() -> np.ndarray:
+    """The last render as (height, width, 4) linear floats, bottom row first."""
+    image = bpy.data.images[VIEWER_IMAGE]
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+@app.post("/render_image", include_in_schema=False)
+async def render_image(
+    format: str = Query("PNG", description="PNG, JPEG or WEBP"),
+    quality: int = Query(90, ge=1, le=100, description="For JPEG and WebP"),
+    stream: bool = Query(False, description="Stream a PNG as it is compressed"),
+):
+    """
+    Renders the scene and returns the image itself, encoded in memory: no file
+    in rendered_images and no second request to /static.
+
+    Returns:
+        Response: The image as image/png, image/jpeg or image/webp.
+    """
+    format = format.upper()
+    if format not in IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format {format!r}, use one of {tuple(IMAGE_FORMATS)}",
+        )
+    ensure_viewer_node()
+    with tracer.span("render", "render"):
+        bpy.ops.render.render(write_still=False)
+    with tracer.span("bpy", "read_pixels"):
+        pixels = read_render_pixels()
+    level = get_png_level(bpy.context.scene.render.image_settings.compression)
+    # Conversion and encoding release the GIL; keep the event loop serving.
+    rgba = await asyncio.to_thread(to_srgb8, pixels)
+    if stream and format == "PNG":
+        return StreamingResponse(iter_png(rgba, level), media_type="image/png")
+    try:
+        body = await asyncio.to_thread(encode_image, rgba, format, quality, level)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return Response(body, media_type=IMAGE_FORMATS[format])
+
+
 @app.post("/add_cube", response_model=OperationResult)
 async def add_cube():
     """
@@ -195,7 +879,9 @@ async def add_cube():
     Returns:
         OperationResult: The result of the operation, including a message, the active object, and the scene graph.
     """
-    bpy.ops.mesh.primitive_cube_add()
+    with tracer.span("bpy", "primitive_cube_add"):
+        bpy.ops.mesh.primitive_cube_add()
+    mark_scene_changed(bpy.context.view_layer.objects.active.name)
     operation_result = OperationResult(
         message="Cube added",
         active_object=get_active_object(),
@@ -212,7 +898,9 @@ async def add_sphere():
     Returns:
         OperationResult: The result of the operation, including a message, the active object, and the scene graph.
     """
-    bpy.ops.mesh.primitive_uv_sphere_add()
+    with tracer.span("bpy", "primitive_uv_sphere_add"):
+        bpy.ops.mesh.primitive_uv_sphere_add()
+    mark_scene_changed(bpy.context.view_layer.objects.active.name)
     operation_result = OperationResult(
         message="Sphere added",
         active_object=get_active_object(),
@@ -266,7 +954,9 @@ async def add_torus():
     Returns:
         OperationResult: The result of the operation, including a message, the active object, and the scene graph.
     """
-    bpy.ops.mesh.primitive_torus_add()
+    with tracer.span("bpy", "primitive_torus_add"):
+        bpy.ops.mesh.primitive_torus_add()
+    mark_scene_changed(bpy.context.view_layer.objects.active.name)
     logging.log(
         logging.INFO,
         f"Torus added\nActive object: {bpy.context.view_layer.objects.active.name}",
@@ -288,7 +978,9 @@ async def add_cylinder():
     Returns:
         OperationResult: The result of the operation, including a message, the active object, and the scene graph.
     """
-    bpy.ops.mesh.primitive_cylinder_add()
+    with tracer.span("bpy", "primitive_cylinder_add"):
+        bpy.ops.mesh.primitive_cylinder_add()
+    mark_scene_changed(bpy.context.view_layer.objects.active.name)
     operation_result = OperationResult(
         message="Cylinder added",
         active_object=get_active_object(),
@@ -337,13 +1029,16 @@ async def set_object_transformation(name: str, transform_input: ObjectTransform)
             transform_input.scale.y,
             transform_input.scale.z,
         )
-    obj.update_tag()  # Update the object to see the changes
-    bpy.context.view_layer.update()  # Update the scene
+    with tracer.span("bpy", "view_layer_update"):
+        obj.update_tag()  # Update the object to see the changes
+        bpy.context.view_layer.update()  # Update the scene
+    mark_scene_changed(obj.name)
 
     # save blendet file
     download_path = Path(Path.home() / "Downloads")
     filepath = str(download_path / "test.blend")
-    bpy.ops.wm.save_mainfile(filepath=filepath)
+    with tracer.span("bpy", "save_mainfile"):
+        bpy.ops.wm.save_mainfile(filepath=filepath)
     print(f"Saved file to {filepath}")
 
     operation_result = OperationResult(
@@ -383,8 +1078,10 @@ async def rotate_object(name: str, rotation_input: Vector3D):
             math.radians(updated_z),
         )
 
-    obj.update_tag()  # Update the object to see the changes
-    bpy.context.view_layer.update()  # Update the scene
+    with tracer.span("bpy", "view_layer_update"):
+        obj.update_tag()  # Update the object to see the changes
+        bpy.context.view_layer.update()  # Update the scene
+    mark_scene_changed(obj.name)
 
     operation_result = OperationResult(
         message=f"Object {name} transformed",
@@ -423,8 +1120,10 @@ async def move_object(name: str, location_input: Vector3D):
             updated_z,
         )
 
-    obj.update_tag()  # Update the object to see the changes
-    bpy.context.view_layer.update()  # Update the scene
+    with tracer.span("bpy", "view_layer_update"):
+        obj.update_tag()  # Update the object to see the changes
+        bpy.context.view_layer.update()  # Update the scene
+    mark_scene_changed(obj.name)
 
     operation_result = OperationResult(
         message=f"Object {name} transformed",
@@ -455,8 +1154,10 @@ async def scale_object(name: str, scale_input: Vector3D):
             updated_z,
         )
 
-    obj.update_tag()  # Update the object to see the changes
-    bpy.context.view_layer.update()  # Update the scene
+    with tracer.span("bpy", "view_layer_update"):
+        obj.update_tag()  # Update the object to see the changes
+        bpy.context.view_layer.update()  # Update the scene
+    mark_scene_changed(obj.name)
 
     operation_result = OperationResult(
         message=f"Object {name} transformed",
@@ -479,7 +1180,9 @@ async def delete_object(name: str) -> SceneGraph:
     """
     obj = bpy.data.objects.get(name)
     if obj:
-        bpy.data.objects.remove(obj)
+        with tracer.span("bpy", "objects_remove"):
+            bpy.data.objects.remove(obj)
+        mark_scene_changed(name)
         operation_result = OperationResult(
             message=f"Object {name} deleted", scene_graph=get_scene_graph()
         )
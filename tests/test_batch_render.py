@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+from custom_batch_render import RenderPool
+
+
+def save(filepath: str) -> None:
+    Path(filepath).touch()
+
+
+def test_snapshots_are_deleted_after_their_last_batch():
+    pool = RenderPool(1)
+    try:
+        first = pool.acquire_snapshot(1, save)
+        assert pool.acquire_snapshot(1, save) == first
+        second = pool.acquire_snapshot(2, save)
+        third = pool.acquire_snapshot(3, save)
+        pool.release_snapshot(second)
+        assert not os.path.exists(second)
+        pool.release_snapshot(first)
+        assert os.path.exists(first)
+        pool.release_snapshot(first)
+        assert not os.path.exists(first)
+        pool.release_snapshot(third)
+        assert os.path.exists(third)
+    finally:
+        pool.close()
@@ -0,0 +1,41 @@
+from custom_executor import PlanStep, get_step_kind, schedule_steps
+
+
+def make_step(endpoint: str, **params) -> PlanStep:
+    method, path = endpoint.split(" ", 1)
+    return PlanStep(
+        text=endpoint,
+        method=method,
+        path=path,
+        endpoint=endpoint,
+        params=params,
+        resolved=True,
+    )
+
+
+def test_updates_of_one_object_in_mixed_case_conflict():
+    steps = [
+        make_step("POST /move_object", name="Cube"),
+        make_step("POST /scale_object", name="cube"),
+    ]
+    assert schedule_steps(steps) == [[0], [1]]
+
+
+def test_updates_of_different_objects_run_together():
+    steps = [
+        make_step("POST /move_object", name="Cube"),
+        make_step("POST /move_object", name="Sphere"),
+    ]
+    assert schedule_steps(steps) == [[0, 1]]
+
+
+def test_parameters_naming_no_object_change_the_scene():
+    step = make_step("POST /set_frame", frame=10)
+    assert get_step_kind(step) == "scene"
+    steps = [make_step("POST /move_object", name="Cube"), step]
+    assert schedule_steps(steps) == [[0], [1]]
+
+
+def test_creates_commute():
+    steps = [make_step("POST /add_cube"), make_step("POST /add_sphere")]
+    assert schedule_steps(steps) == [[0, 1]]
@@ -0,0 +1,60 @@
+import asyncio
+
+from langchain.agents import AgentExecutor, ZeroShotAgent
+from langchain.tools import Tool
+from langchain_community.llms.fake import FakeListLLM
+
+import langserver
+
+
+def get_proxy(**kwargs) -> langserver.AgentProxy:
+    llm = FakeListLLM(
+        responses=[
+            "Thought: look\nAction: echo\nAction Input: scene",
+            "Thought: done\nFinal Answer: scene",
+        ]
+    )
+    tools = [Tool(name="echo", func=lambda text: text, description="Echoes.")]
+    agent = ZeroShotAgent.from_llm_and_tools(llm, tools)
+    proxy = langserver.AgentProxy()
+    proxy.agent = AgentExecutor.from_agent_and_tools(agent, tools, **kwargs)
+    return proxy
+
+
+def test_agent_stats_count_llm_calls(monkeypatch):
+    monkeypatch.setattr(langserver.tracer, "exporters", [])
+    monkeypatch.setattr(langserver, "agent_stats", langserver.AgentStatsCallback())
+    proxy = get_proxy()
+
+    assert proxy.invoke({"input": "What is in the scene?"})["output"] == "scene"
+
+    summary = langserver.agent_stats.summary()
+    assert summary["tasks"] == 1
+    assert summary["llm_calls_per_task"] == 2
+
+
+def test_streams_leave_out_the_intermediate_steps(monkeypatch):
+    monkeypatch.setattr(langserver.tracer, "exporters", [])
+    monkeypatch.setattr(langserver, "agent_stats", langserver.AgentStatsCallback())
+    input = {"input": "What is in the scene?"}
+
+    async def astream():
+        proxy = get_proxy(return_intermediate_steps=True)
+        return [chunk async for chunk in proxy.astream(input)]
+
+    chunks = list(get_proxy(return_intermediate_steps=True).stream(input))
+    for chunks in (chunks, asyncio.run(astream())):
+        assert chunks[-1]["output"] == "scene"
+        assert not any("intermediate_steps" in chunk for chunk in chunks)
+
+
+def test_default_parser_chains_use_the_agent_router(monkeypatch):
+    monkeypatch.setattr(langserver.agent_proxy, "router", None)
+    monkeypatch.setattr(langserver.planner, "router", None)
+    router = langserver.get_router()
+
+    assert langserver.get_router() is router
+    chain = langserver.planner._get_default_llm_chain(
+        langserver.planner.PARSING_GET_PROMPT
+    )
+    assert chain.llm is router.get_llm("parser")
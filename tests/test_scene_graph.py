@@ -0,0 +1,73 @@
+import base64
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.blender_api import BlenderAPI
+
+
+@pytest.fixture(scope="module")
+def api():
+    api = BlenderAPI()
+    api.reset()
+    api.populate(3)
+    return api
+
+
+@pytest.mark.parametrize("fields", ["name", "location", "type,bounds"])
+def test_projected_pages_match_the_schema(api, fields):
+    response = TestClient(api.main.app).get("/scene_graph", params={"fields": fields})
+    assert response.status_code == 200
+    page = api.main.SceneGraphPage.parse_obj(response.json())
+    assert len(page.objects) == 5
+
+
+def test_page_objects_require_only_the_name(api):
+    schemas = api.main.app.openapi()["components"]["schemas"]
+    assert schemas["BoundedObject"]["required"] == ["name"]
+
+
+@pytest.mark.parametrize(
+    "sort, key",
+    [("name", ["cube"]), ("name", [1, "Cube"]), ("location.x", ["0", "a", "A"])],
+)
+def test_tampered_cursors_are_rejected(api, sort, key):
+    cursor = base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+    response = TestClient(api.main.app).get(
+        "/scene_graph", params={"sort": sort, "limit": 1, "cursor": cursor}
+    )
+    assert response.status_code == 400
+
+
+def test_moving_a_parent_updates_its_children_in_the_spatial_index(api, monkeypatch):
+    import bpy
+
+    client = TestClient(api.main.app)
+    point = {"x": 100, "y": 100, "z": 100}
+    assert client.get("/spatial/nearest", params=point).status_code == 200
+    parent, child = bpy.data.objects["Cube"], bpy.data.objects["Cube.001"]
+    monkeypatch.setattr(
+        type(parent),
+        "children_recursive",
+        property(lambda obj: [child] if obj is parent else []),
+    )
+    # Blender moves the child along with its parent.
+    child.location = (100, 100, 100)
+    api.main.mark_scene_changed(parent.name)
+
+    response = client.get("/spatial/nearest", params=point)
+    assert response.json()["objects"][0]["name"] == "Cube.001"
+
+
+def test_adding_the_viewer_node_changes_the_scene(api):
+    import bpy
+
+    scene, main = bpy.context.scene, api.main
+    scene.use_nodes = False
+    scene.node_tree.nodes.clear()
+    version = main.scene_cache.version
+    main.ensure_viewer_node()
+    assert main.scene_cache.version == version + 1
+    main.ensure_viewer_node()
+    assert main.scene_cache.version == version + 1
@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.blender_api import BlenderAPI
+from custom_spatial import SpatialIndex
+
+
+@pytest.fixture(scope="module")
+def client():
+    api = BlenderAPI()
+    api.reset()
+    api.populate(3)
+    return TestClient(api.main.app)
+
+
+def test_boxes_far_larger_than_the_grid_are_clamped_to_it():
+    index = SpatialIndex()
+    index.update("Cube", ((-1.0, -1.0, -1.0), (1.0, 1.0, 1.0)))
+    assert index.query_box(((-1e300,) * 3, (1e300,) * 3)) == ["Cube"]
+    assert index.query_radius((0.0, 0.0, 0.0), 1e300) == [("Cube", 0.0)]
+    assert index.query_box(((10.0,) * 3, (20.0,) * 3)) == []
+
+
+@pytest.mark.parametrize(
+    "path, params",
+    [
+        ("/spatial/radius", {"radius": "inf", "x": 0, "y": 0, "z": 0}),
+        ("/spatial/nearest", {"x": "nan", "y": 0, "z": 0}),
+        (
+            "/spatial/box",
+            dict(min_x="-inf", min_y=0, min_z=0, max_x=1, max_y=1, max_z=1),
+        ),
+    ],
+)
+def test_non_finite_coordinates_are_rejected(client, path, params):
+    assert client.get(path, params=params).status_code == 400
@@ -0,0 +1,37 @@
+import pytest
+
+from benchmarks.blender_api import BlenderAPI
+from custom_executor import resolve_step
+from custom_spec import reduce_openapi_spec
+
+
+@pytest.fixture(scope="module")
+def endpoints():
+    return reduce_openapi_spec(BlenderAPI().spec).endpoints
+
+
+def get_parameters(endpoints, endpoint):
+    docs = next(docs for name, _, docs in endpoints if name == endpoint)
+    return {parameter["name"]: parameter for parameter in docs["parameters"]}
+
+
+@pytest.mark.parametrize(
+    "endpoint, names",
+    [
+        ("GET /scene_graph", ["type", "name", "fields", "sort", "limit", "cursor"]),
+        ("GET /spatial/nearest", ["name", "x", "y", "z", "k"]),
+        ("GET /spatial/radius", ["radius", "name", "x", "y", "z"]),
+        ("GET /spatial/box", ["min_x", "max_z", "contained"]),
+        ("GET /spatial/overlaps", ["name"]),
+    ],
+)
+def test_reduced_spec_keeps_optional_query_parameters(endpoints, endpoint, names):
+    parameters = get_parameters(endpoints, endpoint)
+    assert set(names) <= parameters.keys()
+
+
+def test_optional_parameters_are_neither_required_nor_guessed(endpoints):
+    step = resolve_step("GET /spatial/nearest?name=Cube&k=2", endpoints)
+    assert step.resolved and step.params == {"name": "Cube", "k": "2"}
+    step = resolve_step("GET /scene_graph to list the objects", endpoints)
+    assert step.resolved and step.params == {}
@@ -0,0 +1,24 @@
+import custom_tracing
+from custom_tracing import JSONLExporter, Tracer, get_file_exporters
+
+
+def test_no_file_without_trace_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv(custom_tracing.TRACE_DIR_VARIABLE, raising=False)
+    monkeypatch.chdir(tmp_path)
+    assert get_file_exporters("main") == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spans_rotate_at_max_bytes(monkeypatch, tmp_path):
+    monkeypatch.setenv(custom_tracing.TRACE_DIR_VARIABLE, str(tmp_path))
+    (exporter,) = get_file_exporters("main")
+    assert not exporter.path.exists()
+    tracer = Tracer(
+        "main", exporters=[JSONLExporter(exporter.path, max_bytes=2000, backups=2)]
+    )
+    for _ in range(50):
+        with tracer.span("bpy", "add_cube"):
+            pass
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ["traces-main.jsonl", "traces-main.jsonl.1", "traces-main.jsonl.2"]
+    assert all(path.stat().st_size <= 2000 for path in tmp_path.iterdir())